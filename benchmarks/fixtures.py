@@ -0,0 +1,217 @@
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+import uuid
+from http.server import SimpleHTTPRequestHandler, BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模擬 Twitch 來源的位元率與 2 秒一個關鍵影格；只做 stream copy，解析度不影響結果，用低解析度加快產生
+VIDEO_BITRATE = "6M"
+FRAME_RATE = 30
+KEYFRAME_INTERVAL = 2 * FRAME_RATE
+
+
+def generate_media(output_dir, minutes, ffmpeg="ffmpeg"):
+    """
+    以 ffmpeg 測試訊號產生合成影片：先編一段 60 秒的片段，再以 stream copy 重複接成指定長度
+
+    :param minutes: 影片長度（分鐘）
+    :return: {"mp4": 路徑, "ts": 路徑}，已存在時直接沿用
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    clip = os.path.join(output_dir, "clip_60s.mp4")
+    outputs = {
+        "mp4": os.path.join(output_dir, f"synthetic_{minutes}m.mp4"),
+        "ts": os.path.join(output_dir, f"synthetic_{minutes}m.ts"),
+    }
+    if all(os.path.exists(path) for path in outputs.values()):
+        return outputs
+
+    if not os.path.exists(clip):
+        _run([
+            ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate={FRAME_RATE}",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+            "-t", "60",
+            "-c:v", "libx264", "-preset", "ultrafast",
+            "-b:v", VIDEO_BITRATE, "-maxrate", VIDEO_BITRATE, "-minrate", VIDEO_BITRATE, "-bufsize", "12M",
+            "-x264-params", f"nal-hrd=cbr:keyint={KEYFRAME_INTERVAL}:min-keyint={KEYFRAME_INTERVAL}",
+            "-c:a", "aac", "-b:a", "160k",
+            clip,
+        ])
+
+    loops = max(0, minutes - 1)
+    for fmt, path in outputs.items():
+        if os.path.exists(path):
+            continue
+        extra = ["-bsf:v", "h264_mp4toannexb", "-f", "mpegts"] if fmt == "ts" else ["-f", "mp4"]
+        _run([
+            ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+            "-stream_loop", str(loops), "-i", clip,
+            "-c", "copy", *extra, path,
+        ])
+    return outputs
+
+
+def _run(cmd):
+    process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{cmd[0]} failed: {process.stderr.strip()}")
+
+
+FAKE_STREAMLINK = '''#!{python}
+"""假的 streamlink：把 BENCH_STREAM_SOURCE 的內容當成直播輸出到 -o 檔案或 stdout (-O)"""
+import os, sys, time
+args = sys.argv[1:]
+source = os.environ["BENCH_STREAM_SOURCE"]
+rate = float(os.environ.get("BENCH_STREAM_RATE", "0"))
+if "-o" in args:
+    out = open(args[args.index("-o") + 1], "wb")
+else:
+    out = sys.stdout.buffer
+started = time.monotonic()
+sent = 0
+with open(source, "rb") as src:
+    while True:
+        data = src.read(1024 * 1024)
+        if not data:
+            break
+        out.write(data)
+        sent += len(data)
+        if rate:
+            delay = sent / rate - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+out.flush()
+'''
+
+FAKE_YTDLP_MAIN = '''"""假的 yt_dlp 模組：python -m yt_dlp ... -o - 時把 BENCH_YTDLP_SOURCE 輸出到 stdout"""
+import os, shutil, sys
+with open(os.environ["BENCH_YTDLP_SOURCE"], "rb") as src:
+    shutil.copyfileobj(src, sys.stdout.buffer, 1024 * 1024)
+'''
+
+
+def install_fake_tools(tools_dir):
+    """
+    建立假的 streamlink 執行檔與給子行程用的 yt_dlp 模組
+
+    :return: (bin 目錄, 放 yt_dlp 模組的目錄)，分別加在 PATH 與子行程的 PYTHONPATH 前面
+    """
+    bin_dir = os.path.join(tools_dir, "bin")
+    module_dir = os.path.join(tools_dir, "pymodules")
+    os.makedirs(bin_dir, exist_ok=True)
+    os.makedirs(os.path.join(module_dir, "yt_dlp"), exist_ok=True)
+
+    streamlink = os.path.join(bin_dir, "streamlink")
+    with open(streamlink, "w", encoding="utf-8") as file:
+        file.write(FAKE_STREAMLINK.format(python=sys.executable))
+    os.chmod(streamlink, os.stat(streamlink).st_mode | stat.S_IEXEC)
+
+    with open(os.path.join(module_dir, "yt_dlp", "__init__.py"), "w", encoding="utf-8") as file:
+        file.write("")
+    with open(os.path.join(module_dir, "yt_dlp", "__main__.py"), "w", encoding="utf-8") as file:
+        file.write(FAKE_YTDLP_MAIN)
+    return bin_dir, module_dir
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # yt-dlp 探測時會提早中斷連線，不是錯誤
+        pass
+
+
+class _QuietFileHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _FakeYouTubeHandler(BaseHTTPRequestHandler):
+    """YouTube resumable upload 協定的最小實作，收到的內容直接丟棄"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        session_id = uuid.uuid4().hex
+        total = int(self.headers.get("X-Upload-Content-Length") or 0)
+        with self.server.lock:
+            self.server.sessions[session_id] = {"total": total, "received": 0}
+        self.send_response(200)
+        self.send_header("Location", f"http://{self.headers['Host']}/upload/session/{session_id}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        session_id = self.path.rsplit("/", 1)[-1]
+        session = self.server.sessions.get(session_id)
+        length = int(self.headers.get("Content-Length") or 0)
+        remaining = length
+        while remaining:
+            data = self.rfile.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            remaining -= len(data)
+        if session is None:
+            self._reply(404)
+            return
+
+        content_range = self.headers.get("Content-Range", "")
+        if not content_range.startswith("bytes */"):
+            start = int(content_range.split(" ", 1)[1].split("-", 1)[0])
+            if start == session["received"]:
+                session["received"] += length
+                self.server.bytes_received += length
+        if session["received"] >= session["total"]:
+            self._reply(200, {"id": f"fake-{session_id[:11]}", "kind": "youtube#video"})
+        else:
+            self._reply(308, headers={"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else {})
+
+    def _reply(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, name="bench-server", daemon=True)
+    thread.start()
+    return server
+
+
+def start_file_server(root):
+    """在隨機 port 提供 root 目錄的靜態檔案，給 yt-dlp 下載用"""
+    handler = lambda *args, **kwargs: _QuietFileHandler(*args, directory=root, **kwargs)
+    server = _QuietServer(("127.0.0.1", 0), handler)
+    return _serve(server)
+
+
+def start_fake_youtube():
+    """
+    啟動假的 YouTube 上傳伺服器
+
+    :return: server，上傳端點為 f"http://127.0.0.1:{server.server_port}/upload/youtube/v3/videos"
+    """
+    server = _QuietServer(("127.0.0.1", 0), _FakeYouTubeHandler)
+    server.sessions = {}
+    server.lock = threading.Lock()
+    server.bytes_received = 0
+    return _serve(server)
+
+
+def find_ffmpeg():
+    return shutil.which("ffmpeg")
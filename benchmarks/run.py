@@ -0,0 +1,400 @@
+"""
+離線效能測試：以合成影片、假的 streamlink / yt-dlp 與本機假 YouTube 伺服器量測各個階段
+
+    python -m benchmarks.run --minutes 10 --output bench_results.json
+    python -m benchmarks.run --compare bench_results_old.json
+
+每個階段在獨立的子行程執行，分別量測耗時、吞吐量、最高 RSS 與寫入磁碟的 bytes，結果寫成 JSON
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks import fixtures
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FileStream:
+    """把檔案包成 Streamlink stream 的介面，給 record_stream / record_fragmented 使用"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        return open(self.path, "rb")
+
+
+def _part_hours(ctx, parts=3):
+    """讓合成影片剛好切成 parts 段的每段長度（小時）"""
+    return ctx["minutes"] / parts / 60
+
+
+# 每個階段回傳要計時的函式；函式回傳 {"ok": bool, "bytes": 處理的 bytes, ...}
+def stage_probe_cold(ctx):
+    from utils.media_catalog import MediaCatalog
+    from utils.video_processor import VideoProcessor
+
+    def run():
+        duration = VideoProcessor(catalog=MediaCatalog("catalog.db")).get_video_duration(ctx["mp4"])
+        return {"ok": duration is not None, "bytes": 0, "duration": duration}
+    return run
+
+
+def stage_probe_warm(ctx, calls=100):
+    from utils.media_catalog import MediaCatalog
+    from utils.video_processor import VideoProcessor
+
+    VideoProcessor(catalog=MediaCatalog("catalog.db")).get_video_duration(ctx["mp4"])
+
+    def run():
+        # 每次都是新的 catalog，量到的是 SQLite 查詢而不是記憶體 LRU
+        durations = [
+            VideoProcessor(catalog=MediaCatalog("catalog.db")).get_video_duration(ctx["mp4"])
+            for _ in range(calls)
+        ]
+        return {"ok": all(d is not None for d in durations), "bytes": 0, "calls": calls}
+    return run
+
+
+def stage_split_video_by_time(ctx):
+    from utils.video_processor import VideoProcessor
+
+    processor = VideoProcessor()
+
+    def run():
+        parts = processor.split_video_by_time(ctx["mp4"], "out", segment_duration_hours=_part_hours(ctx))
+        return {"ok": bool(parts), "bytes": os.path.getsize(ctx["mp4"]), "parts": len(parts or [])}
+    return run
+
+
+def stage_split_video_parallel(ctx):
+    from utils.video_processor import VideoProcessor
+
+    processor = VideoProcessor()
+
+    def run():
+        parts = processor.split_video_parallel(ctx["mp4"], "out", max_part_hours=_part_hours(ctx))
+        return {"ok": bool(parts), "bytes": os.path.getsize(ctx["mp4"]), "parts": len(parts or [])}
+    return run
+
+
+def stage_remux_video(ctx):
+    from downloader.recorder import StreamRecorder
+
+    recorder = StreamRecorder()
+
+    def run():
+        os.makedirs("out", exist_ok=True)
+        ok = recorder.remux_video(ctx["ts"], os.path.join("out", "remux.mp4"))
+        return {"ok": ok, "bytes": os.path.getsize(ctx["ts"])}
+    return run
+
+
+def stage_remux_to_parts(ctx):
+    from utils.video_processor import VideoProcessor
+
+    processor = VideoProcessor()
+
+    def run():
+        parts = processor.remux_to_parts(ctx["ts"], "out", max_part_hours=_part_hours(ctx))
+        return {"ok": bool(parts), "bytes": os.path.getsize(ctx["ts"]), "parts": len(parts)}
+    return run
+
+
+def stage_download_video(ctx):
+    from downloader.downloader import YTDLPDownloader
+
+    downloader = YTDLPDownloader()
+
+    def run():
+        output_path = os.path.join("out", "download.mp4")
+        ok = downloader.download_video(ctx["mp4_url"], output_path)
+        return {"ok": ok and os.path.exists(output_path), "bytes": os.path.getsize(ctx["mp4"])}
+    return run
+
+
+def stage_download_segmented(ctx):
+    from downloader.downloader import YTDLPDownloader
+
+    downloader = YTDLPDownloader()
+    # 只有 python -m yt_dlp 的子行程會載入假的 yt_dlp 模組
+    os.environ["PYTHONPATH"] = os.pathsep.join([ctx["fake_modules"], os.environ.get("PYTHONPATH", "")])
+    os.environ["BENCH_YTDLP_SOURCE"] = ctx["ts"]
+
+    def run():
+        ok, segments = downloader.download_segmented(
+            ctx["mp4_url"], "out", "download", segment_seconds=int(_part_hours(ctx) * 3600)
+        )
+        return {"ok": ok, "bytes": os.path.getsize(ctx["ts"]), "parts": len(segments)}
+    return run
+
+
+def stage_record_streamlink(ctx):
+    from downloader.recorder import StreamRecorder
+
+    recorder = StreamRecorder()
+    os.environ["BENCH_STREAM_SOURCE"] = ctx["ts"]
+
+    def run():
+        ok = recorder.start_recording("https://www.twitch.tv/benchmark", os.path.join("out", "record.ts"))
+        return {"ok": ok, "bytes": os.path.getsize(ctx["ts"])}
+    return run
+
+
+def stage_record_in_process(ctx):
+    from downloader.recorder import StreamRecorder
+
+    recorder = StreamRecorder()
+
+    def run():
+        ok = recorder.record_stream(FileStream(ctx["ts"]), os.path.join("out", "record.ts"))
+        return {"ok": ok, "bytes": os.path.getsize(ctx["ts"])}
+    return run
+
+
+def stage_record_fragmented(ctx):
+    from downloader.recorder import StreamRecorder
+
+    recorder = StreamRecorder()
+
+    def run():
+        ok = recorder.record_fragmented(
+            "https://www.twitch.tv/benchmark", os.path.join("out", "record.fmp4"), {"best": FileStream(ctx["ts"])}
+        )
+        return {"ok": ok, "bytes": os.path.getsize(ctx["ts"])}
+    return run
+
+
+def stage_upload_video(ctx):
+    from google.oauth2.credentials import Credentials
+    from uploader.progress import LogSink
+    from uploader.resumable import UploadStateStore
+    from uploader.uploader import YouTubeUploader
+
+    # 跳過 OAuth 流程，直接以假的 token 對本機伺服器上傳
+    uploader = YouTubeUploader.__new__(YouTubeUploader)
+    uploader.credentials = Credentials(token="benchmark")
+    uploader.youtube = None
+    uploader.upload_endpoint = ctx["upload_endpoint"]
+    uploader.state_store = UploadStateStore("upload_sessions")
+    uploader.chunk_size = 64 * 1024 * 1024
+    uploader.progress_sink = LogSink()
+
+    def run():
+        video_id = uploader.upload_video(ctx["mp4"], "benchmark", "", "22", [])
+        return {"ok": bool(video_id), "bytes": os.path.getsize(ctx["mp4"])}
+    return run
+
+
+STAGES = {
+    "probe_cold": stage_probe_cold,
+    "probe_warm": stage_probe_warm,
+    "split_video_by_time": stage_split_video_by_time,
+    "split_video_parallel": stage_split_video_parallel,
+    "remux_video": stage_remux_video,
+    "remux_to_parts": stage_remux_to_parts,
+    "download_video": stage_download_video,
+    "download_segmented": stage_download_segmented,
+    "record_streamlink": stage_record_streamlink,
+    "record_in_process": stage_record_in_process,
+    "record_fragmented": stage_record_fragmented,
+    "upload_video": stage_upload_video,
+}
+
+
+def _proc_write_bytes():
+    """本行程實際寫入儲存裝置的 bytes（只有 Linux 提供）"""
+    try:
+        with open("/proc/self/io", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_worker(stage, ctx):
+    """在子行程中執行單一階段並回傳量測結果"""
+    import resource
+
+    from utils.disk_usage import dir_size
+
+    # macOS 的 ru_maxrss 單位是 bytes，Linux 是 KiB
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    os.makedirs("out", exist_ok=True)
+    result = {"stage": stage, "ok": False}
+    try:
+        run = STAGES[stage](ctx)
+        write_before = _proc_write_bytes()
+        started = time.perf_counter()
+        outcome = run()
+        wall = time.perf_counter() - started
+        write_after = _proc_write_bytes()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    processed = outcome.pop("bytes", 0)
+    result.update(outcome)
+    result.update({
+        "wall_seconds": round(wall, 4),
+        "bytes_processed": processed,
+        "throughput_mb_s": round(processed / wall / 1e6, 2) if processed and wall else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_scale / 1e6, 1),
+        "children_peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_scale / 1e6, 1
+        ),
+        # 子行程（ffmpeg、streamlink）的寫入不在 /proc/self/io 內，以輸出目錄的大小計算
+        "disk_bytes_written": dir_size("out"),
+        "process_write_bytes": (
+            write_after - write_before if write_before is not None and write_after is not None else None
+        ),
+    })
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _ffmpeg_version(ffmpeg):
+    try:
+        output = subprocess.run([ffmpeg, "-version"], capture_output=True, text=True).stdout
+        return output.splitlines()[0] if output else None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    """印出與之前結果的差異，耗時增加或吞吐量下降超過 10% 標記為 regression"""
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {stage["stage"]: stage for stage in json.load(file)["stages"]}
+
+    print(f"{'stage':<24}{'wall (s)':>20}{'MB/s':>20}{'peak RSS (MB)':>22}")
+    for stage in results["stages"]:
+        old = baseline.get(stage["stage"])
+        if not old or not stage.get("ok") or not old.get("ok"):
+            continue
+        flag = ""
+        if stage["wall_seconds"] > old["wall_seconds"] * 1.1:
+            flag = "  <-- regression"
+        print(
+            f"{stage['stage']:<24}"
+            f"{old['wall_seconds']:>9.2f} -> {stage['wall_seconds']:<7.2f}"
+            f"{old.get('throughput_mb_s') or 0:>9.1f} -> {stage.get('throughput_mb_s') or 0:<7.1f}"
+            f"{old['peak_rss_mb']:>10.1f} -> {stage['peak_rss_mb']:<8.1f}{flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the media and transfer hot paths")
+    parser.add_argument("--minutes", type=int, default=10, help="Length of the synthetic source video")
+    parser.add_argument("--stages", nargs="+", choices=sorted(STAGES), default=list(STAGES))
+    parser.add_argument("--workdir", default=".bench", help="Where synthetic media and stage outputs are written")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep each stage's output files")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--context", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.context, "r", encoding="utf-8") as file:
+            ctx = json.load(file)
+        print(json.dumps(run_worker(args.worker, ctx)))
+        return
+
+    ffmpeg = fixtures.find_ffmpeg()
+    if not ffmpeg:
+        sys.exit("ffmpeg is required to generate the synthetic media")
+
+    workdir = os.path.abspath(args.workdir)
+    print(f"Generating {args.minutes} minutes of synthetic media in {workdir}...", file=sys.stderr)
+    media = fixtures.generate_media(os.path.join(workdir, "media"), args.minutes, ffmpeg)
+    bin_dir, module_dir = fixtures.install_fake_tools(os.path.join(workdir, "tools"))
+    file_server = fixtures.start_file_server(os.path.dirname(media["mp4"]))
+    youtube = fixtures.start_fake_youtube()
+
+    ctx = {
+        "minutes": args.minutes,
+        "mp4": media["mp4"],
+        "ts": media["ts"],
+        "mp4_url": f"http://127.0.0.1:{file_server.server_port}/{os.path.basename(media['mp4'])}",
+        "upload_endpoint": f"http://127.0.0.1:{youtube.server_port}/upload/youtube/v3/videos",
+        "fake_modules": module_dir,
+    }
+    context_path = os.path.join(workdir, "context.json")
+    with open(context_path, "w", encoding="utf-8") as file:
+        json.dump(ctx, file)
+
+    env = dict(os.environ)
+    env["PATH"] = os.pathsep.join([bin_dir, env.get("PATH", "")])
+    env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT, env.get("PYTHONPATH", "")])
+
+    stages = []
+    for stage in args.stages:
+        stage_dir = os.path.join(workdir, "stages", stage)
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        os.makedirs(stage_dir)
+        print(f"Running {stage}...", file=sys.stderr)
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--worker", stage, "--context", context_path],
+            cwd=stage_dir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        lines = process.stdout.strip().splitlines()
+        try:
+            result = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            result = {"stage": stage, "ok": False, "error": f"worker exited with code {process.returncode}"}
+        stages.append(result)
+        if result.get("ok"):
+            print(
+                f"  {result['wall_seconds']:.2f}s, {result.get('throughput_mb_s') or '-'} MB/s, "
+                f"peak RSS {result['peak_rss_mb']} MB (children {result['children_peak_rss_mb']} MB)",
+                file=sys.stderr,
+            )
+        else:
+            print(f"  failed: {result.get('error', 'stage reported failure')}", file=sys.stderr)
+        if not args.keep:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+    file_server.shutdown()
+    youtube.shutdown()
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ffmpeg": _ffmpeg_version(ffmpeg),
+        "minutes": args.minutes,
+        "source_bytes": {"mp4": os.path.getsize(media["mp4"]), "ts": os.path.getsize(media["ts"])},
+        "stages": stages,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
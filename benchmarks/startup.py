@@ -0,0 +1,217 @@
+"""
+各模式的啟動時間與記憶體：以 main.py 實際執行每個模式，在第一次網路連線或啟動子行程時停下量測
+
+    python -m benchmarks.startup --repeat 5 --output bench_results_startup.json
+
+量到的是從啟動直譯器到模式開始做事之前的成本（載入的模組、建立的物件），不需要網路或任何帳號
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 模式名稱 -> main.py 的參數
+MODES = {
+    "help": ["--help"],
+    "vod": [],
+    "upload": [],
+    "url": ["--url", "https://www.twitch.tv/videos/1234567890"],
+    "monitor": ["--monitor", "benchmark_channel"],
+    "monitor_all": ["--monitor", "--config", "channels.json"],
+}
+# 一次載入所有模組，對照改成延遲載入之前的啟動成本
+ALL_MODULES = [
+    "flows", "supervisor", "detection.detection_flow", "detection.monitor", "detection.eventsub",
+    "downloader.download_flow", "downloader.recorder", "uploader.upload_queue", "uploader.uploader",
+    "utils.video_processor", "utils.discord_notify", "streamlink", "playwright.sync_api",
+]
+HEAVY_PACKAGES = [
+    "playwright", "googleapiclient", "google.auth", "google_auth_oauthlib", "streamlink", "yt_dlp", "bs4", "requests",
+]
+
+
+def _prepare(mode, workdir):
+    """建立模式需要的工作目錄內容：videos 目錄、待上傳的影片、頻道設定檔"""
+    videos = os.path.join(workdir, "downloader", "videos")
+    os.makedirs(videos, exist_ok=True)
+    if mode == "upload":
+        with open(os.path.join(videos, "benchmark.mp4"), "wb") as file:
+            file.write(b"\0" * 1024)
+    if mode == "monitor_all":
+        with open(os.path.join(workdir, "channels.json"), "w", encoding="utf-8") as file:
+            json.dump({"channels": ["benchmark_channel"], "adaptive_polling": False}, file)
+
+
+def _memory():
+    """目前與最高的 RSS（MB）"""
+    import resource
+
+    current = None
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) * 1024 / 1e6
+    except OSError:
+        pass
+    # macOS 的 ru_maxrss 單位是 bytes，Linux 是 KiB
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_scale / 1e6
+    return current, peak
+
+
+def run_worker(mode, started):
+    """
+    在子行程中執行 main.py 的一個模式，第一次網路連線、啟動子行程或結束時輸出量測結果並離開
+    """
+    import atexit
+    import runpy
+    import socket
+
+    stopped = []
+
+    def stop(reason):
+        if stopped:
+            return
+        stopped.append(reason)
+        current, peak = _memory()
+        result = {
+            "mode": mode,
+            "stopped_at": reason,
+            "startup_seconds": round(time.perf_counter() - started, 4),
+            "rss_mb": round(current, 1) if current is not None else None,
+            "peak_rss_mb": round(peak, 1),
+            "modules": len(sys.modules),
+            "heavy_packages": [name for name in HEAVY_PACKAGES if name in sys.modules],
+        }
+        os.write(1, (json.dumps(result) + "\n").encode())
+        os._exit(0)
+
+    def guard_resolve(host, *args, **kwargs):
+        stop(f"network: {host}")
+
+    def guard_connect(sock, address):
+        stop(f"network: {address}")
+
+    def guard_spawn(popen, args, *rest, **kwargs):
+        stop(f"subprocess: {os.path.basename(str(args[0] if isinstance(args, (list, tuple)) else args))}")
+
+    sys.path.insert(0, REPO_ROOT)
+    if mode == "all_modules":
+        import importlib
+
+        # 部分套件載入時會呼叫子行程（例如 ctypes 找 libc），這裡只量載入成本，不攔截
+        for name in ALL_MODULES:
+            importlib.import_module(name)
+        stop("exit")
+
+    socket.getaddrinfo = guard_resolve
+    socket.socket.connect = guard_connect
+    subprocess.Popen._execute_child = guard_spawn
+    atexit.register(stop, "exit")
+
+    sys.argv = [os.path.join(REPO_ROOT, "main.py"), *MODES[mode]]
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+    except SystemExit:
+        pass
+    except Exception as e:
+        stop(f"error: {type(e).__name__}")
+    stop("exit")
+
+
+def measure(mode, repeat, env):
+    runs = []
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix=f"startup-{mode}-")
+        try:
+            _prepare(mode, workdir)
+            started = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-m", "benchmarks.startup", "--worker", mode],
+                cwd=workdir,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+            wall = time.perf_counter() - started
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        lines = process.stdout.strip().splitlines()
+        try:
+            result = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            return {"mode": mode, "ok": False, "error": f"worker exited with code {process.returncode}"}
+        result["wall_seconds"] = round(wall, 4)
+        runs.append(result)
+
+    summary = dict(runs[-1])
+    summary.update({
+        "ok": True,
+        "runs": repeat,
+        "wall_seconds": round(statistics.median(run["wall_seconds"] for run in runs), 4),
+        "startup_seconds": round(statistics.median(run["startup_seconds"] for run in runs), 4),
+        "rss_mb": statistics.median(run["rss_mb"] or 0 for run in runs),
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and memory of each main.py mode")
+    parser.add_argument("--modes", nargs="+", choices=[*MODES, "all_modules"], default=[*MODES, "all_modules"])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per mode; the median is reported")
+    parser.add_argument("--output", default="bench_results_startup.json", help="JSON file for the results")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, time.perf_counter())
+        return
+
+    # 子行程只載入這個檔案，量測不包含其他 benchmark 模組
+    from benchmarks.run import _git_commit
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT, env.get("PYTHONPATH", "")])
+    # 不要讀到使用者的 .env 與憑證
+    env.pop("PLAYLIST", None)
+
+    modes = []
+    print(f"{'mode':<14}{'wall (s)':>10}{'RSS (MB)':>10}{'modules':>9}  stopped at / heavy packages", file=sys.stderr)
+    for mode in args.modes:
+        result = measure(mode, args.repeat, env)
+        modes.append(result)
+        if result["ok"]:
+            print(
+                f"{mode:<14}{result['wall_seconds']:>10.3f}{result['rss_mb']:>10.1f}{result['modules']:>9}  "
+                f"{result['stopped_at']} / {', '.join(result['heavy_packages']) or '-'}",
+                file=sys.stderr,
+            )
+        else:
+            print(f"{mode:<14}failed: {result['error']}", file=sys.stderr)
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "modes": modes,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,18 @@
-from .detector import WebsiteDetector, DetectionResult
-from .detection_flow import DetectionFlow
+import importlib
+
+# 子模組在第一次使用時才載入，只用到其中一種模式時不必載入其他模式的相依套件
+_EXPORTS = {
+    "WebsiteDetector": ".detector",
+    "DetectionResult": ".detector",
+    "DetectionFlow": ".detection_flow",
+}
 
 __all__ = ["WebsiteDetector", "DetectionResult", "DetectionFlow"]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,151 @@
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from detection.twitch_gql import TwitchGQLClient, GQL_ENDPOINT, WEB_CLIENT_ID
+
+VIDEO_ID_PATTERN = re.compile(r"/videos/(\d+)")
+
+ARCHIVE_QUERY = """
+query ArchiveVideos($login: String!, $first: Int!, $after: Cursor) {
+  user(login: $login) {
+    videos(first: $first, after: $after, type: ARCHIVE, sort: TIME) {
+      edges { cursor node { id title createdAt lengthSeconds } }
+      pageInfo { hasNextPage }
+    }
+  }
+}
+"""
+
+
+@dataclass
+class VodInfo:
+    """頻道存檔影片的資訊"""
+
+    id: str
+    title: str
+    url: str
+    created_at: Optional[str] = None
+    duration: Optional[int] = None  # 秒
+
+
+def video_id_from_url(url: str) -> str:
+    """從 Twitch 影片連結取出影片 ID，無法解析時回傳原字串"""
+    match = VIDEO_ID_PATTERN.search(url or "")
+    return match.group(1) if match else (url or "")
+
+
+def is_older(video_id: str, stop_id: str) -> bool:
+    """Twitch 影片 ID 隨時間遞增；兩者都是數字 ID 時，判斷 video_id 是否比 stop_id 舊"""
+    return bool(video_id and stop_id and video_id.isdigit() and stop_id.isdigit() and int(video_id) < int(stop_id))
+
+
+def parse_videos_response(data) -> Tuple[List[VodInfo], Optional[str], bool]:
+    """
+    解析 ArchiveVideos 的 GQL 回應
+
+    Returns:
+        (影片列表, 最後一筆的 cursor, 是否還有下一頁)
+    """
+    user = (data or {}).get("user")
+    if not user or not user.get("videos"):
+        return [], None, False
+
+    videos = user["videos"]
+    vods = []
+    cursor = None
+    for edge in videos.get("edges") or []:
+        node = edge.get("node") or {}
+        cursor = edge.get("cursor") or cursor
+        if not node.get("id"):
+            continue
+        vods.append(
+            VodInfo(
+                id=node["id"],
+                title=(node.get("title") or "").strip(),
+                url=f"https://www.twitch.tv/videos/{node['id']}",
+                created_at=node.get("createdAt"),
+                duration=node.get("lengthSeconds"),
+            )
+        )
+    has_next = bool((videos.get("pageInfo") or {}).get("hasNextPage"))
+    return vods, cursor, has_next
+
+
+class DetectorBackend:
+    """列出頻道存檔影片的後端介面，回傳順序為新到舊"""
+
+    async def list_vods(self, stop_url: str = "") -> List[VodInfo]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class TwitchHTTPBackend(DetectorBackend):
+    def __init__(
+        self,
+        channel: str,
+        endpoint: str = GQL_ENDPOINT,
+        client_id: str = WEB_CLIENT_ID,
+        page_size: int = 30,
+        max_pages: int = 10,
+        client: Optional[TwitchGQLClient] = None,
+    ):
+        """
+        不需要瀏覽器，直接透過 Twitch GQL 列出存檔影片
+
+        :param channel: 頻道 login 名稱
+        :param endpoint: GQL 端點，測試時可指向本機 stub server
+        :param page_size: 每頁筆數
+        :param max_pages: 最多翻頁數
+        """
+        self.channel = channel
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.client = client or TwitchGQLClient(endpoint, client_id)
+
+    async def list_vods(self, stop_url=""):
+        return await asyncio.to_thread(self._list_vods, stop_url)
+
+    def _list_vods(self, stop_url):
+        stop_id = video_id_from_url(stop_url) if stop_url else None
+        vods: List[VodInfo] = []
+        cursor = None
+        for _ in range(self.max_pages):
+            data = self.client.query(
+                ARCHIVE_QUERY,
+                {"login": self.channel, "first": self.page_size, "after": cursor},
+            )
+            page, cursor, has_next = parse_videos_response(data)
+            vods.extend(page)
+            # 找到上次處理到的影片（或已經比它舊，代表它已過期被刪除）就不必再翻頁
+            if stop_id and any(vod.id == stop_id or is_older(vod.id, stop_id) for vod in page):
+                break
+            if not has_next or not cursor:
+                break
+        return vods
+
+    async def aclose(self):
+        self.client.close()
+
+
+class PlaywrightBackend(DetectorBackend):
+    def __init__(self, detector):
+        """
+        以 Playwright 讀取影片列表頁面，作為 HTTP 後端失敗時的備援
+
+        :param detector: WebsiteDetector 實例
+        """
+        self.detector = detector
+
+    async def list_vods(self, stop_url=""):
+        cards = await self.detector.scan_cards(stop_url=stop_url)
+        return [
+            VodInfo(id=video_id_from_url(url), title=title, url=url)
+            for title, url in cards
+        ]
+
+    async def aclose(self):
+        await self.detector.aclose()
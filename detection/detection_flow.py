@@ -1,17 +1,42 @@
 from detection import WebsiteDetector
+from detection.backends import (
+    PlaywrightBackend,
+    TwitchHTTPBackend,
+    is_older,
+    video_id_from_url,
+)
 from utils import setup_logger
 import asyncio
 import json
+import re
 
 logger = setup_logger("log")
 
 
 class DetectionFlow(WebsiteDetector):
-    def __init__(self, url, item_selector, headless=True, wait_time=600):
+    def __init__(
+        self, url, item_selector, headless=True, wait_time=60, backend="http", latest_url=None, max_unmarked=3
+    ):
+        """
+        :param latest_url: 上次處理到的影片，作為停止點
+        :param max_unmarked: 停止點不在列表中、也無法用影片 ID 比較新舊時，最多處理的最新影片數
+        """
         super().__init__(url, item_selector, headless, wait_time)
-        self.latest_data = self.load_latest_data()
+        self.max_unmarked = max_unmarked
+        # 由 JobStore 提供停止點；沒有時沿用 latest.json
+        self.latest_data = latest_url or self.load_latest_data()
         self.item_number = 0
         self.all_items = []
+        self.vods = []
+        # Playwright 只在 HTTP 後端失敗時才啟動
+        self.fallback = PlaywrightBackend(self)
+        if backend == "http":
+            match = re.search(r"twitch\.tv/([^/?#]+)", url)
+            self.backend = TwitchHTTPBackend(match.group(1)) if match else self.fallback
+        elif backend == "playwright":
+            self.backend = self.fallback
+        else:
+            self.backend = backend
 
     def load_latest_data(self):
         try:
@@ -27,29 +52,49 @@ class DetectionFlow(WebsiteDetector):
             return ""
 
     async def detect_items(self):
-        while True:
-            logger.info(f"Detecting item number: {self.item_number}")
-            await self.detect_once()
-            detected_item = self.last_items
-            
-            # Extract URL from detected_item which is {Title: URL}
-            detected_url = next(iter(detected_item.values())) if detected_item else ""
+        try:
+            vods = await self.backend.list_vods(stop_url=self.latest_data)
+        except Exception as e:
+            if self.backend is self.fallback:
+                raise
+            logger.warning(f"Detection backend failed ({e}), falling back to Playwright")
+            vods = await self.fallback.list_vods(stop_url=self.latest_data)
+        logger.info(f"Listed {len(vods)} archive videos")
 
-            if detected_url == self.latest_data and self.item_number == 0:
+        latest_id = video_id_from_url(self.latest_data) if self.latest_data else None
+        if latest_id and not any(vod.id == latest_id for vod in vods):
+            vods = self._without_marker(vods, latest_id)
+        for vod in vods:
+            if vod.id == latest_id and self.item_number == 0:
                 logger.info("No new items detected, ending detection")
-                break
+                return
 
-            elif detected_url == self.latest_data:
+            elif vod.id == latest_id:
                 logger.info("Update to latest!")
-                break
-
-            logger.info(f"New item detected: {detected_item}")
-            self.all_items.append(detected_item)
+                return
 
+            logger.info(f"New item detected: {vod.title} ({vod.url})")
+            self.vods.append(vod)
+            self.all_items.append({vod.title: vod.url})
             self.item_number += 1
-            self.item_selector = (
-                f"//*[@data-a-target='video-tower-card-{self.item_number}']"
+
+    def _without_marker(self, vods, latest_id):
+        """
+        停止點的影片已過期被刪除時，不能把整個存檔都當成新影片：
+        只保留 ID 比停止點新的影片；ID 無法比較時只保留最新的 max_unmarked 支
+        """
+        if latest_id.isdigit() and all(vod.id.isdigit() for vod in vods):
+            newer = [vod for vod in vods if not is_older(vod.id, latest_id)]
+            logger.warning(
+                f"Stop marker {self.latest_data} not found in {len(vods)} videos (probably expired), "
+                f"keeping the {len(newer)} newer than it"
             )
+            return newer
+        logger.warning(
+            f"Stop marker {self.latest_data} not found in {len(vods)} videos, "
+            f"keeping only the newest {self.max_unmarked}"
+        )
+        return vods[:self.max_unmarked]
 
     def update_latest(self, url):
         if url:
@@ -63,13 +108,18 @@ class DetectionFlow(WebsiteDetector):
             logger.warning("No url provided to update latest.json")
 
     async def run(self):
-        await self.detect_items()
-        self.close()
+        try:
+            await self.detect_items()
+        finally:
+            if self.backend is not self.fallback:
+                await self.backend.aclose()
+            await self.aclose()
         return {k: v for d in self.all_items for k, v in d.items()}
 
 
 if __name__ == "__main__":
     flow = DetectionFlow(
         url="https://www.twitch.tv/shxtou/videos?filter=archives&sort=time",
+        item_selector="//*[@data-a-target='video-tower-card-0']",
     )
     asyncio.run(flow.run())
@@ -1,9 +1,10 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 import json
 from dataclasses import dataclass
 import asyncio
-from playwright.async_api import async_playwright
+
+from detection.backends import is_older, video_id_from_url
 
 
 @dataclass
@@ -17,6 +18,16 @@ class DetectionResult:
     error: Optional[str] = None
 
 
+CARD_SELECTOR = '[data-a-target^="video-tower-card-"]'
+# 一次取出所有卡片的標題與連結，避免逐一 round-trip
+EXTRACT_CARDS_JS = """
+cards => cards.map(card => {
+    const a = card.querySelector('a');
+    return [card.innerText.trim().split('\\n')[0], a ? a.getAttribute('href') : ''];
+})
+"""
+
+
 class WebsiteDetector:
     def __init__(
         self, url: str, item_selector: str, headless: bool = True, wait_time: int = 10
@@ -26,6 +37,38 @@ class WebsiteDetector:
         self.wait_time = wait_time
         self.last_items: Dict[str, str] = {}
         self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._page = None
+
+    async def open(self):
+        """啟動瀏覽器並載入頁面，整個檢測過程共用同一個 page"""
+        if self._page is not None:
+            return self._page
+        # 延遲載入 Playwright，只使用 HTTP 後端時不需要安裝瀏覽器
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._page = await self._browser.new_page()
+        # 不載入圖片、影音與字型，降低記憶體與流量
+        await self._page.route(
+            "**/*",
+            lambda route: route.abort()
+            if route.request.resource_type in ("image", "media", "font")
+            else route.continue_(),
+        )
+        await self._page.goto(self.url)
+        return self._page
+
+    async def aclose(self):
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._playwright = None
+        self._browser = None
+        self._page = None
 
     async def detect_once(self) -> bool:
         """
@@ -42,23 +85,81 @@ class WebsiteDetector:
             return False
 
     async def _detect_async(self) -> Dict[str, str]:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            page = await browser.new_page()
-            await page.goto(self.url)
-            await page.wait_for_selector(self.item_selector, timeout=self.wait_time * 1000)
-            elements = await page.query_selector_all(self.item_selector)
-            items = {}
-            for element in elements:
-                text = await element.inner_text()
-                a_tag = await element.query_selector('a')
-                href = await a_tag.get_attribute('href') if a_tag else ""
-                # 自動補全 Twitch 相對路徑
-                if href and not href.startswith("http"):
-                    href = f"https://www.twitch.tv{href}"
-                items[text.strip().split("\n")[0]] = href.replace(" ", "") if href else ""
-            await browser.close()
-            return items
+        reuse = self._page is not None
+        page = await self.open()
+        if reuse:
+            await page.reload()
+        await page.wait_for_selector(self.item_selector, timeout=self.wait_time * 1000)
+        elements = await page.query_selector_all(self.item_selector)
+        items = {}
+        for element in elements:
+            text = await element.inner_text()
+            a_tag = await element.query_selector('a')
+            href = await a_tag.get_attribute('href') if a_tag else ""
+            items[text.strip().split("\n")[0]] = self._normalize_href(href)
+        return items
+
+    @staticmethod
+    def _normalize_href(href: str) -> str:
+        # 自動補全 Twitch 相對路徑
+        if href and not href.startswith("http"):
+            href = f"https://www.twitch.tv{href}"
+        return href.replace(" ", "") if href else ""
+
+    async def scan_cards(
+        self,
+        stop_url: str = "",
+        card_selector: str = CARD_SELECTOR,
+        max_scrolls: int = 20,
+        scroll_timeout: int = 10,
+    ) -> List[Tuple[str, str]]:
+        """
+        一次讀取頁面上所有卡片，必要時捲動載入更多，直到找到 stop_url 或比它舊的影片
+
+        Args:
+            stop_url: 找到此連結即停止捲動（通常是 latest.json 的紀錄）
+            card_selector: 卡片的 CSS selector
+            max_scrolls: 最多捲動次數
+            scroll_timeout: 捲動後等待新卡片載入的秒數，逾時代表已到列表底部
+
+        Returns:
+            List[Tuple[str, str]]: 依頁面順序（新到舊）的 (標題, 連結)
+        """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        page = await self.open()
+        await page.wait_for_selector(card_selector, timeout=self.wait_time * 1000)
+
+        cards: List[Tuple[str, str]] = []
+        for _ in range(max_scrolls + 1):
+            raw = await page.eval_on_selector_all(card_selector, EXTRACT_CARDS_JS)
+            seen = set()
+            cards = []
+            for title, href in raw:
+                url = self._normalize_href(href)
+                if url and url not in seen:
+                    seen.add(url)
+                    cards.append((title, url))
+
+            if stop_url and stop_url in seen:
+                break
+            # 停止點的影片已過期時，看到比它舊的影片就不必再捲動
+            if stop_url and any(is_older(video_id_from_url(url), video_id_from_url(stop_url)) for url in seen):
+                break
+
+            # 捲到最後一張卡片，等待更多卡片載入
+            count = len(raw)
+            await page.locator(card_selector).last.scroll_into_view_if_needed()
+            try:
+                await page.wait_for_function(
+                    "([sel, n]) => document.querySelectorAll(sel).length > n",
+                    arg=[card_selector, count],
+                    timeout=scroll_timeout * 1000,
+                )
+            except PlaywrightTimeoutError:
+                break
+
+        return cards
 
     async def monitor(self, interval_seconds: int = 60) -> None:
         """
@@ -78,13 +179,13 @@ class WebsiteDetector:
             await asyncio.sleep(interval_seconds)
 
     def close(self):
-        pass  # Playwright 自動關閉
+        pass  # 瀏覽器由 aclose() 關閉
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        self.close()
+        await self.aclose()
 
 
 if __name__ == "__main__":
@@ -97,10 +198,9 @@ if __name__ == "__main__":
             wait_time=15,
         )
         try:
-            await detector.detect_once()
-            print(f"Current items: {detector.last_items}")
+            print(f"Current items: {await detector.scan_cards()}")
         finally:
-            detector.close()
+            await detector.aclose()
 
     # 使用 asyncio 運行異步主函數
     asyncio.run(main())
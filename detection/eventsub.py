@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Set
+
+import requests
+
+from utils import setup_logger
+
+logger = setup_logger("log")
+
+EVENTSUB_WS_URL = "wss://eventsub.wss.twitch.tv/ws"
+HELIX_URL = "https://api.twitch.tv/helix"
+# EventSub 連線正常時，輪詢只作為備援
+FALLBACK_POLL_INTERVAL = 300
+# stream.online 可能比 HLS 播放清單早送達，收到通知後在這段時間內重試 Streamlink 解析（秒）
+PUSH_RETRY_INTERVAL = 3
+PUSH_RETRY_WINDOW = 60
+
+
+class EventSubError(Exception):
+    """訂閱失敗或連線在未預期的狀態下中斷"""
+
+
+class EventSubListener:
+    def __init__(
+        self,
+        channels: Iterable[str],
+        on_online: Callable[[str, dict], None],
+        client_id: Optional[str] = None,
+        access_token: Optional[str] = None,
+        ws_url: str = EVENTSUB_WS_URL,
+        api_url: Optional[str] = HELIX_URL,
+        max_backoff: float = 60,
+        timeout: float = 10,
+    ):
+        """
+        透過 EventSub WebSocket 訂閱 stream.online，開台時立即通知，不需要輪詢
+
+        :param channels: 要訂閱的頻道 login
+        :param on_online: 收到開台事件時在監聽執行緒呼叫 on_online(channel, event)
+        :param client_id: Twitch 應用程式的 Client-ID，預設讀取環境變數 TWITCH_CLIENT_ID
+        :param access_token: 使用者存取權杖（WebSocket 訂閱只接受 user token），預設讀取 TWITCH_ACCESS_TOKEN
+        :param ws_url: WebSocket 端點，測試時可指向本機重播錄好事件的伺服器
+        :param api_url: Helix 端點，None 表示不建立訂閱（例如重播伺服器會自行送出事件）
+        :param max_backoff: 重新連線的最長等待秒數
+        """
+        self.channels = [channel.lower() for channel in channels]
+        self.on_online = on_online
+        self.client_id = client_id or os.getenv("TWITCH_CLIENT_ID")
+        self.access_token = access_token or os.getenv("TWITCH_ACCESS_TOKEN")
+        self.ws_url = ws_url
+        self.api_url = api_url
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.connected = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ws = None
+        self._user_ids: Dict[str, str] = {}
+        # 已建立訂閱、沒有被撤銷的頻道；只有這些頻道可以放慢輪詢
+        self._subscribed: Set[str] = set()
+        # EventSub 至少送達一次，用 message_id 去除重複
+        self._seen = deque(maxlen=500)
+
+    @property
+    def healthy(self) -> bool:
+        """已連線且完成訂閱"""
+        return self.connected.is_set()
+
+    def is_healthy(self, channel) -> bool:
+        """頻道的開台通知可以送達，可以放慢這個頻道的輪詢"""
+        return self.healthy and channel.lower() in self._subscribed
+
+    def start(self):
+        if self.api_url and not (self.client_id and self.access_token):
+            raise EventSubError("TWITCH_CLIENT_ID and TWITCH_ACCESS_TOKEN are required for EventSub")
+        try:
+            import websocket  # noqa: F401
+        except ImportError as e:
+            raise EventSubError("websocket-client is not installed") from e
+        self._thread = threading.Thread(target=self._run, name="eventsub", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.session.close()
+
+    def _run(self):
+        url = self.ws_url
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                # session_reconnect 會回傳新的網址，沿用原本的訂閱
+                url = self._session(url)
+                attempt = 0
+            except Exception as e:
+                self.connected.clear()
+                if self._stop.is_set():
+                    break
+                attempt += 1
+                delay = min(self.max_backoff, 2 ** (attempt - 1))
+                logger.warning(f"EventSub connection lost ({e}), reconnecting in {delay}s")
+                self._stop.wait(delay)
+                url = self.ws_url
+
+    def _session(self, url):
+        """
+        處理一個 WebSocket 連線直到斷線
+
+        :return: 收到 session_reconnect 時回傳新的網址
+        """
+        import websocket
+
+        ws = websocket.create_connection(url, timeout=self.timeout)
+        self._ws = ws
+        try:
+            keepalive = self.timeout
+            while not self._stop.is_set():
+                # 超過 keepalive 時間沒有任何訊息代表連線已失效
+                ws.settimeout(keepalive + 5)
+                try:
+                    raw = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    raise EventSubError("no keepalive received")
+                if not raw:
+                    raise EventSubError("connection closed by server")
+
+                message = json.loads(raw)
+                metadata = message.get("metadata", {})
+                payload = message.get("payload", {})
+                message_type = metadata.get("message_type")
+
+                if message_type == "session_welcome":
+                    session = payload.get("session", {})
+                    keepalive = session.get("keepalive_timeout_seconds") or keepalive
+                    # 重新連線到 reconnect_url 時原本的訂閱會沿用
+                    if url == self.ws_url:
+                        self._subscribe(session["id"])
+                    self.connected.set()
+                    logger.info(f"EventSub session {session.get('id')} ready for {len(self.channels)} channels")
+                elif message_type == "session_reconnect":
+                    logger.info("EventSub server requested a reconnect")
+                    return payload.get("session", {}).get("reconnect_url") or self.ws_url
+                elif message_type == "notification":
+                    self._dispatch(metadata, payload)
+                elif message_type == "revocation":
+                    subscription = payload.get("subscription", {})
+                    user_id = subscription.get("condition", {}).get("broadcaster_user_id")
+                    self._subscribed -= {channel for channel, id_ in self._user_ids.items() if id_ == user_id}
+                    logger.warning(
+                        f"EventSub subscription revoked: {subscription.get('type')} "
+                        f"{subscription.get('condition')} ({subscription.get('status')})"
+                    )
+            return self.ws_url
+        finally:
+            self.connected.clear()
+            self._ws = None
+            ws.close()
+
+    def _dispatch(self, metadata, payload):
+        message_id = metadata.get("message_id")
+        if message_id in self._seen:
+            return
+        self._seen.append(message_id)
+        if metadata.get("subscription_type") != "stream.online":
+            return
+
+        event = payload.get("event", {})
+        channel = (event.get("broadcaster_user_login") or "").lower()
+        logger.info(f"EventSub: {channel} went live at {event.get('started_at')}")
+        try:
+            self.on_online(channel, event)
+        except Exception as e:
+            logger.error(f"EventSub handler failed for {channel}: {e}")
+
+    def _headers(self):
+        return {"Client-Id": self.client_id, "Authorization": f"Bearer {self.access_token}"}
+
+    def _resolve_user_ids(self):
+        """頻道 login 轉成 broadcaster_user_id，每次最多 100 個"""
+        missing = [channel for channel in self.channels if channel not in self._user_ids]
+        for start in range(0, len(missing), 100):
+            params = [("login", channel) for channel in missing[start:start + 100]]
+            response = self.session.get(
+                f"{self.api_url}/users", params=params, headers=self._headers(), timeout=self.timeout
+            )
+            response.raise_for_status()
+            for user in response.json().get("data", []):
+                self._user_ids[user["login"].lower()] = user["id"]
+        for channel in self.channels:
+            if channel not in self._user_ids:
+                logger.warning(f"EventSub: unknown channel {channel}, relying on polling")
+
+    def _subscribe(self, session_id):
+        """新的 session 必須在 keepalive 時間內建立訂閱，否則會被伺服器關閉"""
+        if not self.api_url:
+            # 重播伺服器會自行送出所有頻道的事件
+            self._subscribed = set(self.channels)
+            return
+        self._subscribed = set()
+        self._resolve_user_ids()
+        for channel in self.channels:
+            user_id = self._user_ids.get(channel)
+            if not user_id:
+                continue
+            response = self.session.post(
+                f"{self.api_url}/eventsub/subscriptions",
+                json={
+                    "type": "stream.online",
+                    "version": "1",
+                    "condition": {"broadcaster_user_id": user_id},
+                    "transport": {"method": "websocket", "session_id": session_id},
+                },
+                headers=self._headers(),
+                timeout=self.timeout,
+            )
+            if response.status_code >= 400 and response.status_code != 409:
+                raise EventSubError(
+                    f"Failed to subscribe to stream.online for {channel}: "
+                    f"HTTP {response.status_code} {response.text[:200]}"
+                )
+            self._subscribed.add(channel)
@@ -1,15 +1,48 @@
+import threading
+
 from utils import setup_logger
-from streamlink import Streamlink
+from detection.probe import TwitchGQLProbe
+from utils.streamlink_options import STREAMLINK_SESSION_OPTIONS
+
 
 class StreamMonitor:
-    def __init__(self):
+    def __init__(self, probe=None):
         self.logger = setup_logger("Monitor", log_file="monitor.log")
-        self.session = Streamlink()
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Lightweight batched probe; Streamlink is only used once a channel is live
+        self.probe = probe or TwitchGQLProbe()
+
+    @property
+    def session(self):
+        """
+        The Streamlink session, created on first use so a monitor whose channels
+        are offline never imports Streamlink and its plugins.
+        """
+        with self._session_lock:
+            if self._session is None:
+                from streamlink import Streamlink
+
+                # The resolved streams are handed to StreamRecorder.record_stream, so use recording options
+                self._session = Streamlink(options=STREAMLINK_SESSION_OPTIONS)
+            return self._session
+
+    def probe_channels(self, channel_names):
+        """
+        Checks many channels with one batched probe request.
+        Returns a dict of channel name -> ProbeResult.
+        """
+        results = self.probe.check_channels(channel_names)
+        for name, result in results.items():
+            if result.error:
+                self.logger.warning(f"Probe failed for {name}: {result.error}")
+        return results
 
     def check_live_status(self, channel_url):
         """
         Checks if a Twitch channel is live.
-        Returns the stream object if live, None otherwise.
+        Returns the dict of resolved streams if live, None otherwise;
+        pass streams["best"] to StreamRecorder.record_stream to start recording.
         """
         try:
             streams = self.session.streams(channel_url)
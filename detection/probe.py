@@ -0,0 +1,122 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from detection.twitch_gql import TwitchGQLClient, GQL_ENDPOINT, WEB_CLIENT_ID
+
+LOGIN_PATTERN = re.compile(r"^[A-Za-z0-9_]{1,25}$")
+
+
+@dataclass
+class ProbeResult:
+    """單一頻道的直播狀態"""
+
+    channel: str
+    live: bool
+    stream_id: Optional[str] = None
+    started_at: Optional[str] = None
+    error: Optional[str] = None
+
+
+class LiveProbe:
+    """直播狀態探測後端的介面"""
+
+    def check_channels(self, channels: Iterable[str]) -> Dict[str, ProbeResult]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TwitchGQLProbe(LiveProbe):
+    def __init__(self, endpoint=GQL_ENDPOINT, client_id=WEB_CLIENT_ID, batch_size=35, timeout=10, client=None):
+        """
+        以一個 GQL 請求批次查詢多個頻道是否開台
+
+        :param endpoint: GQL 端點，測試時可指向本機 stub server
+        :param batch_size: 每個請求最多查詢的頻道數
+        """
+        self.client = client or TwitchGQLClient(endpoint, client_id, timeout)
+        self.batch_size = batch_size
+
+    def check_channels(self, channels):
+        results = {}
+        valid = []
+        for channel in channels:
+            if LOGIN_PATTERN.match(channel):
+                valid.append(channel)
+            else:
+                results[channel] = ProbeResult(channel, False, error="invalid channel login")
+
+        for start in range(0, len(valid), self.batch_size):
+            batch = valid[start:start + self.batch_size]
+            try:
+                results.update(self._check_batch(batch))
+            except Exception as e:
+                for channel in batch:
+                    results[channel] = ProbeResult(channel, False, error=str(e))
+        return results
+
+    def _check_batch(self, batch):
+        # 每個頻道用一個 alias，整批只需一個 HTTP 請求
+        params = ", ".join(f"$c{i}: String!" for i in range(len(batch)))
+        fields = " ".join(
+            f"c{i}: user(login: $c{i}) {{ login stream {{ id createdAt type }} }}"
+            for i in range(len(batch))
+        )
+        data = self.client.query(
+            f"query LiveStatus({params}) {{ {fields} }}",
+            {f"c{i}": channel for i, channel in enumerate(batch)},
+        )
+
+        results = {}
+        for i, channel in enumerate(batch):
+            user = data.get(f"c{i}")
+            if user is None:
+                # 帳號不存在（或已停權）視為未開台
+                results[channel] = ProbeResult(channel, False)
+                continue
+            stream = user.get("stream")
+            if stream:
+                results[channel] = ProbeResult(
+                    channel, True, stream_id=stream.get("id"), started_at=stream.get("createdAt")
+                )
+            else:
+                results[channel] = ProbeResult(channel, False)
+        return results
+
+    def close(self):
+        self.client.close()
+
+
+class StreamlinkProbe(LiveProbe):
+    def __init__(self, session=None):
+        """以 Streamlink 逐一解析頻道（原本的檢查方式，較重）"""
+        if session is None:
+            from streamlink import Streamlink
+
+            session = Streamlink()
+        self.session = session
+
+    def check_channels(self, channels):
+        results = {}
+        for channel in channels:
+            try:
+                streams = self.session.streams(f"https://www.twitch.tv/{channel}")
+                results[channel] = ProbeResult(channel, bool(streams))
+            except Exception as e:
+                results[channel] = ProbeResult(channel, False, error=str(e))
+        return results
+
+
+def create_probe(kind="gql", **kwargs):
+    """
+    依名稱建立探測後端
+
+    :param kind: "gql" 或 "streamlink"
+    """
+    if kind == "gql":
+        return TwitchGQLProbe(**kwargs)
+    if kind == "streamlink":
+        return StreamlinkProbe(**kwargs)
+    raise ValueError(f"Unknown probe backend: {kind}")
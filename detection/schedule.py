@@ -0,0 +1,169 @@
+import json
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils import setup_logger
+
+logger = setup_logger("log")
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+def _minute_of_week(moment: datetime) -> int:
+    return moment.weekday() * 24 * 60 + moment.hour * 60 + moment.minute
+
+
+def _circular_distance(a, b, period):
+    distance = abs(a - b) % period
+    return min(distance, period - distance)
+
+
+class AdaptivePollScheduler:
+    def __init__(
+        self,
+        history_path="schedule_history.json",
+        base_interval=30,
+        min_interval=10,
+        max_interval=600,
+        window_minutes=30,
+        jitter=0.1,
+        max_history=100,
+    ):
+        """
+        依頻道過去的開台時間調整檢查間隔：預期開台前後頻繁檢查，其餘時間逐步放慢
+
+        :param history_path: 開台時間紀錄檔（JSON）
+        :param base_interval: 沒有足夠紀錄時的檢查間隔（秒）
+        :param min_interval: 預期開台時段內的檢查間隔（秒）
+        :param max_interval: 離線或錯誤時退避的上限（秒）
+        :param window_minutes: 過去開台時間前後多少分鐘視為預期開台時段
+        :param jitter: 間隔的隨機比例，避免多個頻道同時檢查
+        :param max_history: 每個頻道保留的開台紀錄數
+        """
+        self.history_path = history_path
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window_minutes = window_minutes
+        self.jitter = jitter
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._offline_streak: Dict[str, int] = {}
+        self._error_streak: Dict[str, int] = {}
+        self._history: Dict[str, List[str]] = self._load()
+
+    def _load(self):
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable schedule history {self.history_path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.history_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self._history, file, ensure_ascii=False)
+        os.replace(tmp_path, self.history_path)
+
+    def record_live(self, channel, started_at: Optional[str] = None):
+        """
+        記錄一次開台
+
+        :param started_at: ISO 8601 開台時間（探測結果提供），沒有時使用現在時間
+        """
+        moment = None
+        if started_at:
+            try:
+                moment = datetime.fromisoformat(started_at.replace("Z", "+00:00")).astimezone()
+            except ValueError:
+                pass
+        moment = moment or datetime.now().astimezone()
+
+        with self._lock:
+            self._offline_streak[channel] = 0
+            self._error_streak[channel] = 0
+            history = self._history.setdefault(channel, [])
+            stamp = moment.isoformat(timespec="minutes")
+            if stamp not in history:
+                history.append(stamp)
+                del history[:-self.max_history]
+                try:
+                    self._save()
+                except OSError as e:
+                    logger.warning(f"Failed to save schedule history: {e}")
+
+    def record_offline(self, channel):
+        with self._lock:
+            self._offline_streak[channel] = self._offline_streak.get(channel, 0) + 1
+            self._error_streak[channel] = 0
+
+    def record_error(self, channel):
+        with self._lock:
+            self._error_streak[channel] = self._error_streak.get(channel, 0) + 1
+
+    def expected_score(self, channel, moment: datetime) -> float:
+        """
+        目前時間落在過去開台時段內的程度
+
+        同一星期幾同一時段的紀錄權重為 1，其他天同一時段為 0.5
+        """
+        history = self._history.get(channel, [])
+        if not history:
+            return 0.0
+        now_week = _minute_of_week(moment)
+        now_day = now_week % (24 * 60)
+        score = 0.0
+        for stamp in history:
+            try:
+                past = datetime.fromisoformat(stamp).astimezone(moment.tzinfo)
+            except ValueError:
+                continue
+            past_week = _minute_of_week(past)
+            if _circular_distance(past_week, now_week, MINUTES_PER_WEEK) <= self.window_minutes:
+                score += 1.0
+            elif _circular_distance(past_week % (24 * 60), now_day, 24 * 60) <= self.window_minutes:
+                score += 0.5
+        return score / len(history)
+
+    def next_interval(self, channel, base_interval=None, now: Optional[datetime] = None) -> float:
+        """
+        下一次檢查前要等待的秒數
+
+        :param base_interval: 頻道自己的檢查間隔，預設使用 self.base_interval
+        """
+        base = base_interval or self.base_interval
+        now = now or datetime.now().astimezone()
+        with self._lock:
+            errors = self._error_streak.get(channel, 0)
+            offline = self._offline_streak.get(channel, 0)
+
+        if errors:
+            # 錯誤時指數退避
+            interval = min(max(self.max_interval, base), base * 2 ** min(errors, 10))
+        elif self.expected_score(channel, now) > 0:
+            interval = min(self.min_interval, base)
+        elif not self._history.get(channel):
+            interval = base
+        else:
+            # 離線越久檢查越慢，但不會錯過下一個預期開台時段
+            interval = min(max(self.max_interval, base), base * 2 ** min(offline // 10, 10))
+            until_window = self._seconds_until_window(channel, now, interval)
+            if until_window is not None:
+                interval = max(min(self.min_interval, base), until_window)
+
+        spread = interval * self.jitter
+        return max(1.0, interval + random.uniform(-spread, spread))
+
+    def _seconds_until_window(self, channel, now, horizon):
+        """horizon 秒內若會進入預期開台時段，回傳距離的秒數"""
+        step = 60
+        for offset in range(step, int(horizon) + step, step):
+            if self.expected_score(channel, now + timedelta(seconds=offset)) > 0:
+                return offset - step
+        return None
@@ -0,0 +1,46 @@
+import requests
+
+GQL_ENDPOINT = "https://gql.twitch.tv/gql"
+# Twitch 網頁版使用的公開 Client-ID
+WEB_CLIENT_ID = "kimne78kx3ncx6brgo4mv6wki5h1ko"
+
+
+class TwitchGQLError(Exception):
+    """GQL 回應中帶有 errors 或格式錯誤"""
+
+
+class TwitchGQLClient:
+    def __init__(self, endpoint=GQL_ENDPOINT, client_id=WEB_CLIENT_ID, timeout=10, session=None):
+        """
+        共用連線池的 Twitch GQL 客戶端
+
+        :param endpoint: GQL 端點，測試時可指向本機 stub server
+        :param client_id: Client-ID header
+        :param timeout: 單次請求逾時（秒）
+        :param session: 可傳入既有的 requests.Session
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.headers.update({"Client-ID": client_id})
+
+    def query(self, query, variables=None):
+        """
+        送出一個 GQL query 並回傳 data 欄位
+
+        :raises TwitchGQLError: 回應帶有 errors 或沒有 data
+        """
+        payload = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("errors"):
+            raise TwitchGQLError(body["errors"])
+        if "data" not in body:
+            raise TwitchGQLError(f"Unexpected GQL response: {body}")
+        return body["data"]
+
+    def close(self):
+        self.session.close()
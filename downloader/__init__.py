@@ -1,4 +1,17 @@
-from .downloader import YTDLPDownloader
-from .download_flow import DownloadFlow
+import importlib
+
+# 子模組在第一次使用時才載入：錄影只需要 recorder，不必載入 yt-dlp
+_EXPORTS = {
+    "YTDLPDownloader": ".downloader",
+    "DownloadFlow": ".download_flow",
+}
 
 __all__ = ["YTDLPDownloader", "DownloadFlow"]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -1,19 +1,34 @@
 from downloader import YTDLPDownloader
 from utils import setup_logger
-from utils.video_processor import VideoProcessor
+from utils.video_processor import VideoProcessor, DEFAULT_MAX_PART_BYTES
+import math
 import os
 import re
 
 logger = setup_logger("log")
+# 超過此長度的影片切成多段上傳
+MAX_PART_HOURS = 10
 
 
 class DownloadFlow:
-    def __init__(self, all_items):
+    def __init__(
+        self, all_items, videos_dir=None, upload_queue=None, split_long_videos=True, segment_mode="sections", infos=None
+    ):
         # 修正檔名並使用絕對路徑
         self.current_dir = os.path.dirname(os.path.abspath(__file__))
-        self.yt_dlp_path = os.path.join(self.current_dir, "yt-dlp.exe")
+        # 下載目錄，pipeline 模式下每支影片有自己的工作目錄
+        self.videos_dir = videos_dir or os.path.join(self.current_dir, "videos")
+        # 若提供 UploadQueue，切割出的片段會在寫完時立即排入上傳
+        self.upload_queue = upload_queue
+        # 關閉時只下載，切割交給之後的 split_and_queue（job 分階段處理）
+        self.split_long_videos = split_long_videos
+        # 長影片的分段方式：sections 逐段下載（可續傳），stream 邊下載邊切割（單一連線、平行片段）
+        self.segment_mode = segment_mode
+        # 呼叫端已取得的 yt-dlp 影片資訊 {名稱: info}，不再重新查詢
+        self.infos = infos or {}
+        self.downloaded = []
         self.all_items = all_items
-        self.downloader = YTDLPDownloader(self.yt_dlp_path)
+        self.downloader = YTDLPDownloader()
         self.video_processor = VideoProcessor()
 
     def download(self):
@@ -26,15 +41,29 @@ class DownloadFlow:
             sanitized_key = sanitized_key.replace("@", "feat")
             # 去除 emoji
             sanitized_key = re.sub(r'[\U00010000-\U0010ffff\u2600-\u26FF\u2700-\u27BF]+', '', sanitized_key)
-            self.path = os.path.join(self.current_dir, "videos", f"{sanitized_key}.mp4")
+            self.path = os.path.join(self.videos_dir, f"{sanitized_key}.mp4")
             try:
+                # 長影片直接依切割計畫分段下載，不寫出完整檔案
+                info = self.infos.get(key) or self.downloader.extract_info(value)
+                sections = self._plan_sections(info)
+                if len(sections) > 1:
+                    if self.segment_mode == "stream":
+                        success = self._download_stream(value, sanitized_key, sections[0][1])
+                    else:
+                        success = self._download_sections(value, sanitized_key, sections)
+                    if not success:
+                        logger.error(f"Failed to download {value}")
+                        all_success = False
+                    continue
+
                 # 將 path 傳給 download_video 方法
                 success = self.downloader.download_video(value, self.path)
                 if success:
                     logger.info(f"{value} has been downloaded to {self.path}")
-                    
-                    # 檢查影片是否超過6小時，如果是則進行切割
-                    self._check_and_split_video(self.path, sanitized_key)
+                    self.downloaded.append(self.path)
+
+                    if self.split_long_videos:
+                        self.split_and_queue(self.path, sanitized_key)
                 else:
                     logger.error(f"Failed to download {value}")
                     all_success = False
@@ -43,26 +72,96 @@ class DownloadFlow:
                 all_success = False
         return all_success
 
+    def _plan_sections(self, info):
+        """
+        依影片長度與預估大小決定分段，每段不超過 MAX_PART_HOURS 與單檔大小上限
+
+        :param info: yt-dlp 的 info dict
+        :return: [(開始秒數, 結束秒數)]，不需要分段時回傳單一區段或空列表
+        """
+        duration = (info or {}).get("duration")
+        if not duration:
+            return []
+        estimated_bytes = info.get("filesize") or info.get("filesize_approx")
+        if not estimated_bytes and info.get("tbr"):
+            estimated_bytes = info["tbr"] * 1000 / 8 * duration
+        parts = max(
+            math.ceil(duration / (MAX_PART_HOURS * 3600)),
+            math.ceil(estimated_bytes / DEFAULT_MAX_PART_BYTES) if estimated_bytes else 1,
+        )
+        length = duration / parts
+        return [(index * length, min(duration, (index + 1) * length)) for index in range(parts)]
+
+    def _download_sections(self, url, video_name, sections):
+        split_output_dir = os.path.join(self.videos_dir, f"{video_name}_segments")
+        os.makedirs(split_output_dir, exist_ok=True)
+        outputs = [
+            os.path.join(split_output_dir, f"{video_name}_part{index:03d}.mp4")
+            for index in range(len(sections))
+        ]
+        logger.info(f"Downloading {url} as {len(sections)} sections into {split_output_dir}")
+
+        def on_section(path):
+            self.downloaded.append(path)
+            if self.upload_queue:
+                self.upload_queue.submit(path, os.path.basename(path).split(".mp4")[0])
+
+        return self.downloader.download_sections(url, sections, outputs, on_section)
+
+    def _download_stream(self, url, video_name, segment_seconds):
+        split_output_dir = os.path.join(self.videos_dir, f"{video_name}_segments")
+
+        def on_segment(path):
+            self.downloaded.append(path)
+            if self.upload_queue:
+                self.upload_queue.submit(path, os.path.basename(path).split(".mp4")[0])
+
+        success, _ = self.downloader.download_segmented(
+            url, split_output_dir, video_name, math.ceil(segment_seconds), on_segment
+        )
+        return success
+
+    def split_and_queue(self, video_path, video_name):
+        """
+        檢查影片是否需要切割；有 upload_queue 時未切割的原檔也排入上傳
+
+        :return: True 已切割，False 不需切割，None 切割失敗
+        """
+        # 檢查影片是否超過6小時，如果是則進行切割
+        split = self._check_and_split_video(video_path, video_name)
+        if self.upload_queue and split is False:
+            self.upload_queue.submit(video_path, video_name)
+        return split
+
     def _check_and_split_video(self, video_path, video_name):
         """
-        檢查影片長度，如果超過10小時則切割成10小時的片段
+        檢查影片長度與大小，超過10小時或單檔上限時依關鍵影格切割
         
         :param video_path: 影片檔案路徑
         :param video_name: 影片名稱（用於建立切割檔案的目錄）
+        :return: True 已切割，False 不需切割，None 切割失敗
         """
         try:
-            # 檢查影片是否超過10小時
-            if self.video_processor.is_video_long(video_path, threshold_hours=10):
-                logger.info(f"Video {video_name} is longer than 10 hours, starting to split...")
+            # 檢查影片是否超過10小時或超過單檔大小上限
+            too_large = os.path.getsize(video_path) > DEFAULT_MAX_PART_BYTES
+            if too_large or self.video_processor.is_video_long(video_path, threshold_hours=MAX_PART_HOURS):
+                logger.info(f"Video {video_name} is longer than 10 hours or too large, starting to split...")
 
                 # 建立切割檔案的輸出目錄
-                split_output_dir = os.path.join(self.current_dir, "videos", f"{video_name}_segments")
+                split_output_dir = os.path.join(self.videos_dir, f"{video_name}_segments")
+
+                # 切割影片（每段不超過10小時與大小上限，多個 ffmpeg 平行擷取）
+                on_segment = None
+                if self.upload_queue:
+                    def on_segment(segment_path):
+                        self.upload_queue.submit(segment_path, os.path.basename(segment_path).split(".mp4")[0])
 
-                # 切割影片（每10小時一段）
-                segments = self.video_processor.split_video_by_time(
+                segments = self.video_processor.split_video_parallel(
                     input_path=video_path,
                     output_dir=split_output_dir,
-                    segment_duration_hours=10
+                    max_part_hours=MAX_PART_HOURS,
+                    max_part_bytes=DEFAULT_MAX_PART_BYTES,
+                    on_segment=on_segment,
                 )
                 
                 if segments:
@@ -76,13 +175,17 @@ class DownloadFlow:
                         logger.info(f"Removed original file: {video_path}")
                     except Exception as e:
                         logger.error(f"Failed to remove original file {video_path}: {str(e)}")
+                    return True
                 else:
                     logger.error(f"Failed to split video: {video_name}")
+                    return None
             else:
                 logger.info(f"Video {video_name} is under 6 hours, no splitting needed")
+                return False
                 
         except Exception as e:
             logger.error(f"Error checking/splitting video {video_name}: {str(e)}")
+            return None
 
     def run(self):
         return self.download()
@@ -1,14 +1,99 @@
+import os
+import shutil
 import subprocess
+import sys
+import threading
+
+import yt_dlp
+from yt_dlp.utils import download_range_func
+
+from utils import setup_logger
+from utils.logger import ProgressLogger
+from utils.tracing import current_context
+from utils.video_processor import watch_segment_list
+
+logger = setup_logger("log")
+
+# yt-dlp 子行程的進度行，輸出到 stderr（stdout 是影片資料）
+PROGRESS_PREFIX = "PROGRESS"
+PROGRESS_TEMPLATE = (
+    f"download:{PROGRESS_PREFIX} %(progress.downloaded_bytes)s "
+    "%(progress.total_bytes,progress.total_bytes_estimate)s %(progress.speed)s"
+)
 
 
 class YTDLPDownloader:
-    def __init__(self, yt_dlp_path):
+    def __init__(self, concurrent_fragments=8, retries=10, progress_hook=None, progress_interval=30):
+        """
+        以 yt-dlp 的 Python API 在同一個 process 內下載，不再呼叫外部執行檔
+
+        :param concurrent_fragments: 同時下載的 HLS 片段數
+        :param retries: 下載與片段的重試次數
+        :param progress_hook: 額外的進度回呼，收到 yt-dlp 的進度 dict
+        :param progress_interval: 進度寫入 log 的最短間隔（秒）
+        """
+        self.concurrent_fragments = concurrent_fragments
+        self.retries = retries
+        self.progress_hook = progress_hook
+        self.progress = ProgressLogger(logger, "download", interval=progress_interval)
+        # 串流分段下載時交給 ffmpeg 切割
+        self.ffmpeg_path = shutil.which("ffmpeg")
+
+    def _options(self, output_path, **extra):
+        options = {
+            "outtmpl": {"default": output_path},
+            "quiet": True,
+            "no_warnings": True,
+            "noprogress": True,
+            # 保留 .part 檔，重啟後從中斷處接續
+            "continuedl": True,
+            "nopart": False,
+            "concurrent_fragment_downloads": self.concurrent_fragments,
+            "retries": self.retries,
+            "fragment_retries": self.retries,
+            # 缺片段時直接失敗，避免上傳有缺口的影片
+            "skip_unavailable_fragments": False,
+            "socket_timeout": 30,
+            "merge_output_format": "mp4",
+            "progress_hooks": [self._on_progress],
+            "logger": _YTDLPLogger(),
+        }
+        options.update(extra)
+        return options
+
+    def _on_progress(self, progress):
+        if self.progress_hook:
+            self.progress_hook(progress)
+
+        status = progress.get("status")
+        name = os.path.basename(progress.get("filename") or "")
+        if status == "finished":
+            logger.info(f"Download finished: {name}")
+        elif status == "downloading":
+            fragment = None
+            if progress.get("fragment_count"):
+                fragment = f"{progress.get('fragment_index')}/{progress['fragment_count']}"
+            self.progress.update(
+                name,
+                done_bytes=progress.get("downloaded_bytes") or 0,
+                total_bytes=progress.get("total_bytes") or progress.get("total_bytes_estimate"),
+                speed=progress.get("speed"),
+                eta=progress.get("eta"),
+                fragment=fragment,
+            )
+
+    def extract_info(self, video_url):
         """
-        初始化 YTDLPDownloader 類別
+        只取得影片資訊（長度、格式、位元率），不下載
 
-        :param yt_dlp_path: yt-dlp.exe 的路徑
+        :return: yt-dlp 的 info dict，失敗時回傳 None
         """
-        self.yt_dlp_path = yt_dlp_path
+        try:
+            with yt_dlp.YoutubeDL(self._options("%(id)s.%(ext)s")) as ydl:
+                return ydl.sanitize_info(ydl.extract_info(video_url, download=False))
+        except Exception as e:
+            logger.error(f"Failed to extract info for {video_url}: {str(e)}")
+            return None
 
     def download_video(self, video_url, output_path=None):
         """
@@ -16,52 +101,172 @@ class YTDLPDownloader:
 
         :param video_url: 要下載的影片 URL
         :param output_path: 下載影片的儲存路徑 (可選)
-        :return: 下載結果的標準輸出和標準錯誤
+        :return: 是否下載成功
         """
-        yt_dlp_args = [self.yt_dlp_path, video_url, "--progress"]
+        try:
+            with yt_dlp.YoutubeDL(self._options(output_path or "%(title)s.%(ext)s")) as ydl:
+                return ydl.download([video_url]) == 0
+        except Exception as e:
+            logger.error(f"Failed to download {video_url}: {str(e)}")
+            return False
 
-        if output_path:
-            yt_dlp_args.extend(["-o", output_path])
+    def download_sections(self, video_url, sections, output_paths, on_section=None):
+        """
+        依切割計畫直接下載各個時間區段，不需要先寫出完整檔案再切割
+
+        :param sections: [(開始秒數, 結束秒數)]
+        :param output_paths: 每個區段的輸出路徑
+        :param on_section: 每個區段下載完成時呼叫 on_section(path)
+        :return: 是否全部下載成功
+        """
+        for (start, end), output_path in zip(sections, output_paths):
+            # 完成的區段才會從 .part 改名，已存在代表上次已下載完
+            if os.path.exists(output_path):
+                logger.info(f"Section already downloaded: {output_path}")
+            else:
+                logger.info(f"Downloading section {start:.0f}s-{end:.0f}s of {video_url} to {output_path}")
+                options = self._options(output_path, download_ranges=download_range_func(None, [(start, end)]))
+                try:
+                    with yt_dlp.YoutubeDL(options) as ydl:
+                        if ydl.download([video_url]) != 0:
+                            return False
+                except Exception as e:
+                    logger.error(f"Failed to download section of {video_url}: {str(e)}")
+                    return False
+            if on_section:
+                on_section(output_path)
+        return True
+
+    def download_segmented(self, video_url, output_dir, base_name, segment_seconds, on_segment=None):
+        """
+        yt-dlp 輸出到 stdout，直接交給 ffmpeg 切成 MP4 片段；只寫入一次，磁碟用量約為一支影片
+
+        :param segment_seconds: 每段的秒數
+        :param on_segment: 每個片段寫完時呼叫 on_segment(path)
+        :return: (是否成功, 完成的片段列表)
+        """
+        if not self.ffmpeg_path:
+            logger.error("FFmpeg not found in system PATH, cannot stream into parts")
+            return False, []
+        os.makedirs(output_dir, exist_ok=True)
+        part_pattern = os.path.join(output_dir, f"{base_name}_part%03d.mp4")
+        segment_list = os.path.join(output_dir, f".{base_name}_segments.csv")
 
         try:
-            process = subprocess.Popen(
-                yt_dlp_args,
+            # Python API 無法寫到 pipe，改以同一個 Python 執行 yt-dlp 模組
+            ytdlp = subprocess.Popen(
+                [
+                    sys.executable, "-m", "yt_dlp",
+                    "--quiet", "--no-warnings",
+                    "--concurrent-fragments", str(self.concurrent_fragments),
+                    "--retries", str(self.retries),
+                    "--fragment-retries", str(self.retries),
+                    "--abort-on-unavailable-fragments",
+                    "--socket-timeout", "30",
+                    "--progress", "--newline",
+                    "--progress-template", PROGRESS_TEMPLATE,
+                    "-o", "-",
+                    video_url,
+                ],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
+                stderr=subprocess.PIPE,
+            )
+            ffmpeg = subprocess.Popen(
+                [
+                    self.ffmpeg_path, "-y",
+                    "-hide_banner", "-loglevel", "error",
+                    "-i", "pipe:0",
+                    "-c", "copy",
+                    "-map", "0",
+                    "-bsf:a", "aac_adtstoasc",
+                    "-f", "segment",
+                    "-segment_time", str(segment_seconds),
+                    "-segment_format", "mp4",
+                    "-segment_list", segment_list,
+                    "-segment_list_type", "csv",
+                    "-reset_timestamps", "1",
+                    part_pattern,
+                ],
+                stdin=ytdlp.stdout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
             )
+            # ffmpeg 持有 pipe，yt-dlp 結束時 ffmpeg 才會收到 EOF
+            ytdlp.stdout.close()
+        except Exception as e:
+            logger.error(f"Failed to start streaming download of {video_url}: {str(e)}")
+            return False, []
 
-            # 實時讀取並輸出進度
-            for line in process.stdout:
-                print(line, end="", flush=True)
+        logger.info(f"Streaming {video_url} into {segment_seconds}s parts in {output_dir}")
+        stop = threading.Event()
+        result = {}
+        # 片段的回呼（例如排入上傳）沿用目前的 trace
+        watcher = threading.Thread(
+            target=current_context().run,
+            args=(lambda: result.update(
+                segments=watch_segment_list(segment_list, output_dir, on_segment or (lambda path: None), stop)
+            ),),
+            name=f"download-{base_name}",
+            daemon=True,
+        )
+        watcher.start()
+        reader = threading.Thread(
+            target=self._follow_progress,
+            args=(ytdlp.stderr, base_name),
+            name=f"download-progress-{base_name}",
+            daemon=True,
+        )
+        reader.start()
+        try:
+            ytdlp.wait()
+            _, stderr = ffmpeg.communicate()
+        finally:
+            stop.set()
+            watcher.join()
+            reader.join()
 
-            # 等待進程完成
-            return_code = process.wait(timeout=3600)  # 1小時超時
-            return return_code == 0
+        if ytdlp.returncode != 0:
+            logger.error(f"yt-dlp exited with error code {ytdlp.returncode} while streaming {video_url}")
+        if ffmpeg.returncode != 0:
+            logger.error(f"FFmpeg segmenter exited with error code {ffmpeg.returncode}: {stderr.decode(errors='replace')}")
+        return ytdlp.returncode == 0 and ffmpeg.returncode == 0, result.get("segments", [])
 
-        except subprocess.TimeoutExpired:
-            print(f"下載超時: {video_url}")
-            process.kill()
-            return False
-        except Exception as e:
-            print(f"發生未預期的錯誤: {str(e)}")
-            if "process" in locals():
-                process.kill()
-            return False
+    def _follow_progress(self, pipe, name):
+        """
+        讀取 yt-dlp 子行程的 stderr：進度行交給 ProgressLogger 限制輸出頻率，其餘訊息（錯誤）寫入 log
+        """
+        for raw in pipe:
+            line = raw.decode(errors="replace").strip()
+            if not line.startswith(PROGRESS_PREFIX):
+                if line:
+                    logger.error(f"yt-dlp: {line}")
+                continue
+            try:
+                done, total, speed = (
+                    None if value == "NA" else float(value) for value in line.split()[1:]
+                )
+            except ValueError:
+                continue
+            self.progress.update(
+                name,
+                done_bytes=int(done) if done is not None else None,
+                total_bytes=int(total) if total else None,
+                speed=speed,
+            )
+        pipe.close()
+
+
+class _YTDLPLogger:
+    """把 yt-dlp 的訊息導向專案的 logger"""
 
+    def debug(self, msg):
+        pass
 
-# 使用範例
-if __name__ == "__main__":
-    yt_dlp_path = "E:/Projects/twitch-monitor/downloader/yt-dlp.exe"
-    video_url = "https://www.youtube.com/watch?v=Z8brPP0U0Ak&ab_channel=%E7%86%8A%E7%8C%AB%E5%A4%A7G-%E6%80%95%E6%AD%BB%E6%B5%81%E5%A1%9E%E6%81%A9"
-    output_path = "downloaded_video.mp4"  # 可選
+    def info(self, msg):
+        pass
 
-    downloader = YTDLPDownloader(yt_dlp_path)
-    result = downloader.download_video(video_url, output_path)
+    def warning(self, msg):
+        logger.warning(f"yt-dlp: {msg}")
 
-    if result:
-        print("下載成功")
-    else:
-        print("下載失敗")
+    def error(self, msg):
+        logger.error(f"yt-dlp: {msg}")
@@ -1,8 +1,35 @@
 import os
 import signal
 import subprocess
+import threading
 import time
 from utils import setup_logger
+from utils.logger import ProgressLogger
+from utils.streamlink_options import STREAMLINK_OPTIONS
+from utils.tracing import current_span
+from utils.video_processor import watch_segment_list
+
+# Read size from the stream and userspace write buffer
+RECORD_CHUNK_SIZE = 1024 * 1024
+RECORD_BUFFER_SIZE = 16 * 1024 * 1024
+# Minimum seconds between recording progress events in the log
+RECORD_PROGRESS_INTERVAL = 60
+
+
+def stream_bitrate(streams):
+    """
+    Bandwidth (bit/s) the multivariant playlist advertises for the "best" stream,
+    or None when the streams were not resolved or carry no bandwidth.
+    """
+    stream = streams.get("best") if streams else None
+    multivariant = getattr(stream, "multivariant", None)
+    if multivariant is None:
+        return None
+    for playlist in multivariant.playlists:
+        if playlist.uri == stream.url and playlist.stream_info and playlist.stream_info.bandwidth:
+            return playlist.stream_info.bandwidth
+    return None
+
 
 class StreamRecorder:
     def __init__(self):
@@ -29,14 +56,7 @@ class StreamRecorder:
         try:
              # streamlink <url> best -o <output>
             process = subprocess.Popen(
-                ["streamlink", 
-                 "--hls-live-restart", 
-                 "--stream-segment-threads", "5", 
-                 "--stream-segment-attempts", "5", 
-                 "--stream-segment-timeout", "20", 
-                 "--retry-streams", "30", 
-                 "--retry-max", "5", 
-                 channel_url, "best", "-o", output_path],
+                ["streamlink", *STREAMLINK_OPTIONS, channel_url, "best", "-o", output_path],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
@@ -55,6 +75,7 @@ class StreamRecorder:
                     process.send_signal(signal.SIGINT)
                     stdout, stderr = process.communicate()
             
+            current_span().set_attribute("streamlink.exit_code", process.returncode)
             # Check for success (0) or user interrupt (-2 or 130)
             if process.returncode != 0 and process.returncode != -2 and process.returncode != 130:
                 self.logger.error(f"Streamlink exited with error code {process.returncode}")
@@ -68,6 +89,268 @@ class StreamRecorder:
             self.logger.error(f"Error during recording: {e}")
             return False
 
+    def record(self, channel_url, output_path, streams=None):
+        """
+        Records the stream in-process when the live check already resolved it,
+        falling back to the streamlink CLI when it did not or the stream cannot be opened.
+        """
+        stream = streams.get("best") if streams else None
+        if stream is not None:
+            if self.record_stream(stream, output_path):
+                return True
+            if os.path.exists(output_path):
+                return False
+            self.logger.info("Falling back to the streamlink CLI")
+        return self.start_recording(channel_url, output_path)
+
+    def record_stream(self, stream, output_path):
+        """
+        Records an already-resolved Streamlink stream in-process.
+        Reuses the stream returned by StreamMonitor.check_live_status, so recording starts
+        without spawning streamlink and resolving the channel a second time.
+        Data is written through a large buffer. The file is not preallocated: space
+        reserved past the last write would be left as trailing zeros after a crash.
+        This function blocks until the recording stops (stream ends or error).
+        """
+        self.logger.info(f"Starting in-process recording to {output_path}")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        try:
+            stream_fd = stream.open()
+        except Exception as e:
+            self.logger.error(f"Error opening stream: {e}")
+            return False
+
+        written = 0
+        progress = ProgressLogger(self.logger, "record", interval=RECORD_PROGRESS_INTERVAL)
+        name = os.path.basename(output_path)
+        try:
+            with open(output_path, "wb", buffering=RECORD_BUFFER_SIZE) as file:
+                try:
+                    while True:
+                        data = stream_fd.read(RECORD_CHUNK_SIZE)
+                        if not data:
+                            break
+                        file.write(data)
+                        written += len(data)
+                        progress.update(name, done_bytes=written)
+                except KeyboardInterrupt:
+                    self.logger.info("Recording stopping due to user interrupt...")
+                except OSError as e:
+                    # Keep what was recorded so far, like streamlink does when the stream drops
+                    self.logger.error(f"Stream read failed after {written / 1e6:.0f} MB: {e}")
+        except OSError as e:
+            self.logger.error(f"Error during recording: {e}")
+            return False
+        finally:
+            stream_fd.close()
+
+        current_span().set_attribute("bytes", written)
+        if not written:
+            self.logger.error(f"Stream ended before any data was recorded: {output_path}")
+            return False
+        self.logger.info(f"Recording finished: {output_path} ({written / 1e6:.0f} MB)")
+        return True
+
+    def record_fragmented(self, channel_url, output_path, streams=None):
+        """
+        Records straight to fragmented MP4, so no .ts -> .mp4 remux is needed afterwards.
+        Every keyframe starts a self-contained moof+mdat fragment after an empty moov,
+        so an interrupted file stays playable up to its last complete fragment;
+        truncate_incomplete_fragments fixes up the tail.
+        The stream resolved by the live check is fed to ffmpeg in-process when given,
+        otherwise streamlink's output is piped in.
+        This function blocks until the recording stops (stream ends or error).
+        """
+        self.logger.info(f"Starting fragmented MP4 recording for {channel_url} to {output_path}")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        stream = streams.get("best") if streams else None
+        stream_fd = None
+        streamlink = None
+        try:
+            if stream is not None:
+                stream_fd = stream.open()
+            else:
+                streamlink = subprocess.Popen(
+                    ["streamlink", *STREAMLINK_OPTIONS, channel_url, "best", "-O"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            ffmpeg = subprocess.Popen(
+                [
+                    "ffmpeg", "-y",
+                    "-hide_banner", "-loglevel", "error",
+                    "-i", "pipe:0",
+                    "-c", "copy",
+                    # Twitch streams carry a timed ID3 data track that MP4 cannot hold
+                    "-map", "0:v?",
+                    "-map", "0:a?",
+                    "-bsf:a", "aac_adtstoasc",
+                    "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+                    "-f", "mp4",
+                    output_path,
+                ],
+                stdin=subprocess.PIPE if streamlink is None else streamlink.stdout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            if streamlink is not None:
+                streamlink.stdout.close()
+        except Exception as e:
+            self.logger.error(f"Error during recording: {e}")
+            if stream_fd is not None:
+                stream_fd.close()
+            if streamlink is not None:
+                streamlink.kill()
+            return False
+
+        try:
+            if streamlink is None:
+                self._feed(stream_fd, ffmpeg.stdin, os.path.basename(output_path))
+            else:
+                try:
+                    streamlink.wait()
+                except KeyboardInterrupt:
+                    self.logger.info("Recording stopping due to user interrupt...")
+                    try:
+                        streamlink.wait(timeout=15)
+                    except subprocess.TimeoutExpired:
+                        self.logger.warning("Streamlink did not exit gracefully, sending SIGINT...")
+                        streamlink.send_signal(signal.SIGINT)
+                        streamlink.wait()
+        finally:
+            if stream_fd is not None:
+                stream_fd.close()
+            # ffmpeg flushes the last fragment once its input reaches EOF
+            stderr = ffmpeg.stderr.read()
+            ffmpeg.wait()
+
+        current_span().set_attributes(
+            **{"ffmpeg.exit_code": ffmpeg.returncode, "streamlink.exit_code": streamlink and streamlink.returncode}
+        )
+        if ffmpeg.returncode not in (0, -2, 255):
+            # A non-empty file does not mean the recording is intact; the caller treats it as failed
+            self.logger.error(f"FFmpeg exited with error code {ffmpeg.returncode}: {stderr.decode(errors='replace')}")
+            return False
+        if not os.path.exists(output_path) or not os.path.getsize(output_path):
+            self.logger.error(f"Recording produced no data: {output_path}")
+            return False
+        if streamlink is not None and streamlink.returncode not in (0, -2, 130):
+            self.logger.error(f"Streamlink exited with error code {streamlink.returncode}")
+        self.logger.info(f"Recording finished: {output_path}")
+        return True
+
+    def _feed(self, stream_fd, pipe, name="stream"):
+        """Copies the in-process stream into ffmpeg's stdin until the stream ends."""
+        written = 0
+        progress = ProgressLogger(self.logger, "record", interval=RECORD_PROGRESS_INTERVAL)
+        try:
+            while True:
+                data = stream_fd.read(RECORD_CHUNK_SIZE)
+                if not data:
+                    break
+                pipe.write(data)
+                written += len(data)
+                progress.update(name, done_bytes=written)
+        except KeyboardInterrupt:
+            self.logger.info("Recording stopping due to user interrupt...")
+        except BrokenPipeError:
+            self.logger.error(f"FFmpeg stopped reading after {written / 1e6:.0f} MB")
+        except OSError as e:
+            self.logger.error(f"Stream read failed after {written / 1e6:.0f} MB: {e}")
+        finally:
+            try:
+                pipe.close()
+            except BrokenPipeError:
+                pass
+        return written
+
+    def start_segmented_recording(self, channel_url, output_dir, base_name, segment_seconds, on_segment):
+        """
+        Records a stream as a series of time-bounded .ts parts.
+        streamlink writes to stdout and ffmpeg's segment muxer cuts it into parts;
+        on_segment(path) is called from a watcher thread as soon as each part is closed.
+        This function blocks until the recording stops.
+        """
+        self.logger.info(
+            f"Starting segmented recording for {channel_url} to {output_dir} "
+            f"({segment_seconds}s per part)"
+        )
+        os.makedirs(output_dir, exist_ok=True)
+        part_pattern = os.path.join(output_dir, f"{base_name}_part%03d.ts")
+        # ffmpeg appends one line per part to this list once the part is finished
+        segment_list = os.path.join(output_dir, f".{base_name}_segments.csv")
+
+        try:
+            streamlink = subprocess.Popen(
+                ["streamlink", *STREAMLINK_OPTIONS, channel_url, "best", "-O"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            ffmpeg = subprocess.Popen(
+                [
+                    "ffmpeg", "-y",
+                    "-hide_banner", "-loglevel", "error",
+                    "-i", "pipe:0",
+                    "-c", "copy",
+                    "-map", "0",
+                    "-f", "segment",
+                    "-segment_time", str(segment_seconds),
+                    "-segment_format", "mpegts",
+                    "-segment_list", segment_list,
+                    "-segment_list_type", "csv",
+                    "-reset_timestamps", "1",
+                    part_pattern,
+                ],
+                stdin=streamlink.stdout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            # ffmpeg 持有 pipe，父行程關閉自己的一端，streamlink 結束時 ffmpeg 才會收到 EOF
+            streamlink.stdout.close()
+        except Exception as e:
+            self.logger.error(f"Error during recording: {e}")
+            return False
+
+        stop = threading.Event()
+        watcher = threading.Thread(
+            target=watch_segment_list,
+            args=(segment_list, output_dir, on_segment, stop),
+            name=f"segments-{base_name}",
+            daemon=True,
+        )
+        watcher.start()
+
+        try:
+            try:
+                streamlink.wait()
+            except KeyboardInterrupt:
+                self.logger.info("Recording stopping due to user interrupt...")
+                try:
+                    streamlink.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    self.logger.warning("Streamlink did not exit gracefully, sending SIGINT...")
+                    streamlink.send_signal(signal.SIGINT)
+                    streamlink.wait()
+            # 等 ffmpeg 寫完最後一段
+            _, stderr = ffmpeg.communicate()
+        finally:
+            stop.set()
+            watcher.join()
+
+        current_span().set_attributes(
+            **{"ffmpeg.exit_code": ffmpeg.returncode, "streamlink.exit_code": streamlink.returncode}
+        )
+        if ffmpeg.returncode != 0:
+            self.logger.error(f"FFmpeg segmenter exited with error code {ffmpeg.returncode}: {stderr.decode(errors='replace')}")
+        if streamlink.returncode not in (0, -2, 130):
+            self.logger.error(f"Streamlink exited with error code {streamlink.returncode}")
+            return False
+
+        self.logger.info(f"Segmented recording finished: {output_dir}")
+        return True
+
     def remux_video(self, input_path, output_path):
         """
         Remuxes a video file (e.g., .ts to .mp4) using ffmpeg with stream copy.
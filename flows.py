@@ -1,170 +1,469 @@
-from detection import DetectionFlow
-from detection.monitor import StreamMonitor
-from downloader import DownloadFlow
-from downloader.recorder import StreamRecorder
-from uploader import UploadFlow
-from utils import setup_logger, clear_empty_data, send_discord
+# 各模式用到的套件（Playwright、yt-dlp、Streamlink、Google API）在對應的函式內才載入，
+# 讓每個模式啟動時只載入自己需要的部分
+from detection.schedule import AdaptivePollScheduler
+from utils import setup_logger, clear_empty_data, send_discord, format_yt_links, JobStore
+from utils.job_store import (
+    DETECTED, DOWNLOADING, DOWNLOADED, SPLIT, UPLOADING, UPLOADED, FAILED, worker_name,
+    start_recording_job, workspace_files, finish_segmented_job,
+)
+from utils.disk_admission import DiskAdmission, BACKLOG, LIVE, DEFAULT_DURATION_HOURS, estimate_footprint
+from utils.disk_usage import file_size, dir_size
+from utils.tracing import span, current_context
 import asyncio
 import os
-import requests
-from bs4 import BeautifulSoup
+import shutil
+import threading
 import time
 
 logger = setup_logger("log")
 videos_root = "downloader/videos/"
+vod_channel = "shxtou"
 
 
-def auto_detect_and_upload(playlist_id):
+def auto_detect_and_upload(playlist_id, prefetch=0, disk_budget_gb=None, upload_workers=1, segment_mode="sections"):
+    with span("auto_detect_and_upload", channel=vod_channel, prefetch=prefetch, upload_workers=upload_workers):
+        _auto_detect_and_upload(playlist_id, prefetch, disk_budget_gb, upload_workers, segment_mode)
+    clear_empty_data("logs")
+
+
+def _auto_detect_and_upload(playlist_id, prefetch, disk_budget_gb, upload_workers, segment_mode):
+    from detection import DetectionFlow
+
+    store = JobStore()
+    admission = DiskAdmission(db_path=store.db_path)
     try:
         logger.info("Starting main process")
+        recovered = store.recover("vod") + store.recover("upload")
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted jobs")
+
+        # videos 目錄中遺留的檔案先上傳，失敗時停止以保持播放清單順序
+        _adopt_leftover_videos(store)
+        for job in store.pending_jobs(kind="upload"):
+            logger.info(f"--- Uploading leftover file: {job.title} ---")
+            if not _upload_job(store, job, playlist_id, upload_workers, admission):
+                logger.error(f"Failed to upload {job.title}. Stopping workflow to preserve order.")
+                return
+
+        # 停止點改由 job store 提供（第一次執行時沿用 latest.json）
         detection_flow = DetectionFlow(
-            url="https://www.twitch.tv/shxtou/videos?filter=archives&sort=time",
+            url=f"https://www.twitch.tv/{vod_channel}/videos?filter=archives&sort=time",
             item_selector="//*[@data-a-target='video-tower-card-0']",
+            latest_url=store.latest_source("vod", vod_channel),
         )
         logger.info("Running detection flow")
-        items_dict = asyncio.run(detection_flow.run())
-        
-        if not items_dict:
-            logger.info("No items detected, exiting")
-            clear_empty_data("logs")
-            return
-            
-        logger.info(f"Detected items: {items_dict}")
-        
-        # Convert to list and reverse to process Oldest -> Newest
-        items_list = list(items_dict.items())
-        items_list.reverse()
-        
-        logger.info(f"Processing {len(items_list)} items sequentially")
-
-        for title, url in items_list:
-            logger.info(f"--- Processing item: {title} ---")
-            
-            # Ensure clean state (optional warning)
-            if os.listdir(videos_root):
-                 logger.warning(f"Videos directory not empty before download: {os.listdir(videos_root)}")
-
-            # Download
-            detection_item = {title: url}
-            download_flow = DownloadFlow(detection_item)
-            logger.info(f"Downloading: {title}")
-            if not download_flow.run():
-                 logger.error(f"Download failed for {title}. Skipping to next item.")
-                 send_discord(f"❌ 下載失敗：{title}")
-                 continue
-            
-            # Check if download produced files
-            if not os.listdir(videos_root):
-                 logger.error(f"Download reported success but no files found in {videos_root}. Skipping to next item.")
-                 continue
-            
-            # Upload
-            logger.info(f"Uploading content for: {title}")
-            upload_success, yt_urls = upload_existing_videos(playlist_id)
-
-            if upload_success:
-                # Double check if directory is empty after upload (upload_existing_videos should clean up)
-                if not os.listdir(videos_root):
-                    logger.info(f"Successfully processed {title}. Updating trace.")
-                    if len(yt_urls) == 1:
-                        yt_links = f"YouTube：{yt_urls[0]}"
-                    elif yt_urls:
-                        yt_links = "\n".join(f"YouTube ({i+1})：{u}" for i, u in enumerate(yt_urls))
-                    else:
-                        yt_links = "（無 YouTube 連結）"
-                    send_discord(f"✅ 下載並上傳完成：{title}\nTwitch：{url}\n{yt_links}")
-                    detection_flow.update_latest(url)
-                else:
-                    logger.warning(f"Upload reported success but files remain in {videos_root}. Not updating trace to be safe.")
-                    send_discord(f"⚠️ 上傳完成但目錄仍有殘留檔案：{title}\nTwitch：{url}")
+        with span("detect", channel=vod_channel) as s:
+            items_dict = asyncio.run(detection_flow.run())
+            s.set_attribute("vods", len(detection_flow.vods))
+        if items_dict:
+            logger.info(f"Detected items: {items_dict}")
+
+        # Oldest -> Newest
+        for vod in reversed(detection_flow.vods):
+            store.add_job(
+                "vod", vod.url, vod.title, channel=vod_channel,
+                seq=_vod_seq(vod.id), duration=vod.duration,
+            )
+
+        jobs = store.pending_jobs(kind="vod", channel=vod_channel)
+        if not jobs:
+            logger.info("No pending jobs, exiting")
+        elif prefetch > 0:
+            logger.info(f"Processing {len(jobs)} jobs pipelined (prefetch={prefetch})")
+            _pipelined_download_upload(
+                jobs, store, playlist_id, prefetch, disk_budget_gb, upload_workers, segment_mode, admission
+            )
+        else:
+            logger.info(f"Processing {len(jobs)} jobs sequentially")
+            for job in jobs:
+                logger.info(f"--- Processing item: {job.title} ({job.state}) ---")
+                downloaded = _download_job(store, job, segment_mode, admission)
+                if downloaded is None:
+                    logger.warning(f"Not enough disk space for {job.title}. Stopping workflow to preserve order.")
+                    break
+                if not downloaded:
+                    logger.error(f"Download failed for {job.title}. Skipping to next item.")
+                    continue
+                if not _upload_job(store, job, playlist_id, upload_workers, admission):
+                    logger.error(f"Failed to upload {job.title}. Stopping workflow to preserve order.")
                     break
-            else:
-                logger.error(f"Failed to upload {title}. Stopping workflow to preserve order.")
-                send_discord(f"❌ 上傳失敗：{title}\nTwitch：{url}")
-                break
 
     except Exception as e:
         logger.error(f"An error occurred in main process: {e}")
+    finally:
+        admission.close()
+        store.close()
+
+
+def _adopt_leftover_videos(store, root=videos_root):
+    """
+    videos 目錄中遺留的影片（舊版本或中斷時留下的檔案）各自建立一個 upload job，
+    檔案移到 job 的工作目錄後由 _upload_job 上傳
+
+    :return: 新增的 job 數量
+    """
+    if not os.path.isdir(root):
+        return 0
+    adopted = 0
+    for video_info in _collect_videos(root):
+        path = video_info['path']
+        # 同一路徑之後可能出現新的檔案，以修改時間區分
+        source = f"file://{os.path.abspath(path)}#{os.stat(path).st_mtime_ns}"
+        job = store.add_job("upload", source, video_info['name'])
+        if job.state != DETECTED:
+            continue
+        target = os.path.join(job.workspace, os.path.basename(path))
+        if video_info['type'] == 'segment':
+            # 保留 _segments 目錄，上傳時不會再切割
+            target = os.path.join(job.workspace, os.path.basename(os.path.dirname(path)), os.path.basename(path))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        store.transition(job.id, DETECTED, DOWNLOADED)
+        logger.info(f"Found leftover video {path}, queued as upload job {job.id}")
+        adopted += 1
+    if adopted:
+        _remove_empty_dirs(root)
+    return adopted
+
+
+def _vod_seq(video_id):
+    # Twitch 影片 ID 隨時間遞增，可以直接用來排序
+    return int(video_id) if video_id and video_id.isdigit() else None
+
+
+def _info_bitrate(info):
+    """yt-dlp info 的位元率（bit/s）：tbr 的單位是 kbit/s，沒有時以預估大小與長度換算"""
+    if not info:
+        return None
+    if info.get("tbr"):
+        return info["tbr"] * 1000
+    size = info.get("filesize") or info.get("filesize_approx")
+    if size and info.get("duration"):
+        return size * 8 / info["duration"]
+    return None
+
+
+def _reserve_disk(admission, job, stop=None, info=None):
+    """
+    依影片長度與位元率預留磁碟空間，空間不足而延後時回傳 False
+
+    :param info: yt-dlp 的 info dict，用來取得位元率
+    """
+    if admission is None:
+        return True
+    known_duration = job.duration or (info or {}).get("duration")
+    duration = known_duration or DEFAULT_DURATION_HOURS * 3600
+    # 長度未知時可能下載完整檔案後再切割，需要兩份空間
+    copies = 1 if known_duration else 2
+    nbytes = estimate_footprint(duration, _info_bitrate(info), copies=copies)
+    reservation = admission.acquire(f"job-{job.id}", nbytes, BACKLOG, workspace=job.workspace, stop=stop)
+    return reservation is not None
+
+
+def _download_job(store, job, segment_mode="sections", admission=None, stop=None):
+    """
+    下載階段：detected -> downloading -> downloaded
+
+    :param segment_mode: 長影片的分段下載方式，見 DownloadFlow
+    :param admission: DiskAdmission，下載前先預留磁碟空間
+    :param stop: threading.Event，設定後不再等待磁碟空間
+    :return: job 是否已下載完成（已在之後的階段也算）；磁碟空間不足而延後時回傳 None
+    """
+    if job.state != DETECTED:
+        return job.state in (DOWNLOADED, SPLIT, UPLOADING)
+
+    from downloader import DownloadFlow, YTDLPDownloader
+
+    # 位元率用來估計磁碟用量，取得的影片資訊交給 DownloadFlow 重用
+    info = YTDLPDownloader().extract_info(job.source_url) if admission else None
+    if not _reserve_disk(admission, job, stop, info):
+        return None
+    if not store.transition(job.id, DETECTED, DOWNLOADING, worker=worker_name()):
+        logger.warning(f"Job {job.id} was claimed by another worker")
+        if admission:
+            admission.release(f"job-{job.id}")
+        return False
+
+    logger.info(f"Downloading: {job.title}")
+    with span("download", job_id=job.id, title=job.title, url=job.source_url, duration=job.duration) as s:
+        try:
+            download_flow = DownloadFlow(
+                {job.title: job.source_url},
+                videos_dir=job.workspace,
+                split_long_videos=False,
+                segment_mode=segment_mode,
+                infos={job.title: info} if info else None,
+            )
+            download_ok = download_flow.run() and bool(download_flow.downloaded)
+            error = "download failed"
+        except Exception as e:
+            download_ok, error = False, str(e)
+        s.set_attributes(success=download_ok, bytes=dir_size(job.workspace))
+
+    if download_ok:
+        store.transition(job.id, DOWNLOADING, DOWNLOADED)
+        return True
+
+    # 清掉下載到一半的檔案，下次從頭重新下載
+    shutil.rmtree(job.workspace, ignore_errors=True)
+    os.makedirs(job.workspace, exist_ok=True)
+    if admission:
+        admission.release(f"job-{job.id}")
+    failed = store.fail(job.id, DETECTED, error)
+    if failed.state == FAILED:
+        send_discord(f"❌ 下載失敗（已重試 {failed.attempts} 次）：{job.title}\nTwitch：{job.source_url}")
+    else:
+        send_discord(f"❌ 下載失敗：{job.title}")
+    return False
+
+
+def _upload_job(store, job, playlist_id, upload_workers=1, admission=None):
+    """
+    切割與上傳階段：downloaded -> split -> uploading -> uploaded
+    片段切好就開始上傳；重做時略過已上傳的片段
+
+    :return: 是否全部上傳成功
+    """
+    from downloader import DownloadFlow
+    from uploader import UploadQueue
+
+    job = store.get(job.id)
+    upload_queue = UploadQueue(
+        playlist_id,
+        max_workers=upload_workers,
+        uploaded=store.uploaded_parts(job.id),
+        on_uploaded=lambda path, yt_url: store.record_upload(job.id, os.path.basename(path), yt_url),
+    )
+    resplit = False
+    with span("upload_job", job_id=job.id, title=job.title, state=job.state) as s:
+        try:
+            if job.state == DOWNLOADED:
+                download_flow = DownloadFlow({}, videos_dir=job.workspace, upload_queue=upload_queue)
+                for video_info in _collect_videos(job.workspace):
+                    if video_info['type'] == 'segment':
+                        if os.path.exists(os.path.dirname(video_info['path'])[:-len("_segments")] + ".mp4"):
+                            # 上次切割失敗留下的片段，原檔重新切割時會再產生
+                            continue
+                        # 長影片已在下載時分段
+                        upload_queue.submit(video_info['path'], video_info['name'])
+                        continue
+                    queued = upload_queue.submitted
+                    with span("split", bytes=os.path.getsize(video_info['path'])) as split_span:
+                        split = download_flow.split_and_queue(video_info['path'], video_info['name'])
+                        split_span.set_attribute("split", split)
+                    if split is None and upload_queue.submitted > queued:
+                        # 部分片段已排入上傳，再傳原檔會重複；原檔留待下次重新切割，切點相同，已上傳的片段會略過
+                        resplit = True
+                    elif split is None:
+                        # 切割失敗時上傳原檔
+                        upload_queue.submit(video_info['path'], video_info['name'])
+                if not resplit:
+                    store.transition(job.id, DOWNLOADED, SPLIT)
+            elif job.state in (SPLIT, UPLOADING):
+                # 上次中斷時留在工作目錄、尚未上傳的檔案
+                for video_info in _collect_videos(job.workspace):
+                    upload_queue.submit(video_info['path'], video_info['name'])
+            if not resplit:
+                store.transition(job.id, (SPLIT, UPLOADING), UPLOADING, worker=worker_name())
+        finally:
+            upload_success, _ = upload_queue.close()
+        s.set_attributes(success=upload_success, parts=upload_queue.submitted, resplit=resplit)
+
+    if resplit:
+        store.fail(job.id, DOWNLOADED, "split failed")
+        send_discord(f"❌ 切割失敗：{job.title}\nTwitch：{job.source_url}")
+        return False
+
+    yt_urls = list(store.uploaded_parts(job.id).values())
+    if upload_success and yt_urls and not _collect_videos(job.workspace):
+        store.transition(job.id, UPLOADING, UPLOADED)
+        shutil.rmtree(job.workspace, ignore_errors=True)
+        if admission:
+            admission.release(f"job-{job.id}")
+        logger.info(f"Successfully processed {job.title}.")
+        yt_links = format_yt_links(yt_urls)
+        send_discord(f"✅ 下載並上傳完成：{job.title}\nTwitch：{job.source_url}\n{yt_links}")
+        return True
+
+    # 上傳失敗多半是配額或網路問題，不計入重試次數，下次執行時從剩下的檔案接續
+    store.transition(job.id, UPLOADING, SPLIT, error="upload failed")
+    send_discord(f"❌ 上傳失敗：{job.title}\nTwitch：{job.source_url}")
+    return False
+
+
+def _abandon_download(store, job, admission, error):
+    """下載過程中發生未預期的例外：記錄失敗並釋放預留空間"""
+    try:
+        store.fail(job.id, DETECTED, error)
+    except Exception as e:
+        logger.error(f"Failed to record the failure of job {job.id}: {e}")
+    if admission:
+        try:
+            admission.release(f"job-{job.id}")
+        except Exception as e:
+            logger.error(f"Failed to release the disk reservation of job {job.id}: {e}")
+
+
+def _pipelined_download_upload(
+    jobs, store, playlist_id, prefetch, disk_budget_gb=None, upload_workers=1, segment_mode="sections",
+    admission=None,
+):
+    """
+    下載與上傳重疊進行：上傳第 N 支時同時下載第 N+1 支
+
+    :param jobs: 由舊到新的待處理 job
+    :param prefetch: 最多可以預先下載、等待上傳的影片數
+    :param disk_budget_gb: job 工作目錄使用量超過此值時暫停下載新的影片
+    :param admission: DiskAdmission，剩餘空間不足以放下一支影片時等待上傳釋放空間
+    """
+    stop = threading.Event()
+    # 正在上傳的一支 + 預先下載的 prefetch 支
+    slots = threading.Semaphore(prefetch + 1)
+    finished = {job.id: threading.Event() for job in jobs}
+    deferred = set()
+    budget_bytes = disk_budget_gb * 1024 ** 3 if disk_budget_gb else None
+
+    def producer():
+        try:
+            for job in jobs:
+                try:
+                    while not slots.acquire(timeout=1):
+                        if stop.is_set():
+                            return
+                    # 等待磁碟使用量降到預算以下（已上傳的影片會被刪除）
+                    while budget_bytes and dir_size(store.workspace_root) >= budget_bytes and not stop.is_set():
+                        logger.info(
+                            f"Disk budget reached ({disk_budget_gb} GB), waiting before downloading {job.title}"
+                        )
+                        stop.wait(30)
+                    if stop.is_set():
+                        return
+                    if _download_job(store, job, segment_mode, admission, stop) is None:
+                        deferred.add(job.id)
+                        return
+                except Exception as e:
+                    # 例外不能結束下載執行緒，否則主執行緒會一直等待之後的 job
+                    logger.error(f"Download of {job.title} crashed: {e}")
+                    _abandon_download(store, job, admission, e)
+                finally:
+                    finished[job.id].set()
+        finally:
+            # 下載執行緒提早結束時，主執行緒不能再等待剩下的 job
+            for event in finished.values():
+                event.set()
+
+    # 下載執行緒沿用目前的 trace，download span 與 upload_job span 在同一個 trace 下
+    download_thread = threading.Thread(
+        target=current_context().run, args=(producer,), name="pipeline-download", daemon=True
+    )
+    download_thread.start()
+
+    for job in jobs:
+        finished[job.id].wait()
+        logger.info(f"--- Processing item: {job.title} ---")
+        if job.id in deferred:
+            logger.warning(f"Not enough disk space for {job.title}. Stopping workflow to preserve order.")
+            break
+        downloaded = store.get(job.id).state in (DOWNLOADED, SPLIT, UPLOADING)
+        if not downloaded:
+            logger.error(f"Download failed for {job.title}. Skipping to next item.")
+            slots.release()
+            continue
+
+        upload_success = _upload_job(store, job, playlist_id, upload_workers, admission)
+        slots.release()
+        if not upload_success:
+            logger.error(f"Failed to upload {job.title}. Stopping workflow to preserve order.")
+            stop.set()
+            break
+
+    if stop.is_set() and download_thread.is_alive():
+        # 已預先下載的 job 保持 downloaded 狀態，下次執行時直接上傳
+        logger.info("Waiting for in-flight download to finish...")
+    download_thread.join()
+
+
+def single_url_flow(url, playlist_id, upload_workers=1, segment_mode="sections"):
+    with span("single_url_flow", url=url, upload_workers=upload_workers):
+        _single_url_flow(url, playlist_id, upload_workers, segment_mode)
     clear_empty_data("logs")
 
 
-def single_url_flow(url, playlist_id):
+def _single_url_flow(url, playlist_id, upload_workers, segment_mode):
+    from detection.backends import video_id_from_url
+
     try:
         logger.info(f"Processing single URL: {url}")
-        # 使用 Playwright 獲取 Twitch 影片標題
-        try:
-            from playwright.sync_api import sync_playwright
+        with span("detect", url=url) as s:
+            # 使用 Playwright 獲取 Twitch 影片標題
+            try:
+                from playwright.sync_api import sync_playwright
             
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                page = browser.new_page()
+                with sync_playwright() as p:
+                    browser = p.chromium.launch(headless=True)
+                    page = browser.new_page()
                 
-                # 設置 User-Agent
-                page.set_extra_http_headers({
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
+                    # 設置 User-Agent
+                    page.set_extra_http_headers({
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                    })
                 
-                logger.info(f"Loading page: {url}")
-                page.goto(url, wait_until='networkidle', timeout=30000)
+                    logger.info(f"Loading page: {url}")
+                    page.goto(url, wait_until='networkidle', timeout=30000)
                 
-                # 等待內容載入
-                page.wait_for_timeout(2000)
+                    # 等待內容載入
+                    page.wait_for_timeout(2000)
                 
-                # 使用主要的標題選擇器
-                stream_title_elem = page.query_selector('p[data-a-target="stream-title"]')
-                if stream_title_elem:
-                    stream_title = stream_title_elem.text_content().strip()
-                    if stream_title:
-                        logger.info(f"Successfully extracted title: {stream_title}")
-                        browser.close()
-                        # 這裡不能 return，需要繼續執行下載流程
+                    # 使用主要的標題選擇器
+                    stream_title_elem = page.query_selector('p[data-a-target="stream-title"]')
+                    if stream_title_elem:
+                        stream_title = stream_title_elem.text_content().strip()
+                        if stream_title:
+                            logger.info(f"Successfully extracted title: {stream_title}")
+                            browser.close()
+                            # 這裡不能 return，需要繼續執行下載流程
+                        else:
+                            browser.close()
+                            raise ValueError('Stream title element is empty')
                     else:
                         browser.close()
-                        raise ValueError('Stream title element is empty')
-                else:
-                    browser.close()
-                    raise ValueError('Stream title element not found')
+                        raise ValueError('Stream title element not found')
                 
-        except Exception as e:
-            logger.error(f"Failed to fetch stream title with Playwright: {e}")
-            stream_title = f"video_{int(time.time())}"
+            except Exception as e:
+                logger.error(f"Failed to fetch stream title with Playwright: {e}")
+                stream_title = f"video_{int(time.time())}"
+            s.set_attribute("title", stream_title)
         logger.info(f"Using stream title for filename: {stream_title}")
-        # 交給 DownloadFlow 處理檔名合法化
-        detection_item = {stream_title: url}
-        download_flow = DownloadFlow(detection_item)
-        logger.info(f"Running download flow for single URL, title: {stream_title}")
-        if download_flow.run():
-            # 下載完直接呼叫 upload_existing_videos
-            upload_success, yt_urls = upload_existing_videos(playlist_id)
-            if upload_success:
-                if len(yt_urls) == 1:
-                    yt_links = f"YouTube：{yt_urls[0]}"
-                elif yt_urls:
-                    yt_links = "\n".join(f"YouTube ({i+1})：{u}" for i, u in enumerate(yt_urls))
-                else:
-                    yt_links = "（無 YouTube 連結）"
-                send_discord(f"✅ 下載並上傳完成：{stream_title}\nTwitch：{url}\n{yt_links}")
+        store = JobStore()
+        admission = DiskAdmission(db_path=store.db_path)
+        try:
+            job = store.add_job("vod", url, stream_title, seq=_vod_seq(video_id_from_url(url)))
+            if job.state == UPLOADED:
+                logger.info(f"{url} was already uploaded, skipping")
+            elif job.state == FAILED:
+                logger.warning(f"{url} failed {job.attempts} times before, skipping")
+            elif _download_job(store, job, segment_mode, admission):
+                # 切割出的每個片段寫完就立即上傳
+                _upload_job(store, job, playlist_id, upload_workers, admission)
             else:
-                send_discord(f"❌ 上傳失敗：{stream_title}\nTwitch：{url}")
-        else:
-            logger.error(f"Download failed for {stream_title}. Skipping upload.")
-            send_discord(f"❌ 下載失敗：{stream_title}\nTwitch：{url}")
+                logger.error(f"Download failed for {stream_title}. Skipping upload.")
+        finally:
+            admission.close()
+            store.close()
     except Exception as e:
         logger.error(f"An error occurred in single_url_flow: {e}")
-    clear_empty_data("logs")
-
 
-def upload_existing_videos(playlist_id):
-    upload_flow = UploadFlow()
-    all_success = True
-    youtube_urls = []
 
-    # 獲取所有需要上傳的影片（包含切割片段）
+def _collect_videos(root):
+    """
+    收集目錄中所有待上傳的影片（包含切割片段）
+    只進入 _segments 目錄，多頻道監控的頻道目錄與錄影中的檔案由 supervisor 自行處理
+    """
     videos_to_upload = []
-    
-    for item in os.listdir(videos_root):
-        item_path = os.path.join(videos_root, item)
-        
+
+    for item in sorted(os.listdir(root)):
+        item_path = os.path.join(root, item)
+
         if os.path.isfile(item_path) and item.endswith('.mp4'):
             # 這是一個普通的影片檔案
             videos_to_upload.append({
@@ -177,7 +476,7 @@ def upload_existing_videos(playlist_id):
             logger.info(f"Found segments directory: {item}")
             segment_files = [f for f in os.listdir(item_path) if f.endswith('.mp4')]
             segment_files.sort()  # 確保按順序上傳
-            
+
             for segment_file in segment_files:
                 segment_path = os.path.join(item_path, segment_file)
                 videos_to_upload.append({
@@ -185,6 +484,45 @@ def upload_existing_videos(playlist_id):
                     'name': segment_file.split(".mp4")[0],
                     'type': 'segment'
                 })
+
+    return videos_to_upload
+
+
+def _remove_empty_dirs(root):
+    """清理空的 segments 目錄"""
+    for item in os.listdir(root):
+        item_path = os.path.join(root, item)
+        if os.path.isdir(item_path) and item.endswith('_segments'):
+            try:
+                if not os.listdir(item_path):  # 如果目錄是空的
+                    os.rmdir(item_path)
+                    logger.info(f"Removed empty segments directory: {item_path}")
+            except Exception as e:
+                logger.error(f"Error removing segments directory {item_path}: {e}")
+
+
+def upload_existing_videos(playlist_id, videos_dir=videos_root, on_uploaded=None):
+    """
+    上傳目錄中的所有影片，上傳成功的檔案會被刪除
+
+    :param on_uploaded: 每支影片上傳後呼叫 on_uploaded(path, yt_url)，用來記錄到 job store
+    :return: (是否全部上傳成功, YouTube 連結列表)
+    """
+    with span("upload_existing_videos", videos_dir=videos_dir) as s:
+        success, youtube_urls = _upload_existing_videos(playlist_id, videos_dir, on_uploaded)
+        s.set_attributes(success=success, uploaded=len(youtube_urls))
+    return success, youtube_urls
+
+
+def _upload_existing_videos(playlist_id, videos_dir, on_uploaded):
+    from uploader import UploadFlow
+
+    upload_flow = UploadFlow()
+    all_success = True
+    youtube_urls = []
+
+    # 獲取所有需要上傳的影片（包含切割片段）
+    videos_to_upload = _collect_videos(videos_dir)
     
     # 上傳所有影片
     if not videos_to_upload:
@@ -201,6 +539,8 @@ def upload_existing_videos(playlist_id):
 
         if yt_url:
             youtube_urls.append(yt_url)
+            if on_uploaded:
+                on_uploaded(video_info['path'], yt_url)
             os.remove(video_info['path'])  # 只有上傳成功才刪除
             logger.info(f"Successfully uploaded and removed: {video_info['path']}")
         else:
@@ -208,84 +548,302 @@ def upload_existing_videos(playlist_id):
             all_success = False
     
     # 清理空的 segments 目錄
-    for item in os.listdir(videos_root):
-        item_path = os.path.join(videos_root, item)
-        if os.path.isdir(item_path) and item.endswith('_segments'):
-            try:
-                if not os.listdir(item_path):  # 如果目錄是空的
-                    os.rmdir(item_path)
-                    logger.info(f"Removed empty segments directory: {item_path}")
-            except Exception as e:
-                logger.error(f"Error removing segments directory {item_path}: {e}")
+    _remove_empty_dirs(videos_dir)
                 
     clear_empty_data("logs")
-    success = all_success and (len(videos_to_upload) > 0 or not os.listdir(videos_root))
+    success = all_success and (len(videos_to_upload) > 0 or not os.listdir(videos_dir))
     return success, youtube_urls
 
 
-def live_monitor_flow(channel_name, playlist_id, check_interval=30):
+def _process_recording(store, job, playlist_id, video_processor):
+    """
+    錄影 job 的後處理：downloaded -> uploading -> uploaded
+    轉檔（超過 10 小時同時切割）後上傳工作目錄中的影片；上傳失敗時退回 downloaded，下次啟動時接續
+
+    :return: (是否全部上傳成功, YouTube 連結列表)
+    """
+    channel_name = job.channel
+    for name in sorted(workspace_files(job.workspace)):
+        if not name.endswith((".ts", ".fmp4")):
+            continue
+        ts_path = os.path.join(job.workspace, name)
+        logger.info("Recording finished. Remuxing to MP4...")
+        # Remux to MP4, splitting long recordings into parts in the same pass
+        with span("remux", bytes=os.path.getsize(ts_path)) as s:
+            parts = video_processor.remux_to_parts(ts_path, job.workspace, max_part_hours=10)
+            s.set_attribute("parts", len(parts))
+        if not parts:
+            logger.error("Remuxing failed. Keeping TS file.")
+            send_discord(f"❌ {channel_name} 錄製後轉檔失敗")
+            store.fail(job.id, DOWNLOADED, "remux failed")
+            return False, []
+        # Remove the original TS file (a fragmented MP4 was renamed in place)
+        if os.path.exists(ts_path):
+            os.remove(ts_path)
+
+    logger.info("Remuxing successful and TS file removed. Starting upload...")
+    store.transition(job.id, DOWNLOADED, UPLOADING, worker=worker_name())
+    upload_success, yt_urls = upload_existing_videos(
+        playlist_id, job.workspace,
+        on_uploaded=lambda path, yt_url: store.record_upload(job.id, os.path.basename(path), yt_url),
+    )
+    if upload_success:
+        store.transition(job.id, UPLOADING, UPLOADED)
+        shutil.rmtree(job.workspace, ignore_errors=True)
+        send_discord(f"✅ {channel_name} 直播錄製並上傳完成\n{format_yt_links(yt_urls)}")
+    else:
+        # 保留已轉檔的 MP4，下次啟動時重新上傳
+        store.transition(job.id, UPLOADING, DOWNLOADED, error="upload failed")
+        send_discord(f"❌ {channel_name} 直播錄製完成但上傳失敗")
+    return upload_success, yt_urls
+
+
+def _reserve_recording(admission, job, duration, copies, streams=None):
+    """
+    直播錄影以 LIVE 優先權預留磁碟空間，空間不足時仍會准入
+
+    :param streams: 檢查時解析好的 Streamlink 串流，用來取得位元率
+    :return: 預留的 key，release 時使用
+    """
+    from downloader.recorder import stream_bitrate
+
+    key = f"recording-{job.channel}-{job.seq}"
+    nbytes = estimate_footprint(duration, stream_bitrate(streams), copies=copies)
+    admission.acquire(key, nbytes, LIVE, workspace=job.workspace)
+    return key
+
+
+def record_and_upload_segments(
+    store, recorder, channel_name, channel_url, playlist_id, segment_hours, admission=None, streams=None
+):
+    """
+    邊錄邊傳：直播錄成固定長度的片段，每段完成後立即轉檔並排入上傳，等上傳全部完成才返回
+    整場錄影是一個 recording job，已上傳的片段記錄在 job store
+
+    :param admission: DiskAdmission，錄影前預留磁碟空間，上傳結束後釋放
+    :param streams: 檢查時解析好的 Streamlink 串流，用來估計磁碟用量
+    :return: (錄製是否成功, 上傳是否全部成功, YouTube 連結列表)
+    """
+    job = start_recording_job(store, channel_name, channel_url)
+    # 片段上傳前會同時存在 .ts 與 .mp4
+    key = _reserve_recording(admission, job, segment_hours * 3600, 2, streams) if admission else None
+    try:
+        recorded, upload_queue = record_segments(
+            recorder, channel_name, channel_url, job.workspace, playlist_id, segment_hours,
+            on_uploaded=lambda path, yt_url: store.record_upload(job.id, os.path.basename(path), yt_url),
+        )
+        upload_success, yt_urls = upload_queue.close()
+        finish_segmented_job(store, job, recorded, upload_success)
+    finally:
+        if key:
+            admission.release(key)
+    return recorded, upload_success, yt_urls
+
+
+def record_segments(recorder, channel_name, channel_url, output_dir, playlist_id, segment_hours, on_uploaded=None):
+    """
+    邊錄邊傳的錄影部分：錄影結束即返回，還沒傳完的片段留在 upload_queue
+
+    :param on_uploaded: 每個片段上傳後呼叫 on_uploaded(path, yt_url)，用來記錄到 job store
+    :return: (錄製是否成功, UploadQueue)；呼叫端負責 upload_queue.close()
+    """
+    from uploader import UploadQueue
+
+    upload_queue = UploadQueue(playlist_id, on_uploaded=on_uploaded)
+    base_name = f"{channel_name}_{int(time.time())}"
+
+    def on_segment(ts_part):
+        mp4_part = os.path.splitext(ts_part)[0] + ".mp4"
+        if recorder.remux_video(ts_part, mp4_part):
+            os.remove(ts_part)
+            logger.info(f"Part finished, queued for upload: {mp4_part}")
+            upload_queue.submit(mp4_part, os.path.basename(mp4_part).split(".mp4")[0])
+        else:
+            logger.error(f"Remuxing failed for {ts_part}. Keeping TS file.")
+
+    with span("record", channel=channel_name, format="segmented", segment_hours=segment_hours) as s:
+        success = recorder.start_segmented_recording(
+            channel_url, output_dir, base_name, int(segment_hours * 3600), on_segment
+        )
+        s.set_attributes(success=success, parts=upload_queue.submitted)
+    return success and upload_queue.submitted > 0, upload_queue
+
+
+def _start_push_listener(channel_name, pushed):
+    """EventSub 開台通知會設定 pushed；無法啟動時回傳 None，只使用輪詢"""
+    from detection.eventsub import EventSubListener, EventSubError
+
+    listener = EventSubListener([channel_name], on_online=lambda name, event: pushed.set())
+    try:
+        listener.start()
+    except EventSubError as e:
+        logger.error(f"EventSub disabled, falling back to polling: {e}")
+        return None
+    return listener
+
+
+def _resolve_pushed_stream(monitor, channel_url):
+    """EventSub 通知可能比播放清單早送達，解析失敗時每隔幾秒重試，超過時限才交回排程"""
+    from detection.eventsub import PUSH_RETRY_INTERVAL, PUSH_RETRY_WINDOW
+
+    deadline = time.monotonic() + PUSH_RETRY_WINDOW
+    stream_info = monitor.check_live_status(channel_url)
+    while not stream_info and time.monotonic() < deadline:
+        time.sleep(PUSH_RETRY_INTERVAL)
+        stream_info = monitor.check_live_status(channel_url)
+    return stream_info
+
+
+def live_monitor_flow(
+    channel_name, playlist_id, check_interval=30, segment_hours=None, eventsub=False, record_format="ts"
+):
+    from detection.eventsub import FALLBACK_POLL_INTERVAL
+    from detection.monitor import StreamMonitor
+    from downloader.recorder import StreamRecorder
+    from utils import VideoProcessor
+
     monitor = StreamMonitor()
+    scheduler = AdaptivePollScheduler(base_interval=check_interval)
     recorder = StreamRecorder()
+    video_processor = VideoProcessor()
     channel_url = f"https://www.twitch.tv/{channel_name}"
+    pushed = threading.Event()
+    listener = _start_push_listener(channel_name, pushed) if eventsub else None
+    store = JobStore()
+    admission = DiskAdmission(db_path=store.db_path)
+
+    # 上次中斷時已錄完、還沒上傳完的錄影先接續處理
+    recovered = store.recover("recording")
+    if recovered:
+        logger.info(f"Recovered {recovered} interrupted recording jobs")
+    for job in store.pending_jobs(kind="recording", channel=channel_name):
+        if job.state == DOWNLOADED:
+            logger.info(f"Resuming unfinished recording job {job.id}")
+            _process_recording(store, job, playlist_id, video_processor)
+
+    def wait_for_next_check():
+        interval = scheduler.next_interval(channel_name)
+        if listener and listener.is_healthy(channel_name):
+            interval = max(interval, FALLBACK_POLL_INTERVAL)
+        pushed.wait(interval)
     
     logger.info(f"Starting live monitor for channel: {channel_name}")
     
     while True:
         try:
-            # Check if channel is live
-            stream_info = monitor.check_live_status(channel_url)
+            # Cheap batched probe first; only resolve streams once the channel is live
+            # An EventSub notification skips the probe and resolves the stream right away
+            was_pushed = pushed.is_set()
+            pushed.clear()
+            with span("live.check", channel=channel_name, pushed=was_pushed) as s:
+                probe_result = None if was_pushed else monitor.probe_channels([channel_name]).get(channel_name)
+                if probe_result and not probe_result.live and not probe_result.error:
+                    stream_info = None
+                    scheduler.record_offline(channel_name)
+                elif was_pushed:
+                    stream_info = _resolve_pushed_stream(monitor, channel_url)
+                else:
+                    if probe_result is None or probe_result.error:
+                        scheduler.record_error(channel_name)
+                    stream_info = monitor.check_live_status(channel_url)
+                s.set_attribute("live", bool(stream_info))
             
             if stream_info:
+                scheduler.record_live(channel_name, probe_result.started_at if probe_result else None)
                 logger.info(f"{channel_name} is LIVE! Preparing to record...")
                 send_discord(f"🔴 {channel_name} 開始直播，準備錄製...")
+
+                if segment_hours:
+                    # Upload each finished part while the next one records
+                    recorded, upload_success, yt_urls = record_and_upload_segments(
+                        store, recorder, channel_name, channel_url, playlist_id, segment_hours,
+                        admission=admission, streams=stream_info,
+                    )
+                    if not recorded:
+                        send_discord(f"❌ {channel_name} 錄製失敗，無法產生檔案")
+                    elif upload_success:
+                        send_discord(f"✅ {channel_name} 直播錄製並上傳完成\n{format_yt_links(yt_urls)}")
+                    else:
+                        send_discord(f"❌ {channel_name} 直播錄製完成但上傳失敗")
+                    wait_for_next_check()
+                    continue
                 
-                # Create a filename based on timestamp
-                timestamp = int(time.time())
-                ts_filename = f"{channel_name}_{timestamp}.ts"
-                mp4_filename = f"{channel_name}_{timestamp}.mp4"
-                ts_path = os.path.join(videos_root, ts_filename)
-                output_path = os.path.join(videos_root, mp4_filename)
-                
-                # Start recording to .ts (resilient to interruption)
-                success = recorder.start_recording(channel_url, ts_path)
-                
-                if success and os.path.exists(ts_path):
-                    logger.info("Recording finished. Remuxing to MP4...")
-                    
-                    # Remux to MP4
-                    remux_success = recorder.remux_video(ts_path, output_path)
-                    
-                    if remux_success:
-                        # Remove the original TS file
-                        os.remove(ts_path)
-                        logger.info("Remuxing successful and TS file removed. Starting upload...")
-                        # Upload the recorded file
-                        upload_success, yt_urls = upload_existing_videos(playlist_id)
-                        if upload_success:
-                            if len(yt_urls) == 1:
-                                yt_links = f"YouTube：{yt_urls[0]}"
-                            elif yt_urls:
-                                yt_links = "\n".join(f"YouTube ({i+1})：{u}" for i, u in enumerate(yt_urls))
-                            else:
-                                yt_links = "（無 YouTube 連結）"
-                            send_discord(f"✅ {channel_name} 直播錄製並上傳完成\n{yt_links}")
+                # Each recording is a job with its own workspace
+                job = start_recording_job(store, channel_name, channel_url)
+                ts_path = os.path.join(job.workspace, f"{job.title}.{record_format}")
+                # Live length is unknown; a .ts coexists with its MP4 while remuxing, a fragmented MP4 does not
+                key = _reserve_recording(
+                    admission, job, DEFAULT_DURATION_HOURS * 3600, 1 if record_format == "fmp4" else 2, stream_info
+                )
+                try:
+                    # Start recording to .ts or fragmented MP4 (both resilient to interruption),
+                    # reusing the resolved stream
+                    with span("record", channel=channel_name, format=record_format) as s:
+                        if record_format == "fmp4":
+                            success = recorder.record_fragmented(channel_url, ts_path, stream_info)
                         else:
-                            send_discord(f"❌ {channel_name} 直播錄製完成但上傳失敗")
+                            success = recorder.record(channel_url, ts_path, stream_info)
+                        s.set_attributes(success=success, bytes=file_size(ts_path))
+
+                    if success and os.path.exists(ts_path):
+                        store.transition(job.id, DOWNLOADING, DOWNLOADED)
+                        _process_recording(store, store.get(job.id), playlist_id, video_processor)
                     else:
-                        logger.error("Remuxing failed. Keeping TS file.")
-                        send_discord(f"❌ {channel_name} 錄製後轉檔失敗")
-                else:
-                    logger.warning("Recording finished but no file created or failed.")
-                    send_discord(f"❌ {channel_name} 錄製失敗，無法產生檔案")
+                        logger.warning("Recording finished but no file created or failed.")
+                        store.transition(job.id, DOWNLOADING, FAILED, error="recording failed")
+                        send_discord(f"❌ {channel_name} 錄製失敗，無法產生檔案")
+                finally:
+                    admission.release(key)
             else:
                 # logger.info(f"{channel_name} is offline. Checking again in {check_interval}s...")
                 pass
             
-            time.sleep(check_interval)
+            wait_for_next_check()
             
         except KeyboardInterrupt:
             logger.info("Monitor stopped by user.")
             break
         except Exception as e:
             logger.error(f"Error in live_monitor_flow: {e}")
-            time.sleep(check_interval)
+            scheduler.record_error(channel_name)
+            wait_for_next_check()
+
+    if listener:
+        listener.stop()
+    admission.close()
+    store.close()
+
+
+def multi_channel_monitor_flow(config_path, playlist_id, eventsub=False, record_format=None):
+    from supervisor import MonitorSupervisor, load_monitor_config
+
+    try:
+        channels, options = load_monitor_config(config_path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load monitor config {config_path}: {e}")
+        return
+
+    if not channels:
+        logger.error(f"No channels configured in {config_path}")
+        return
+    if eventsub:
+        options.setdefault("eventsub", {})
+    if record_format:
+        options["record_format"] = record_format
+
+    store = JobStore()
+    supervisor = MonitorSupervisor(
+        channels,
+        upload_fn=upload_existing_videos,
+        segmented_record_fn=record_segments,
+        playlist_id=playlist_id,
+        videos_root=videos_root,
+        job_store=store,
+        **options,
+    )
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        logger.info("Monitor stopped by user.")
+    finally:
+        store.close()
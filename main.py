@@ -2,26 +2,81 @@ import os
 import argparse
 import dotenv
 from utils import setup_logger
-from flows import auto_detect_and_upload, single_url_flow, upload_existing_videos, live_monitor_flow
+from utils.logger import set_json_output
+from utils.tracing import configure_tracing
 
 dotenv.load_dotenv()
 
 logger = setup_logger("log")
-videos_root = "downloader/videos/"
 playlist_id = os.getenv("PLAYLIST")
 
+
+def run(args):
+    # 每個模式只載入自己的流程與相依套件，argparse 之前不載入任何大型套件
+    if args.url:
+        from flows import single_url_flow
+
+        single_url_flow(
+            args.url, playlist_id, upload_workers=args.upload_workers, segment_mode=args.segment_mode
+        )
+    elif args.monitor:
+        from flows import live_monitor_flow
+
+        live_monitor_flow(
+            args.monitor,
+            playlist_id,
+            segment_hours=args.segment_hours,
+            eventsub=args.eventsub,
+            record_format=args.record_format or 'ts',
+        )
+    elif args.monitor is not None:
+        from flows import multi_channel_monitor_flow
+
+        multi_channel_monitor_flow(
+            args.config, playlist_id, eventsub=args.eventsub, record_format=args.record_format
+        )
+    else:
+        # 遺留在 videos 目錄的檔案會先成為 upload job 上傳，再偵測新的 VOD
+        from flows import auto_detect_and_upload
+
+        auto_detect_and_upload(
+            playlist_id,
+            prefetch=args.prefetch,
+            disk_budget_gb=args.disk_budget_gb,
+            upload_workers=args.upload_workers,
+            segment_mode=args.segment_mode,
+        )
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--url', type=str, help='Download and upload a single video by URL')
-    parser.add_argument('--monitor', type=str, help='Continuously monitor and record a Twitch channel by name')
+    parser.add_argument('--monitor', type=str, nargs='?', const='', help='Continuously monitor and record a Twitch channel by name (omit the name to monitor every channel in --config)')
+    parser.add_argument('--segment-hours', type=float, default=None, help='With --monitor, record in parts of this many hours and upload each part as soon as it finishes')
+    parser.add_argument('--prefetch', type=int, default=0, help='Number of VODs to download ahead while uploading (0 = sequential)')
+    parser.add_argument('--disk-budget-gb', type=float, default=None, help='Pause prefetching while downloader/videos uses more than this many GB')
+    parser.add_argument('--upload-workers', type=int, default=1, help='Number of split parts to upload in parallel')
+    parser.add_argument('--segment-mode', choices=['sections', 'stream'], default='sections', help='How VODs over 10 hours are downloaded: resumable per-part sections, or one stream piped into the segmenter')
+    parser.add_argument('--eventsub', action='store_true', help='With --monitor, get go-live notifications over Twitch EventSub (needs TWITCH_CLIENT_ID and TWITCH_ACCESS_TOKEN); polling stays on as a fallback')
+    parser.add_argument('--record-format', choices=['ts', 'fmp4'], default=None, help='With --monitor, record to .ts and remux afterwards, or straight to fragmented MP4 with no remux pass (default: ts, or record_format in --config)')
+    parser.add_argument('--config', type=str, default='channels.json', help='Channel list used by --monitor without a channel name')
+    parser.add_argument('--trace', type=str, nargs='?', const='logs/trace.jsonl', default=None, help='Write a timed span for every stage (detection, download, probe, split, upload, playlist insert, notification) as OpenTelemetry JSON lines to this file (default: logs/trace.jsonl, or TRACE_FILE)')
+    parser.add_argument('--profile', type=str, nargs='?', const='profile.pstats', default=None, help='Run under cProfile, save the stats to this file (default: profile.pstats) and print the top functions by cumulative time; worker threads are not profiled')
+    parser.add_argument('--log-json', action='store_true', help='Write logs as one JSON object per line, including structured progress events (same as LOG_FORMAT=json)')
     args = parser.parse_args()
-    if args.url:
-        single_url_flow(args.url, playlist_id)
-    elif args.monitor:
-        live_monitor_flow(args.monitor, playlist_id)
+    if args.log_json:
+        set_json_output()
+    configure_tracing(args.trace)
+    if args.profile:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(run, args)
+        finally:
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
+            logger.info(f"Profile saved to {args.profile}")
     else:
-        videos = [f for f in os.listdir(videos_root) if not f.startswith('.')]
-        if not videos:
-            auto_detect_and_upload(playlist_id)
-        else:
-            upload_existing_videos(playlist_id)
+        run(args)
@@ -0,0 +1,562 @@
+import asyncio
+import inspect
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from detection.monitor import StreamMonitor
+from detection.eventsub import (
+    EventSubListener, EventSubError, FALLBACK_POLL_INTERVAL, PUSH_RETRY_INTERVAL, PUSH_RETRY_WINDOW,
+)
+from detection.probe import LiveProbe, ProbeResult, create_probe
+from detection.schedule import AdaptivePollScheduler
+from downloader.recorder import StreamRecorder, stream_bitrate
+from utils import setup_logger, send_discord, format_yt_links, VideoProcessor
+from utils.job_store import (
+    DOWNLOADING, DOWNLOADED, UPLOADING, UPLOADED, FAILED, worker_name, start_recording_job, finish_segmented_job,
+)
+from utils.disk_usage import file_size
+from utils.disk_admission import DiskAdmission, LIVE, DEFAULT_DURATION_HOURS, estimate_footprint
+from utils.tracing import span
+
+logger = setup_logger("log")
+
+
+@dataclass
+class ChannelConfig:
+    """設定檔中單一頻道的設定"""
+
+    name: str
+    playlist_id: Optional[str] = None
+    check_interval: Optional[int] = None
+    segment_hours: Optional[float] = None
+
+
+@dataclass
+class ChannelState:
+    """單一頻道在 supervisor 中的執行狀態"""
+
+    name: str
+    status: str = "offline"  # offline / starting / recording
+    last_check: float = 0.0
+    last_live: Optional[float] = None
+    current_file: Optional[str] = None
+    consecutive_errors: int = 0
+    stream_id: Optional[str] = None
+    started_at: Optional[str] = None
+    recordings: int = 0
+    pending_jobs: int = 0
+
+
+def load_monitor_config(config_path):
+    """
+    讀取多頻道監控設定檔
+
+    格式：
+        {
+            "check_interval": 30,
+            "max_concurrent_checks": 8,
+            "max_concurrent_recordings": 10,
+            "max_concurrent_uploads": 2,
+            "min_free_gb": 5,
+            "adaptive_polling": true,
+            "eventsub": {},
+            "record_format": "fmp4",
+            "probe": {"kind": "gql"},
+            "segment_hours": 2,
+            "channels": ["shxtou", {"name": "dexterityboost", "playlist_id": "PL..."}]
+        }
+
+    :param config_path: JSON 設定檔路徑
+    :return: (channels, options)
+    :raises ValueError: 設定檔有 MonitorSupervisor 不支援的選項
+    """
+    with open(config_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    channels = []
+    for entry in data.get("channels", []):
+        if isinstance(entry, str):
+            channels.append(ChannelConfig(name=entry))
+        elif isinstance(entry, dict) and entry.get("name"):
+            channels.append(
+                ChannelConfig(
+                    name=entry["name"],
+                    playlist_id=entry.get("playlist_id"),
+                    check_interval=entry.get("check_interval"),
+                    segment_hours=entry.get("segment_hours"),
+                )
+            )
+        else:
+            logger.warning(f"Ignoring invalid channel entry in {config_path}: {entry}")
+
+    options = {k: v for k, v in data.items() if k != "channels"}
+    unknown = sorted(set(options) - _config_options())
+    if unknown:
+        raise ValueError(f"Unknown option(s) in {config_path}: {', '.join(unknown)}")
+    return channels, options
+
+
+# 由呼叫端傳入、不能寫在設定檔中的 MonitorSupervisor 參數
+_RUNTIME_ARGUMENTS = {"self", "channels", "upload_fn", "segmented_record_fn", "playlist_id", "videos_root", "job_store"}
+
+
+def _config_options():
+    """設定檔可以使用的選項：MonitorSupervisor 的其餘參數"""
+    return set(inspect.signature(MonitorSupervisor.__init__).parameters) - _RUNTIME_ARGUMENTS
+
+
+class MonitorSupervisor:
+    def __init__(
+        self,
+        channels: List[ChannelConfig],
+        upload_fn: Callable,
+        segmented_record_fn: Optional[Callable] = None,
+        playlist_id: Optional[str] = None,
+        videos_root: str = "downloader/videos/",
+        check_interval: int = 30,
+        max_concurrent_checks: int = 8,
+        max_concurrent_recordings: int = 10,
+        max_concurrent_remuxes: int = 2,
+        max_concurrent_uploads: int = 2,
+        probe=None,
+        segment_hours: Optional[float] = None,
+        job_store=None,
+        min_free_gb: float = 5,
+        adaptive_polling: bool = True,
+        eventsub: Optional[dict] = None,
+        eventsub_fallback_interval: int = FALLBACK_POLL_INTERVAL,
+        record_format: str = "ts",
+    ):
+        """
+        在單一 process 中以 asyncio task 監控多個頻道
+
+        :param channels: 要監控的頻道設定
+        :param upload_fn: 上傳函式，簽名為 upload_fn(playlist_id, videos_dir, on_uploaded=None) -> (success, urls)，
+            on_uploaded(path, yt_url) 在每支影片上傳後呼叫
+        :param playlist_id: 頻道未指定 playlist 時使用的預設 playlist
+        :param videos_root: 錄影根目錄，每個頻道使用自己的子目錄
+        :param check_interval: 預設的檢查間隔（秒）
+        :param segmented_record_fn: 邊錄邊傳函式，簽名為
+            fn(recorder, channel_name, channel_url, output_dir, playlist_id, segment_hours, on_uploaded=None)
+            -> (recorded, upload_queue)；錄影結束即返回，剩下的上傳由 supervisor 等待
+        :param segment_hours: 設定後直播會切成此長度的片段，每段完成即上傳
+        :param probe: LiveProbe 實例或 create_probe 的參數 dict，預設使用 GQL 批次探測
+        :param job_store: JobStore，設定後每場錄影是一個 job，重啟時接續未完成的轉檔與上傳
+        :param min_free_gb: 磁碟永遠保留的剩餘空間，錄影開始前會預留估計用量
+        :param adaptive_polling: 依各頻道過去的開台時間調整檢查間隔，關閉時固定使用 check_interval
+        :param eventsub: 設定後以 EventSub WebSocket 接收開台通知，內容為 EventSubListener 的參數 dict，
+            空 dict 表示從環境變數 TWITCH_CLIENT_ID / TWITCH_ACCESS_TOKEN 讀取憑證
+        :param eventsub_fallback_interval: EventSub 連線正常時，輪詢只作為備援的檢查間隔（秒）
+        :param record_format: "ts" 錄成 .ts 後轉檔；"fmp4" 直接錄成 fragmented MP4，不需要轉檔
+        """
+        self.channels = channels
+        self.upload_fn = upload_fn
+        self.segmented_record_fn = segmented_record_fn
+        self.segment_hours = segment_hours
+        self.playlist_id = playlist_id
+        self.videos_root = videos_root
+        self.check_interval = check_interval
+        self.max_concurrent_checks = max_concurrent_checks
+        self.max_concurrent_recordings = max_concurrent_recordings
+        self.max_concurrent_remuxes = max_concurrent_remuxes
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.job_store = job_store
+        self.record_format = record_format
+        self.admission = DiskAdmission(
+            path=videos_root, min_free_gb=min_free_gb, db_path=job_store.db_path if job_store else "jobs.db",
+        )
+        self.scheduler = AdaptivePollScheduler(base_interval=check_interval) if adaptive_polling else None
+
+        if isinstance(probe, dict):
+            probe = create_probe(**probe)
+        self.monitor = StreamMonitor(probe=probe if isinstance(probe, LiveProbe) else None)
+        self.recorder = StreamRecorder()
+        self.video_processor = VideoProcessor()
+        self.states: Dict[str, ChannelState] = {
+            channel.name: ChannelState(name=channel.name) for channel in channels
+        }
+        self._background: set = set()
+        self._live_tasks: Dict[str, asyncio.Task] = {}
+        self.eventsub_options = eventsub
+        self.eventsub_fallback_interval = eventsub_fallback_interval
+        self.eventsub: Optional[EventSubListener] = None
+
+    async def run(self):
+        # Semaphore / Lock 必須在 event loop 內建立
+        self._check_sem = asyncio.Semaphore(self.max_concurrent_checks)
+        self._record_sem = asyncio.Semaphore(self.max_concurrent_recordings)
+        self._remux_sem = asyncio.Semaphore(self.max_concurrent_remuxes)
+        self._upload_sem = asyncio.Semaphore(self.max_concurrent_uploads)
+        self._process_locks = {channel.name: asyncio.Lock() for channel in self.channels}
+
+        logger.info(
+            f"Starting supervisor for {len(self.channels)} channels: "
+            f"{', '.join(channel.name for channel in self.channels)}"
+        )
+        self._resume_jobs()
+        self._start_eventsub()
+        poll_task = asyncio.create_task(self._poll_loop(), name="poll")
+        try:
+            await poll_task
+        finally:
+            poll_task.cancel()
+            if self.eventsub:
+                self.eventsub.stop()
+            for task in list(self._live_tasks.values()):
+                task.cancel()
+            if self._background:
+                logger.info(f"Waiting for {len(self._background)} processing jobs to finish...")
+                await asyncio.gather(*self._background, return_exceptions=True)
+
+    def _start_eventsub(self):
+        """啟動 EventSub 監聽；失敗時只使用輪詢"""
+        if self.eventsub_options is None:
+            return
+        loop = asyncio.get_running_loop()
+        listener = EventSubListener(
+            [channel.name for channel in self.channels],
+            on_online=lambda name, event: loop.call_soon_threadsafe(self._handle_push, name, event),
+            **self.eventsub_options,
+        )
+        try:
+            listener.start()
+        except EventSubError as e:
+            logger.error(f"EventSub disabled, falling back to polling: {e}")
+            return
+        self.eventsub = listener
+
+    def _handle_push(self, channel_name, event):
+        """EventSub 開台通知，與輪詢探測到開台的處理相同"""
+        channel = next((c for c in self.channels if c.name.lower() == channel_name), None)
+        if channel is None or self.states[channel.name].status != "offline":
+            return
+        result = ProbeResult(channel.name, True, stream_id=event.get("id"), started_at=event.get("started_at"))
+        self._handle_probe(channel, result, pushed=True)
+
+    def _resume_jobs(self):
+        """重新排入上次中斷時已錄完、尚未上傳的錄影"""
+        if not self.job_store:
+            return
+        recovered = self.job_store.recover("recording")
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted recording jobs")
+        channels = {channel.name: channel for channel in self.channels}
+        for job in self.job_store.pending_jobs(kind="recording"):
+            channel = channels.get(job.channel)
+            if channel is None or job.state != DOWNLOADED:
+                continue
+            logger.info(f"[{job.channel}] Resuming unfinished recording job {job.id}")
+            self._spawn_process(channel, self.states[channel.name], job)
+
+    def _spawn_process(self, channel: ChannelConfig, state: ChannelState, recording, reservation_key=None):
+        # 後處理在背景進行，頻道可立即回到輪詢
+        self._spawn(self._process(channel, state, recording, reservation_key), f"process-{channel.name}")
+
+    def _spawn(self, coro, name):
+        task = asyncio.create_task(coro, name=name)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def channel_dir(self, channel_name):
+        return os.path.join(self.videos_root, channel_name)
+
+    def _interval(self, channel: ChannelConfig):
+        base = channel.check_interval or self.check_interval
+        # 只有訂閱成功的頻道能收到開台通知，其他頻道照常輪詢
+        if self.eventsub and self.eventsub.is_healthy(channel.name):
+            return max(base, self.eventsub_fallback_interval)
+        if self.scheduler is None:
+            return base
+        return self.scheduler.next_interval(channel.name, base_interval=base)
+
+    async def _poll_loop(self):
+        """所有到期的頻道合併成一個批次探測請求"""
+        next_due = {channel.name: 0.0 for channel in self.channels}
+        # 各頻道的間隔加了隨機偏移，快到期的頻道一起併入這次批次，避免請求數變多
+        slack = self.scheduler.min_interval / 2 if self.scheduler else 0
+
+        while True:
+            now = time.monotonic()
+            if not any(
+                next_due[channel.name] <= now and self.states[channel.name].status == "offline"
+                for channel in self.channels
+            ):
+                due = []
+            else:
+                due = [
+                    channel for channel in self.channels
+                    if next_due[channel.name] <= now + slack and self.states[channel.name].status == "offline"
+                ]
+            if due:
+                try:
+                    results = await asyncio.to_thread(
+                        self.monitor.probe_channels, [channel.name for channel in due]
+                    )
+                except Exception as e:
+                    logger.error(f"Batched probe failed: {e}")
+                    results = {}
+
+                for channel in due:
+                    self._handle_probe(channel, results.get(channel.name))
+                    next_due[channel.name] = now + self._interval(channel)
+
+            waits = [
+                next_due[channel.name] - time.monotonic()
+                for channel in self.channels
+                if self.states[channel.name].status == "offline"
+            ]
+            await asyncio.sleep(min(max(min(waits, default=1.0), 0.1), 1.0))
+
+    def _handle_probe(self, channel: ChannelConfig, result, pushed=False):
+        state = self.states[channel.name]
+        state.last_check = time.time()
+
+        if result is None or result.error:
+            # 探測失敗時退回 Streamlink 解析，確保不漏掉開台
+            state.consecutive_errors += 1
+            if self.scheduler:
+                self.scheduler.record_error(channel.name)
+        elif result.live:
+            state.consecutive_errors = 0
+            state.stream_id = result.stream_id
+            state.started_at = result.started_at
+            if self.scheduler:
+                self.scheduler.record_live(channel.name, result.started_at)
+        else:
+            state.consecutive_errors = 0
+            if self.scheduler:
+                self.scheduler.record_offline(channel.name)
+            return
+
+        state.status = "starting"
+        task = asyncio.create_task(self._go_live(channel, state, pushed), name=f"live-{channel.name}")
+        self._live_tasks[channel.name] = task
+
+    async def _go_live(self, channel: ChannelConfig, state: ChannelState, pushed=False):
+        """
+        :param pushed: 由 EventSub 通知觸發；播放清單可能還沒準備好，解析失敗時短暫重試
+        """
+        channel_url = f"https://www.twitch.tv/{channel.name}"
+        deadline = time.monotonic() + (PUSH_RETRY_WINDOW if pushed else 0)
+        try:
+            # 只有在探測判定開台（或探測失敗）時才做完整的 Streamlink 解析
+            while True:
+                async with self._check_sem:
+                    stream_info = await asyncio.to_thread(
+                        self.monitor.check_live_status, channel_url
+                    )
+                if stream_info or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(PUSH_RETRY_INTERVAL)
+            if stream_info:
+                await self._record(channel, state, channel_url, stream_info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            state.consecutive_errors += 1
+            logger.error(f"[{channel.name}] Error in supervisor loop: {e}")
+        finally:
+            state.status = "offline"
+            self._live_tasks.pop(channel.name, None)
+
+    async def _record(self, channel: ChannelConfig, state: ChannelState, channel_url, streams=None):
+        logger.info(f"[{channel.name}] is LIVE! Preparing to record...")
+        send_discord(f"🔴 {channel.name} 開始直播，準備錄製...")
+
+        job = None
+        if self.job_store:
+            job = start_recording_job(self.job_store, channel.name, channel_url)
+            timestamp, channel_dir = job.seq, job.workspace
+        else:
+            timestamp, channel_dir = int(time.time()), self.channel_dir(channel.name)
+
+        # 以檢查時解析好的串流位元率估計磁碟用量，沒有時使用預設值
+        bitrate = stream_bitrate(streams)
+        segment_hours = channel.segment_hours or self.segment_hours
+        if segment_hours and self.segmented_record_fn:
+            key = f"recording-{channel.name}-{timestamp}"
+            # 片段上傳前會同時存在 .ts 與 .mp4
+            await asyncio.to_thread(
+                self.admission.acquire,
+                key, estimate_footprint(segment_hours * 3600, bitrate, copies=2), LIVE, workspace=channel_dir,
+            )
+            await self._record_segmented(channel, state, channel_url, segment_hours, channel_dir, job, key)
+            return
+        fragmented = self.record_format == "fmp4"
+        ts_path = os.path.join(channel_dir, f"{channel.name}_{timestamp}.{'fmp4' if fragmented else 'ts'}")
+        # 直播長度未知；.ts 轉檔時與 .mp4 同時存在，fragmented MP4 只有一份
+        key = f"recording-{channel.name}-{timestamp}"
+        # acquire 會掃描工作目錄並鎖定資料庫，不在 event loop 上執行
+        await asyncio.to_thread(
+            self.admission.acquire,
+            key, estimate_footprint(DEFAULT_DURATION_HOURS * 3600, bitrate, copies=1 if fragmented else 2), LIVE,
+            workspace=channel_dir,
+        )
+
+        state.status = "recording"
+        state.last_live = time.time()
+        state.current_file = ts_path
+        record = self.recorder.record_fragmented if fragmented else self.recorder.record
+        try:
+            async with self._record_sem:
+                # 直接使用檢查時解析好的串流，不再啟動 streamlink 重新解析
+                with span("record", channel=channel.name, format=self.record_format) as s:
+                    success = await asyncio.to_thread(record, channel_url, ts_path, streams)
+                    s.set_attributes(success=success, bytes=file_size(ts_path))
+        finally:
+            state.status = "starting"
+            state.current_file = None
+
+        if not (success and os.path.exists(ts_path)):
+            logger.warning(f"[{channel.name}] Recording finished but no file created or failed.")
+            send_discord(f"❌ {channel.name} 錄製失敗，無法產生檔案")
+            if job:
+                self.job_store.transition(job.id, DOWNLOADING, FAILED, error="recording failed")
+            await asyncio.to_thread(self.admission.release, key)
+            return
+
+        state.recordings += 1
+        if job:
+            self.job_store.transition(job.id, DOWNLOADING, DOWNLOADED)
+            self._spawn_process(channel, state, self.job_store.get(job.id), key)
+        else:
+            self._spawn_process(channel, state, ts_path, key)
+
+    async def _record_segmented(
+        self, channel: ChannelConfig, state: ChannelState, channel_url, segment_hours, output_dir,
+        job=None, reservation_key=None,
+    ):
+        """
+        :param output_dir: 片段的輸出目錄（job 的工作目錄或頻道目錄）
+        :param job: 這場錄影的 Job，已上傳的片段記錄在 job store
+        """
+        playlist_id = channel.playlist_id or self.playlist_id
+        on_uploaded = None
+        if job:
+            on_uploaded = lambda path, yt_url: self.job_store.record_upload(job.id, os.path.basename(path), yt_url)
+        state.status = "recording"
+        state.last_live = time.time()
+        try:
+            async with self._record_sem:
+                recorded, upload_queue = await asyncio.to_thread(
+                    self.segmented_record_fn,
+                    self.recorder,
+                    channel.name,
+                    channel_url,
+                    output_dir,
+                    playlist_id,
+                    segment_hours,
+                    on_uploaded=on_uploaded,
+                )
+        except BaseException:
+            if job:
+                self.job_store.transition(job.id, DOWNLOADING, DOWNLOADED, error="recording interrupted")
+            if reservation_key:
+                await asyncio.to_thread(self.admission.release, reservation_key)
+            raise
+        finally:
+            state.status = "starting"
+
+        if recorded:
+            state.recordings += 1
+        # 錄影結束就釋放錄影名額、回到輪詢，還在上傳的片段交給背景 task
+        self._spawn(
+            self._finish_segmented(channel, state, recorded, upload_queue, job, reservation_key),
+            f"upload-{channel.name}",
+        )
+
+    async def _finish_segmented(
+        self, channel: ChannelConfig, state: ChannelState, recorded, upload_queue, job=None, reservation_key=None
+    ):
+        """等待邊錄邊傳剩下的片段上傳完成，與其他上傳共用 max_concurrent_uploads 的限制"""
+        state.pending_jobs += 1
+        try:
+            async with self._upload_sem:
+                upload_success, yt_urls = await asyncio.to_thread(upload_queue.close)
+            if job:
+                finish_segmented_job(self.job_store, job, recorded, upload_success)
+
+            if not recorded:
+                logger.warning(f"[{channel.name}] Segmented recording produced no parts.")
+                send_discord(f"❌ {channel.name} 錄製失敗，無法產生檔案")
+            elif upload_success:
+                send_discord(f"✅ {channel.name} 直播錄製並上傳完成\n{format_yt_links(yt_urls)}")
+            else:
+                send_discord(f"❌ {channel.name} 直播錄製完成但上傳失敗")
+        except Exception as e:
+            logger.error(f"[{channel.name}] Error while uploading segmented recording: {e}")
+        finally:
+            state.pending_jobs -= 1
+            if reservation_key:
+                await asyncio.to_thread(self.admission.release, reservation_key)
+
+    async def _process(self, channel: ChannelConfig, state: ChannelState, recording, reservation_key=None):
+        """
+        :param recording: .ts / .fmp4 路徑，或 job_store 中 downloaded 狀態的 Job
+        :param reservation_key: 錄影的磁碟預留，處理結束後釋放
+        """
+        job = recording if self.job_store and not isinstance(recording, str) else None
+        if job:
+            work_dir = job.workspace
+            ts_paths = sorted(
+                os.path.join(work_dir, name) for name in os.listdir(work_dir) if name.endswith((".ts", ".fmp4"))
+            )
+        else:
+            work_dir = self.channel_dir(channel.name)
+            ts_paths = [recording]
+        playlist_id = channel.playlist_id or self.playlist_id
+        on_uploaded = None
+        if job:
+            on_uploaded = lambda path, yt_url: self.job_store.record_upload(job.id, os.path.basename(path), yt_url)
+        state.pending_jobs += 1
+        try:
+            # 同一頻道的後處理依序進行，避免重複上傳同一目錄
+            async with self._process_locks[channel.name]:
+                for ts_path in ts_paths:
+                    logger.info(f"[{channel.name}] Recording finished. Remuxing to MP4...")
+                    # 轉檔與切割一次完成，超過 10 小時的錄影直接輸出成多個片段
+                    async with self._remux_sem:
+                        with span("remux", channel=channel.name, bytes=file_size(ts_path)) as s:
+                            parts = await asyncio.to_thread(
+                                self.video_processor.remux_to_parts, ts_path, os.path.dirname(ts_path), 10
+                            )
+                            s.set_attribute("parts", len(parts))
+                    if not parts:
+                        logger.error(f"[{channel.name}] Remuxing failed. Keeping TS file.")
+                        send_discord(f"❌ {channel.name} 錄製後轉檔失敗")
+                        if job:
+                            self.job_store.fail(job.id, DOWNLOADED, "remux failed")
+                        return
+                    # fragmented MP4 不需轉檔，已直接改名成輸出檔
+                    if os.path.exists(ts_path):
+                        os.remove(ts_path)
+
+                logger.info(f"[{channel.name}] Remuxing successful and TS file removed. Starting upload...")
+                if job:
+                    self.job_store.transition(job.id, DOWNLOADED, UPLOADING, worker=worker_name())
+                async with self._upload_sem:
+                    upload_success, yt_urls = await asyncio.to_thread(
+                        self.upload_fn, playlist_id, work_dir, on_uploaded=on_uploaded
+                    )
+
+                if upload_success:
+                    if job:
+                        self.job_store.transition(job.id, UPLOADING, UPLOADED)
+                        shutil.rmtree(work_dir, ignore_errors=True)
+                    yt_links = format_yt_links(yt_urls)
+                    send_discord(f"✅ {channel.name} 直播錄製並上傳完成\n{yt_links}")
+                else:
+                    if job:
+                        # 保留已轉檔的 MP4，下次啟動時重新上傳
+                        self.job_store.transition(job.id, UPLOADING, DOWNLOADED, error="upload failed")
+                    send_discord(f"❌ {channel.name} 直播錄製完成但上傳失敗")
+        except Exception as e:
+            logger.error(f"[{channel.name}] Error while processing {work_dir}: {e}")
+        finally:
+            state.pending_jobs -= 1
+            if reservation_key:
+                await asyncio.to_thread(self.admission.release, reservation_key)
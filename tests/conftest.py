@@ -0,0 +1,18 @@
+import pytest
+
+from stub_server import StubServer
+
+
+@pytest.fixture
+def stub_server():
+    """啟動 StubServer 的 factory，測試結束後自動關閉"""
+    servers = []
+
+    def start(handler):
+        server = StubServer(handler).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,108 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+# RFC 6455 握手用的固定 GUID
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class EventSubReplayServer:
+    def __init__(self, messages):
+        """
+        本機 WebSocket 伺服器，依序重播錄好的 EventSub 訊息，取代 wss://eventsub.wss.twitch.tv
+
+        訊息中的 {url} 會換成伺服器的網址，讓 session_reconnect 指回本機
+
+        :param messages: EventSub 訊息（dict）列表，每個連線都從頭重播
+        """
+        self.messages = messages
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen()
+        self._thread = None
+        self.paths = []
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self._sock.getsockname()[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="eventsub-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # 只 close 不會喚醒阻塞中的 accept
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                self._replay(conn)
+
+    def _replay(self, conn):
+        conn.settimeout(5)
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return
+            request += chunk
+
+        lines = request.decode().split("\r\n")
+        self.paths.append(lines[0].split(" ")[1])
+        headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+        accept = base64.b64encode(
+            hashlib.sha1((headers["Sec-WebSocket-Key"] + WS_GUID).encode()).digest()
+        ).decode()
+        conn.sendall(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode()
+        )
+
+        for message in self.messages:
+            text = json.dumps(message).replace("{url}", self.url)
+            conn.sendall(self._frame(text.encode()))
+
+        # 等用戶端關閉連線（或等到 keepalive 逾時自行中斷），回覆 close frame 讓用戶端不必等待
+        conn.settimeout(30)
+        try:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                if data[0] & 0x0F == 0x08:
+                    conn.sendall(bytes([0x88, 0]))
+                    return
+        except OSError:
+            pass
+
+    @staticmethod
+    def _frame(payload):
+        """伺服器送出的 text frame 不需要 mask"""
+        header = bytes([0x81])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack("!H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(payload))
+        return header + payload
@@ -0,0 +1,88 @@
+import json
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class StubRequest:
+    """stub server 收到的一個請求"""
+
+    method: str
+    path: str
+    query: Dict[str, list]
+    headers: Dict[str, str]
+    body: bytes = b""
+    json: object = field(default=None)
+
+
+class StubServer:
+    def __init__(self, handler):
+        """
+        本機 HTTP stub server，取代 Twitch GQL、YouTube、Discord 等外部端點
+
+        :param handler: handler(request: StubRequest) -> (status, headers, body)；
+            body 為 dict/list 時以 JSON 回傳，bytes/str 原樣回傳
+        """
+        self.handler = handler
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 才能讓 requests.Session 重用連線
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = urlsplit(self.path)
+                request = StubRequest(
+                    method=self.command,
+                    path=parts.path,
+                    query=parse_qs(parts.query),
+                    headers=dict(self.headers),
+                    body=body,
+                )
+                if "json" in self.headers.get("Content-Type", ""):
+                    request.json = json.loads(body)
+                server.requests.append(request)
+
+                status, headers, payload = server.handler(request)
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode()
+                    headers = {"Content-Type": "application/json", **headers}
+                elif isinstance(payload, str):
+                    payload = payload.encode()
+                payload = payload or b""
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
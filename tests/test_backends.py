@@ -0,0 +1,56 @@
+import asyncio
+import json
+import os
+
+from detection.backends import TwitchHTTPBackend, parse_videos_response
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def archive_handler(request):
+    """重播錄好的 ArchiveVideos 回應，依 after cursor 回傳對應的頁面"""
+    after = request.json["variables"].get("after")
+    page = "archive_videos_page1.json" if after is None else "archive_videos_page2.json"
+    return 200, {}, load_fixture(page)
+
+
+def list_vods(server, stop_url=""):
+    backend = TwitchHTTPBackend("testchannel", endpoint=f"{server.url}/gql", page_size=3)
+    try:
+        return asyncio.run(backend.list_vods(stop_url=stop_url))
+    finally:
+        asyncio.run(backend.aclose())
+
+
+def test_pages_through_all_archives(stub_server):
+    server = stub_server(archive_handler)
+
+    vods = list_vods(server)
+
+    assert [r.json["variables"]["after"] for r in server.requests] == [None, "cursor-2589600142"]
+    assert server.requests[0].json["variables"]["login"] == "testchannel"
+    assert [vod.id for vod in vods] == ["2591234503", "2590412877", "2589600142", "2588776025", "2587950318"]
+    first = vods[0]
+    assert first.title == "【雜談】週末晚間聊天"
+    assert first.url == "https://www.twitch.tv/videos/2591234503"
+    assert first.created_at == "2026-10-17T12:01:33Z"
+    assert first.duration == 15873
+
+
+def test_stops_paging_at_the_marker(stub_server):
+    server = stub_server(archive_handler)
+
+    vods = list_vods(server, stop_url="https://www.twitch.tv/videos/2590412877")
+
+    # 上次處理到的影片在第一頁，不必再翻頁
+    assert len(server.requests) == 1
+    assert [vod.id for vod in vods] == ["2591234503", "2590412877", "2589600142"]
+
+
+def test_missing_user_has_no_videos():
+    assert parse_videos_response({"user": None}) == ([], None, False)
@@ -0,0 +1,80 @@
+import time
+
+import requests
+
+from utils.discord_notify import MAX_MESSAGE_LENGTH, DiscordNotifier
+
+
+def make_notifier(server, **kwargs):
+    return DiscordNotifier(webhook_url=f"{server.url}/webhook", **kwargs)
+
+
+def test_coalesces_a_burst_into_one_post(stub_server):
+    server = stub_server(lambda request: (204, {}, b""))
+    notifier = make_notifier(server, coalesce_window=0.2)
+
+    started = time.monotonic()
+    for part in range(1, 4):
+        notifier.notify(f"✅ part {part} uploaded")
+    # notify 只排入佇列，不等 webhook
+    assert time.monotonic() - started < 0.1
+    assert notifier.flush(timeout=5)
+    notifier.close()
+
+    assert [r.json["content"] for r in server.requests] == [
+        "✅ part 1 uploaded\n✅ part 2 uploaded\n✅ part 3 uploaded",
+    ]
+
+
+def test_honors_retry_after_on_429(stub_server):
+    responses = [(429, {}, {"message": "You are being rate limited.", "retry_after": 0.3, "global": False})]
+    server = stub_server(lambda request: responses.pop(0) if responses else (204, {}, b""))
+    notifier = make_notifier(server, coalesce_window=0)
+
+    started = time.monotonic()
+    notifier.notify("🔴 live")
+    assert notifier.flush(timeout=5)
+    notifier.close()
+
+    # 被限流的訊息不會被丟掉，等 retry_after 之後重送
+    assert [r.json["content"] for r in server.requests] == ["🔴 live", "🔴 live"]
+    assert time.monotonic() - started >= 0.3
+
+
+def test_splits_batches_over_the_length_limit(stub_server):
+    server = stub_server(lambda request: (204, {}, b""))
+    notifier = make_notifier(server, coalesce_window=0.2)
+
+    messages = [f"{i:02d}" + "x" * 598 for i in range(5)]
+    for message in messages:
+        notifier.notify(message)
+    assert notifier.flush(timeout=5)
+    notifier.close()
+
+    contents = [r.json["content"] for r in server.requests]
+    assert all(len(content) <= MAX_MESSAGE_LENGTH for content in contents)
+    assert "\n".join(contents).split("\n") == messages
+
+
+def test_keeps_sending_after_an_unexpected_error(stub_server):
+    server = stub_server(lambda request: (204, {}, b""))
+    session = requests.Session()
+    post = session.post
+    errors = [RuntimeError("boom")]
+
+    def flaky_post(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return post(*args, **kwargs)
+
+    session.post = flaky_post
+    notifier = make_notifier(server, coalesce_window=0, session=session)
+
+    notifier.notify("first")
+    assert notifier.flush(timeout=5)
+    # 背景執行緒沒有因為例外結束，之後的通知照常送出
+    notifier.notify("second")
+    assert notifier.flush(timeout=5)
+    notifier.close()
+
+    assert [r.json["content"] for r in server.requests] == ["second"]
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from detection.eventsub import EventSubError, EventSubListener
+from eventsub_replay import EventSubReplayServer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_messages(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def replay_server():
+    servers = []
+
+    def start(messages):
+        server = EventSubReplayServer(messages).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_session_dispatches_once_and_follows_reconnect(replay_server):
+    server = replay_server(load_messages("eventsub_session.json"))
+    events = []
+    # api_url=None：重播伺服器自行送出事件，不需要建立訂閱
+    listener = EventSubListener(
+        ["testchannel"],
+        on_online=lambda channel, event: events.append((channel, event, listener.is_healthy(channel))),
+        ws_url=f"{server.url}/ws",
+        api_url=None,
+        timeout=5,
+    )
+
+    reconnect_url = listener._session(listener.ws_url)
+
+    assert reconnect_url == f"{server.url}/reconnect?id=AQoQILE98gtqShGmLD7AM6yJThAB"
+    # 重複的 message_id 只通知一次
+    assert len(events) == 1
+    channel, event, healthy = events[0]
+    assert channel == "testchannel"
+    assert event["started_at"] == "2026-10-18T09:00:04Z"
+    assert healthy
+    # 連線結束後不再視為健康，恢復一般輪詢
+    assert not listener.healthy
+    assert not listener.is_healthy("testchannel")
+
+
+def test_revocation_only_affects_revoked_channel(replay_server):
+    welcome, notification = load_messages("eventsub_session.json")[:2]
+    welcome["payload"]["session"]["keepalive_timeout_seconds"] = 1
+    revocation = {
+        "metadata": {"message_id": "revoked-1", "message_type": "revocation"},
+        "payload": {
+            "subscription": {
+                "type": "stream.online",
+                "status": "authorization_revoked",
+                "condition": {"broadcaster_user_id": "1337"},
+            }
+        },
+    }
+    # 撤銷後的通知用來在連線中途檢查各頻道的狀態
+    notification["metadata"]["message_id"] = "after-revocation"
+    server = replay_server([welcome, revocation, notification])
+    health = []
+    listener = EventSubListener(
+        ["testchannel", "otherchannel"],
+        on_online=lambda channel, event: health.append(
+            (listener.is_healthy("testchannel"), listener.is_healthy("otherchannel"))
+        ),
+        ws_url=f"{server.url}/ws",
+        api_url=None,
+        timeout=1,
+    )
+    listener._user_ids = {"testchannel": "1337", "otherchannel": "42"}
+
+    # 重播結束後沒有 keepalive，連線逾時中斷
+    with pytest.raises(EventSubError):
+        listener._session(listener.ws_url)
+
+    assert health == [(False, True)]
@@ -0,0 +1,39 @@
+import sqlite3
+import threading
+
+import flows
+from utils.job_store import DETECTED, DOWNLOADED, JobStore
+
+
+def test_download_crash_does_not_stall_the_pipeline(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"), workspace_root=str(tmp_path / "jobs"))
+    first = store.add_job("vod", "https://www.twitch.tv/videos/1", "first", seq=1)
+    second = store.add_job("vod", "https://www.twitch.tv/videos/2", "second", seq=2)
+    uploaded = []
+
+    def download(store, job, *args):
+        if job.id == first.id:
+            raise sqlite3.OperationalError("database is locked")
+        return store.transition(job.id, DETECTED, DOWNLOADED)
+
+    def upload(store, job, *args):
+        uploaded.append(job.id)
+        return True
+
+    monkeypatch.setattr(flows, "_download_job", download)
+    monkeypatch.setattr(flows, "_upload_job", upload)
+
+    pipeline = threading.Thread(
+        target=flows._pipelined_download_upload, args=([first, second], store, "playlist", 1), daemon=True
+    )
+    pipeline.start()
+    pipeline.join(timeout=10)
+
+    assert not pipeline.is_alive(), "pipeline is waiting on a job the download thread never finished"
+    # 出錯的 job 記錄失敗、下次重試，之後的 job 照常上傳
+    assert uploaded == [second.id]
+    failed = store.get(first.id)
+    assert failed.state == DETECTED
+    assert failed.attempts == 1
+    assert "database is locked" in failed.error
+    store.close()
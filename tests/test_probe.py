@@ -0,0 +1,52 @@
+from detection.probe import TwitchGQLProbe
+
+STREAMS = {
+    "livechannel": {"id": "41375541868", "createdAt": "2026-10-18T09:00:04Z", "type": "live"},
+}
+
+
+def gql_handler(request):
+    """依 query 的 alias 回傳各頻道的 user/stream，不存在的頻道回傳 null"""
+    variables = request.json["variables"]
+    data = {}
+    for alias, login in variables.items():
+        if login == "banned":
+            data[alias] = None
+        else:
+            data[alias] = {"login": login, "stream": STREAMS.get(login)}
+    return 200, {}, {"data": data}
+
+
+def test_batches_channels_and_parses_status(stub_server):
+    server = stub_server(gql_handler)
+    probe = TwitchGQLProbe(endpoint=f"{server.url}/gql", batch_size=2)
+
+    results = probe.check_channels(["livechannel", "offline", "banned", "bad login!"])
+    probe.close()
+
+    # 三個合法的頻道分成兩批，不合法的 login 不送出
+    assert len(server.requests) == 2
+    assert [sorted(r.json["variables"].values()) for r in server.requests] == [
+        ["livechannel", "offline"], ["banned"],
+    ]
+    assert server.requests[0].headers["Client-ID"]
+
+    live = results["livechannel"]
+    assert live.live and live.error is None
+    assert live.stream_id == "41375541868"
+    assert live.started_at == "2026-10-18T09:00:04Z"
+    assert not results["offline"].live and results["offline"].error is None
+    assert not results["banned"].live and results["banned"].error is None
+    assert results["bad login!"].error == "invalid channel login"
+
+
+def test_gql_errors_mark_the_batch_as_failed(stub_server):
+    server = stub_server(lambda request: (200, {}, {"errors": [{"message": "service timeout"}]}))
+    probe = TwitchGQLProbe(endpoint=f"{server.url}/gql")
+
+    results = probe.check_channels(["one", "two"])
+    probe.close()
+
+    # 探測失敗時呼叫端會退回 Streamlink 解析，不能當成未開台
+    assert all(result.error and not result.live for result in results.values())
+    assert "service timeout" in results["one"].error
@@ -0,0 +1,137 @@
+import os
+import re
+
+import pytest
+import requests
+
+from uploader.resumable import (
+    CHUNK_ALIGNMENT,
+    ResumableUploader,
+    ResumableUploadError,
+    UploadStateStore,
+    file_identity,
+)
+
+
+class FakeResumableServer:
+    """YouTube resumable upload 協定的最小實作：308 + Range 回報進度，可以指定某些 chunk 回 5xx"""
+
+    def __init__(self, size):
+        self.size = size
+        self.received = bytearray()
+        self.url = None
+        # 第 n 個 chunk PUT 要回傳的錯誤狀態碼
+        self.failures = {}
+        self.chunk_puts = 0
+
+    def handler(self, request):
+        if request.method == "POST":
+            assert request.query["uploadType"] == ["resumable"]
+            assert request.headers["X-Upload-Content-Length"] == str(self.size)
+            return 200, {"Location": f"{self.url}/session/1"}, b""
+
+        content_range = request.headers["Content-Range"]
+        if content_range != f"bytes */{self.size}":
+            self.chunk_puts += 1
+            status = self.failures.pop(self.chunk_puts, None)
+            if status:
+                return status, {}, b""
+            start, end = map(int, re.match(r"bytes (\d+)-(\d+)/", content_range).groups())
+            assert start <= len(self.received), "chunk starts past the confirmed offset"
+            self.received[start:] = request.body
+            assert end == len(self.received) - 1
+        if len(self.received) == self.size:
+            return 201, {}, {"id": "video123", "status": {"uploadStatus": "uploaded"}}
+        headers = {"Range": f"bytes=0-{len(self.received) - 1}"} if self.received else {}
+        return 308, headers, b""
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(os.urandom(2 * CHUNK_ALIGNMENT + 1000))
+    return path
+
+
+def make_uploader(server, tmp_path, **kwargs):
+    return ResumableUploader(
+        requests.Session(),
+        endpoint=f"{server.url}/upload",
+        state_store=UploadStateStore(str(tmp_path / "sessions")),
+        chunk_size=CHUNK_ALIGNMENT,
+        backoff_base=0.001,
+        **kwargs,
+    )
+
+
+def test_retries_5xx_from_the_confirmed_offset(stub_server, tmp_path, video):
+    fake = FakeResumableServer(video.stat().st_size)
+    server = stub_server(fake.handler)
+    fake.url = server.url
+    fake.failures = {2: 503}
+
+    response = make_uploader(server, tmp_path).upload(str(video), {"snippet": {"title": "test"}})
+
+    assert response["id"] == "video123"
+    assert bytes(fake.received) == video.read_bytes()
+    # 503 之後先詢問伺服器的進度，再從確認的位置重送
+    ranges = [r.headers["Content-Range"] for r in server.requests if r.method == "PUT"]
+    size = video.stat().st_size
+    assert ranges == [
+        f"bytes 0-{CHUNK_ALIGNMENT - 1}/{size}",
+        f"bytes {CHUNK_ALIGNMENT}-{2 * CHUNK_ALIGNMENT - 1}/{size}",
+        f"bytes */{size}",
+        f"bytes {CHUNK_ALIGNMENT}-{2 * CHUNK_ALIGNMENT - 1}/{size}",
+        f"bytes {2 * CHUNK_ALIGNMENT}-{size - 1}/{size}",
+    ]
+    assert os.listdir(tmp_path / "sessions") == []
+
+
+def test_resumes_saved_session_after_restart(stub_server, tmp_path, video):
+    size = video.stat().st_size
+    fake = FakeResumableServer(size)
+    server = stub_server(fake.handler)
+    fake.url = server.url
+    fake.failures = {2: 500}
+
+    # 第一次上傳在第二個 chunk 失敗，模擬中途當機
+    with pytest.raises(ResumableUploadError):
+        make_uploader(server, tmp_path, max_retries=0).upload(str(video), {"snippet": {"title": "test"}})
+    assert len(fake.received) == CHUNK_ALIGNMENT
+    assert len(os.listdir(tmp_path / "sessions")) == 1
+
+    server.requests.clear()
+    response = make_uploader(server, tmp_path).upload(str(video), {"snippet": {"title": "test"}})
+
+    assert response["id"] == "video123"
+    assert bytes(fake.received) == video.read_bytes()
+    # 沿用保存的 session，不重新建立，也不重送已確認的 bytes
+    assert [r.method for r in server.requests] == ["PUT", "PUT", "PUT"]
+    assert [r.headers["Content-Range"] for r in server.requests] == [
+        f"bytes */{size}",
+        f"bytes {CHUNK_ALIGNMENT}-{2 * CHUNK_ALIGNMENT - 1}/{size}",
+        f"bytes {2 * CHUNK_ALIGNMENT}-{size - 1}/{size}",
+    ]
+    assert os.listdir(tmp_path / "sessions") == []
+
+
+def test_expired_session_restarts_from_zero(stub_server, tmp_path, video):
+    size = video.stat().st_size
+    fake = FakeResumableServer(size)
+    server = stub_server(fake.handler)
+    fake.url = server.url
+    # 保存的 session 已被伺服器丟棄（404）
+    server.handler = lambda request: (404, {}, b"") if request.path == "/gone" else fake.handler(request)
+    UploadStateStore(str(tmp_path / "sessions")).save(str(video), {
+        "identity": file_identity(str(video)),
+        "session_uri": f"{server.url}/gone",
+        "offset": CHUNK_ALIGNMENT,
+    })
+
+    response = make_uploader(server, tmp_path).upload(str(video), {"snippet": {"title": "test"}})
+
+    assert response["id"] == "video123"
+    assert bytes(fake.received) == video.read_bytes()
+    # 先詢問舊 session 的進度，失效後建立新的 session 從頭上傳
+    assert [r.method for r in server.requests][:2] == ["PUT", "POST"]
+    assert server.requests[2].headers["Content-Range"] == f"bytes 0-{CHUNK_ALIGNMENT - 1}/{size}"
@@ -1,4 +1,18 @@
-from .uploader import YouTubeUploader
-from .upload_flow import UploadFlow
+import importlib
 
-__all__ = ["YouTubeUploader", "UploadFlow"]
+# 子模組在第一次使用時才載入，Google API 套件只在真的要上傳時才載入
+_EXPORTS = {
+    "YouTubeUploader": ".uploader",
+    "UploadFlow": ".upload_flow",
+    "UploadQueue": ".upload_queue",
+}
+
+__all__ = ["YouTubeUploader", "UploadFlow", "UploadQueue"]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
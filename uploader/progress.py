@@ -0,0 +1,166 @@
+import json
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+from utils import setup_logger
+
+logger = setup_logger("log")
+
+
+@dataclass
+class UploadProgressEvent:
+    """每個 chunk 上傳完成時產生的事件"""
+
+    file: str
+    chunk_index: int
+    chunk_bytes: int
+    offset: int
+    total_bytes: int
+    chunk_seconds: float
+    elapsed_seconds: float
+    instant_bps: float
+    average_bps: float
+    retries: int
+    eta_seconds: Optional[float]
+    timestamp: float
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class ProgressSink:
+    """上傳進度事件的輸出介面"""
+
+    def emit(self, event: UploadProgressEvent):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LogSink(ProgressSink):
+    def __init__(self, log=None):
+        self.log = log or logger
+
+    def emit(self, event):
+        percent = event.offset / event.total_bytes * 100 if event.total_bytes else 100
+        eta = f"{event.eta_seconds:.0f}s" if event.eta_seconds is not None else "-"
+        self.log.info(
+            f"Uploaded {percent:.0f}% of {os.path.basename(event.file)} "
+            f"({event.instant_bps / 1e6 * 8:.1f} Mbit/s now, "
+            f"{event.average_bps / 1e6 * 8:.1f} Mbit/s avg, ETA {eta}, retries {event.retries})"
+        )
+
+
+class JsonlSink(ProgressSink):
+    def __init__(self, path):
+        """每個事件寫成 JSONL 的一行"""
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def emit(self, event):
+        self.write(event.to_dict())
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+
+
+class CallbackSink(ProgressSink):
+    def __init__(self, callback: Callable[[UploadProgressEvent], None]):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+
+class MultiSink(ProgressSink):
+    def __init__(self, *sinks):
+        self.sinks = [sink for sink in sinks if sink is not None]
+
+    def emit(self, event):
+        for sink in self.sinks:
+            try:
+                sink.emit(event)
+            except Exception as e:
+                logger.error(f"Progress sink {type(sink).__name__} failed: {e}")
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class ThroughputTracker:
+    def __init__(self, file_path, total_bytes, start_offset=0, chunk_size=None, sink=None):
+        """
+        統計單一檔案的上傳速度並送出進度事件
+
+        :param start_offset: 續傳時的起始位置，不計入本次傳輸量
+        :param sink: ProgressSink，None 時只做統計
+        """
+        self.file_path = file_path
+        self.total_bytes = total_bytes
+        self.start_offset = start_offset
+        self.chunk_size = chunk_size
+        self.sink = sink
+        self.started = time.monotonic()
+        self.chunks = 0
+        self.retries = 0
+        self.offset = start_offset
+
+    def record_retry(self):
+        self.retries += 1
+
+    def chunk_done(self, offset, chunk_seconds, retries=0):
+        """一個 chunk 被伺服器確認後呼叫"""
+        chunk_bytes = max(0, offset - self.offset)
+        self.offset = offset
+        self.chunks += 1
+        elapsed = time.monotonic() - self.started
+        sent = offset - self.start_offset
+        average_bps = sent / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_bytes - offset
+        event = UploadProgressEvent(
+            file=self.file_path,
+            chunk_index=self.chunks - 1,
+            chunk_bytes=chunk_bytes,
+            offset=offset,
+            total_bytes=self.total_bytes,
+            chunk_seconds=chunk_seconds,
+            elapsed_seconds=elapsed,
+            instant_bps=chunk_bytes / chunk_seconds if chunk_seconds > 0 else 0.0,
+            average_bps=average_bps,
+            retries=retries,
+            eta_seconds=remaining / average_bps if average_bps > 0 else None,
+            timestamp=time.time(),
+        )
+        if self.sink:
+            self.sink.emit(event)
+        return event
+
+    def summary(self):
+        """整支影片的上傳摘要，用於比較不同主機與 chunk 大小的速度"""
+        elapsed = time.monotonic() - self.started
+        sent = self.offset - self.start_offset
+        return {
+            "file": self.file_path,
+            "host": socket.gethostname(),
+            "total_bytes": self.total_bytes,
+            "bytes_sent": sent,
+            "resumed_from": self.start_offset,
+            "seconds": round(elapsed, 3),
+            "average_bps": sent / elapsed if elapsed > 0 else 0.0,
+            "chunk_size": self.chunk_size,
+            "chunks": self.chunks,
+            "retries": self.retries,
+            "timestamp": time.time(),
+        }
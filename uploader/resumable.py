@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import random
+import socket
+import time
+
+import requests
+
+from uploader.progress import ThroughputTracker
+from utils import setup_logger
+
+logger = setup_logger("log")
+
+UPLOAD_ENDPOINT = "https://www.googleapis.com/upload/youtube/v3/videos"
+# resumable upload 的 chunk 必須是 256 KiB 的倍數
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+RETRYABLE_STATUS = {500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, socket.error)
+
+
+class ResumableUploadError(Exception):
+    """上傳失敗且無法再重試"""
+
+
+def file_identity(file_path):
+    """用路徑、大小、修改時間與 inode 判斷是否為同一個檔案"""
+    stat = os.stat(file_path)
+    return {
+        "path": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+
+
+class UploadStateStore:
+    def __init__(self, state_dir="upload_sessions"):
+        """
+        將 resumable session 的狀態存到磁碟，重啟後可以接續上傳
+
+        :param state_dir: 狀態檔目錄，每個檔案一個 JSON
+        """
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _path(self, file_path):
+        key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.state_dir, f"{key}.json")
+
+    def load(self, file_path):
+        try:
+            with open(self._path(file_path), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, file_path, state):
+        # 先寫暫存檔再 rename，避免中途當機留下壞掉的狀態檔
+        path = self._path(file_path)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(state, file, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def clear(self, file_path):
+        try:
+            os.remove(self._path(file_path))
+        except FileNotFoundError:
+            pass
+
+
+class ResumableUploader:
+    def __init__(
+        self,
+        session,
+        endpoint=UPLOAD_ENDPOINT,
+        state_store=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_retries=10,
+        backoff_base=1.0,
+        backoff_max=64.0,
+        timeout=300,
+        progress_sink=None,
+    ):
+        """
+        YouTube resumable upload 協定的實作，每個 chunk 後保存進度
+
+        :param session: 已授權的 requests session（例如 AuthorizedSession）
+        :param endpoint: 上傳端點，測試時可指向本機的假伺服器
+        :param state_store: UploadStateStore，預設存到 upload_sessions/
+        :param chunk_size: 每個 chunk 的大小，會對齊到 256 KiB
+        :param max_retries: 連續失敗的最大重試次數
+        :param progress_sink: ProgressSink，每個 chunk 完成時收到 UploadProgressEvent
+        """
+        self.session = session
+        self.endpoint = endpoint
+        self.state_store = state_store or UploadStateStore()
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.progress_sink = progress_sink
+        self.last_summary = None
+
+    def upload(self, file_path, body, part="snippet,status", content_type="video/*"):
+        """
+        上傳檔案；若有同一檔案未完成的 session，會從伺服器確認的位置接續
+
+        :param file_path: 影片路徑
+        :param body: videos.insert 的 metadata
+        :return: 伺服器回傳的 video resource (dict)
+        """
+        identity = file_identity(file_path)
+        size = identity["size"]
+        state = self.state_store.load(file_path)
+
+        response = None
+        offset = 0
+        session_uri = None
+        if state and state.get("identity") == identity and state.get("session_uri"):
+            session_uri = state["session_uri"]
+            offset, response = self._with_retries(lambda: self._query_offset(session_uri, size))
+            if offset is None:
+                logger.warning(f"Saved upload session expired, restarting: {file_path}")
+                session_uri = None
+            else:
+                logger.info(f"Resuming upload of {file_path} at byte {offset}/{size}")
+
+        if session_uri is None:
+            session_uri = self._with_retries(
+                lambda: self._initiate(body, part, size, content_type)
+            )
+            offset = 0
+            state = {"identity": identity, "session_uri": session_uri, "offset": 0}
+            self.state_store.save(file_path, state)
+
+        tracker = ThroughputTracker(file_path, size, offset, self.chunk_size, self.progress_sink)
+        retries = 0
+        with open(file_path, "rb") as file:
+            while response is None:
+                file.seek(offset)
+                chunk = file.read(self.chunk_size)
+                chunk_started = time.monotonic()
+                try:
+                    offset, response = self._put_chunk(session_uri, chunk, offset, size)
+                    tracker.chunk_done(offset, time.monotonic() - chunk_started, retries)
+                    retries = 0
+                except _RetryableError as e:
+                    retries += 1
+                    tracker.record_retry()
+                    if retries > self.max_retries:
+                        raise ResumableUploadError(f"Giving up after {self.max_retries} retries: {e}")
+                    self._sleep_backoff(retries, e)
+                    # 失敗後以伺服器確認的位置為準
+                    offset, response = self._with_retries(
+                        lambda: self._query_offset(session_uri, size)
+                    )
+                    if offset is not None:
+                        continue
+                    expired = True
+                except _SessionExpired:
+                    expired = True
+                else:
+                    expired = False
+
+                if expired:
+                    # session 失效只能從頭開始
+                    logger.warning(f"Upload session expired, restarting from byte 0: {file_path}")
+                    session_uri = self._with_retries(
+                        lambda: self._initiate(body, part, size, content_type)
+                    )
+                    offset, response = 0, None
+                    state = {"identity": identity, "session_uri": session_uri, "offset": 0}
+
+                state["offset"] = offset
+                self.state_store.save(file_path, state)
+
+        self.state_store.clear(file_path)
+        self.last_summary = tracker.summary()
+        return response
+
+    def _initiate(self, body, part, size, content_type):
+        response = self.session.post(
+            self.endpoint,
+            params={"uploadType": "resumable", "part": part},
+            json=body,
+            headers={
+                "X-Upload-Content-Length": str(size),
+                "X-Upload-Content-Type": content_type,
+            },
+            timeout=self.timeout,
+        )
+        self._raise_for_status(response)
+        session_uri = response.headers.get("Location")
+        if not session_uri:
+            raise ResumableUploadError("Upload session URI missing from response")
+        return session_uri
+
+    def _query_offset(self, session_uri, size):
+        """
+        詢問伺服器已收到多少 bytes
+
+        :return: (offset, None) 未完成；(size, response) 已完成；(None, None) session 失效
+        """
+        response = self.session.put(
+            session_uri,
+            headers={"Content-Range": f"bytes */{size}", "Content-Length": "0"},
+            timeout=self.timeout,
+        )
+        if response.status_code in (404, 410):
+            return None, None
+        return self._parse_progress(response, size)
+
+    def _put_chunk(self, session_uri, chunk, offset, size):
+        end = offset + len(chunk) - 1
+        try:
+            response = self.session.put(
+                session_uri,
+                data=chunk,
+                headers={
+                    "Content-Range": f"bytes {offset}-{end}/{size}",
+                    "Content-Length": str(len(chunk)),
+                },
+                timeout=self.timeout,
+            )
+        except RETRYABLE_EXCEPTIONS as e:
+            raise _RetryableError(str(e))
+        if response.status_code in (404, 410):
+            raise _SessionExpired()
+        return self._parse_progress(response, size)
+
+    def _parse_progress(self, response, size):
+        if response.status_code == 308:
+            # Range: bytes=0-N 代表伺服器已收到 N+1 bytes
+            received = response.headers.get("Range")
+            offset = int(received.rsplit("-", 1)[1]) + 1 if received else 0
+            return offset, None
+        if response.status_code in (200, 201):
+            return size, response.json()
+        self._raise_for_status(response)
+        raise ResumableUploadError(f"Unexpected upload response: {response.status_code}")
+
+    def _raise_for_status(self, response):
+        if response.status_code in RETRYABLE_STATUS or response.status_code == 429:
+            raise _RetryableError(f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise ResumableUploadError(f"HTTP {response.status_code}: {response.text[:500]}")
+
+    def _with_retries(self, fn):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except RETRYABLE_EXCEPTIONS as e:
+                error = _RetryableError(str(e))
+            except _RetryableError as e:
+                error = e
+            if attempt == self.max_retries:
+                raise ResumableUploadError(f"Giving up after {self.max_retries} retries: {error}")
+            self._sleep_backoff(attempt + 1, error)
+
+    def _sleep_backoff(self, attempt, error):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning(f"Upload request failed ({error}), retry {attempt} in {delay:.1f}s")
+        time.sleep(delay)
+
+
+class _RetryableError(Exception):
+    pass
+
+
+class _SessionExpired(Exception):
+    pass
@@ -1,11 +1,14 @@
 from uploader import YouTubeUploader
+from uploader.progress import JsonlSink
 from utils import setup_logger
+from utils.disk_usage import file_size
+from utils.tracing import span
 
 logger = setup_logger("log")
 
 
 class UploadFlow:
-    def __init__(self):
+    def __init__(self, progress_sink=None, stats_file="logs/upload_stats.jsonl"):
         self.client_secrets_file = "client_secret.json"
         self.scopes = [
             "https://www.googleapis.com/auth/youtube.upload",
@@ -13,17 +16,34 @@ class UploadFlow:
         ]
         self.credentials_file = "credentials.pkl"
         self.uploader = YouTubeUploader(
-            self.client_secrets_file, self.scopes, self.credentials_file
+            self.client_secrets_file,
+            self.scopes,
+            self.credentials_file,
+            progress_sink=progress_sink,
         )
+        # 每支影片一筆上傳速度摘要，方便比較不同主機與 chunk 大小
+        self.stats_sink = JsonlSink(stats_file) if stats_file else None
 
     def upload(self, video_file, title, description, playlist_id=None):
+        with span("upload", title=title) as s:
+            yt_url = self._upload(video_file, title, description, playlist_id)
+            s.set_attributes(bytes=file_size(video_file), success=bool(yt_url), url=yt_url)
+        return yt_url
+
+    def _upload(self, video_file, title, description, playlist_id=None):
         try:
             logger.info("Starting upload process...")
             if len(title) > 100:
                 logger.warning(f"Title too long ({len(title)} chars), truncating to 100: {title}")
                 title = title[:97] + "..."
             video_id = self.uploader.upload_video(
-                video_file, title, description, "22", ["Ansen", "Shoto"], playlist_id
+                video_file,
+                title,
+                description,
+                "22",
+                ["Ansen", "Shoto"],
+                playlist_id,
+                on_summary=lambda summary: self._record_summary(summary, title),
             )
             logger.info(f"Upload {title} successful!")
             return f"https://www.youtube.com/watch?v={video_id}"  # 回傳 YouTube 連結
@@ -32,6 +52,28 @@ class UploadFlow:
             logger.warning(f"Upload failed for '{title}', file will be kept for manual handling.")
             return None  # 上傳失敗
 
+    def _record_summary(self, summary, title):
+        if not summary:
+            return
+        logger.info(
+            f"Upload summary for {title}: {summary['bytes_sent'] / 1e9:.2f} GB in "
+            f"{summary['seconds']:.0f}s ({summary['average_bps'] * 8 / 1e6:.1f} Mbit/s, "
+            f"{summary['retries']} retries)"
+        )
+        if self.stats_sink:
+            self.stats_sink.write({"title": title, **summary})
+
+    def add_to_playlist(self, yt_url, playlist_id):
+        with span("playlist.insert", url=yt_url, playlist_id=playlist_id) as s:
+            try:
+                video_id = yt_url.split("v=")[-1]
+                self.uploader.add_video_to_playlist(video_id, playlist_id)
+                return True
+            except Exception as e:
+                logger.error(f"Failed to add {yt_url} to playlist {playlist_id}: {e}")
+                s.record_error(e)
+                return False
+
 
 if __name__ == "__main__":
     upload_flow = UploadFlow()
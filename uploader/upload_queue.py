@@ -0,0 +1,100 @@
+import os
+import queue
+import threading
+
+from uploader.upload_flow import UploadFlow
+from utils import setup_logger
+from utils.tracing import current_context
+
+logger = setup_logger("log")
+
+
+class UploadQueue:
+    def __init__(self, playlist_id=None, upload_flow=None, max_workers=1, uploaded=None, on_uploaded=None):
+        """
+        背景上傳佇列，可同時上傳多支，播放清單仍依加入順序插入
+
+        :param playlist_id: 上傳後加入的播放清單
+        :param upload_flow: 可傳入既有的 UploadFlow
+        :param max_workers: 同時上傳的數量
+        :param uploaded: 先前已上傳的檔案 {檔名: YouTube 連結}，重做時直接略過
+        :param on_uploaded: 每支影片上傳並加入播放清單後呼叫 on_uploaded(video_path, yt_url)
+        """
+        self.playlist_id = playlist_id
+        self.upload_flow = upload_flow or UploadFlow()
+        self.uploaded = uploaded or {}
+        self.on_uploaded = on_uploaded
+        self.youtube_urls = []
+        self.all_success = True
+        self.submitted = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._results = {}
+        self._next_commit = 0
+        self._workers = [
+            threading.Thread(target=self._run, name=f"upload-queue-{i}", daemon=True)
+            for i in range(max(1, max_workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, video_path, title, description=""):
+        """加入一支待上傳的影片，上傳成功後刪除檔案"""
+        with self._lock:
+            index = self.submitted
+            self.submitted += 1
+            done_url = self.uploaded.get(os.path.basename(video_path))
+            if done_url:
+                # 上次已上傳過（例如中斷後重新切割），不重複上傳
+                os.remove(video_path)
+                logger.info(f"Already uploaded, skipping: {video_path}")
+                self._results[index] = (video_path, done_url, False, None)
+                self._commit()
+                return
+        # 上傳在背景執行緒進行，帶著提交時的 trace context，upload span 才會接在原本的流程下
+        self._queue.put((index, video_path, title, description, current_context()))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            index, video_path, title, description, context = item
+            logger.info(f"Uploading queued video: {title}")
+            # 播放清單在 _commit 依順序插入，這裡先不指定
+            yt_url = context.run(self.upload_flow.upload, video_path, title, description)
+            if yt_url:
+                os.remove(video_path)  # 只有上傳成功才刪除
+                logger.info(f"Successfully uploaded and removed: {video_path}")
+            else:
+                logger.warning(f"Upload failed for {title}, file kept at: {video_path}")
+
+            with self._lock:
+                self._results[index] = (video_path, yt_url, True, context)
+                self._commit()
+
+    def _commit(self):
+        # 只處理從 _next_commit 開始連續完成的部分，確保播放清單順序與片段順序一致
+        while self._next_commit in self._results:
+            video_path, yt_url, new, context = self._results.pop(self._next_commit)
+            if yt_url:
+                self.youtube_urls.append(yt_url)
+                if new and self.playlist_id:
+                    context.run(self.upload_flow.add_to_playlist, yt_url, self.playlist_id)
+                if new and self.on_uploaded:
+                    self.on_uploaded(video_path, yt_url)
+            else:
+                self.all_success = False
+            self._next_commit += 1
+
+    def close(self):
+        """
+        等待所有已加入的影片上傳完畢
+
+        :return: (是否全部成功, 依順序排列的 YouTube 連結列表)
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        return self.all_success, self.youtube_urls
@@ -1,21 +1,35 @@
 import os
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 import pickle
+from uploader.progress import LogSink
+from uploader.resumable import ResumableUploader, UploadStateStore, UPLOAD_ENDPOINT
 from utils import setup_logger, clear_empty_data
 
 logger = setup_logger("credential")
 
 
 class YouTubeUploader:
-    def __init__(self, client_secrets_file, scopes, credentials_file):
+    def __init__(
+        self,
+        client_secrets_file,
+        scopes,
+        credentials_file,
+        upload_endpoint=UPLOAD_ENDPOINT,
+        state_dir="upload_sessions",
+        chunk_size=64 * 1024 * 1024,
+        progress_sink=None,
+    ):
         self.client_secrets_file = client_secrets_file
         self.scopes = scopes
         self.credentials_file = credentials_file
         self.credentials = None
         self.youtube = None
+        self.upload_endpoint = upload_endpoint
+        self.state_store = UploadStateStore(state_dir)
+        self.chunk_size = chunk_size
+        self.progress_sink = progress_sink or LogSink()
         self.authenticate()
 
     def authenticate(self):
@@ -67,7 +81,7 @@ class YouTubeUploader:
             pickle.dump(self.credentials, token)
 
     def upload_video(
-        self, file_path, title, description, category_id, tags, playlist_id=None
+        self, file_path, title, description, category_id, tags, playlist_id=None, on_summary=None
     ):
         body = {
             "snippet": {
@@ -80,19 +94,21 @@ class YouTubeUploader:
             "status": {"privacyStatus": "private", "madeForKids": False},
         }
 
-        media = MediaFileUpload(file_path, chunksize=-1, resumable=True)
-        request = self.youtube.videos().insert(
-            part="snippet,status", body=body, media_body=media
+        # 每個 chunk 後保存 session 狀態，重啟後可從伺服器確認的位置接續
+        resumable = ResumableUploader(
+            AuthorizedSession(self.credentials),
+            endpoint=self.upload_endpoint,
+            state_store=self.state_store,
+            chunk_size=self.chunk_size,
+            progress_sink=self.progress_sink,
         )
-
-        response = None
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                print(f"Uploaded {int(status.progress() * 100)}%")
+        response = resumable.upload(file_path, body, part="snippet,status")
+        if on_summary:
+            # 上傳速度摘要（見 ThroughputTracker.summary）
+            on_summary(resumable.last_summary)
 
         video_id = response["id"]
-        print(f"Upload Complete! Video ID: {video_id}")
+        logger.info(f"Upload Complete! Video ID: {video_id}")
 
         if playlist_id:
             self.add_video_to_playlist(video_id, playlist_id)
@@ -122,7 +138,7 @@ if __name__ == "__main__":
         "https://www.googleapis.com/auth/youtube.force-ssl",
     ]
     CREDENTIALS_FILE = r"E:\Projects\twitch-monitor\credentials.pkl"
-    print("Starting YouTube uploader...")
+    logger.info("Starting YouTube uploader...")
     uploader = YouTubeUploader(CLIENT_SECRETS_FILE, SCOPES, CREDENTIALS_FILE)
     clear_empty_data("E:/Projects/twitch-monitor/logs")
     # uploader.upload_video(
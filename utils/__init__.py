@@ -1,6 +1,23 @@
+import importlib
+
 from .logger import setup_logger
 from .clear_data import clear_empty_data
-from .video_processor import VideoProcessor
-from .discord_notify import send_discord
 
-__all__ = ["setup_logger", "clear_empty_data", "VideoProcessor", "send_discord"]
+# 其餘子模組在第一次使用時才載入（requests、sqlite3 等）
+_EXPORTS = {
+    "VideoProcessor": ".video_processor",
+    "send_discord": ".discord_notify",
+    "format_yt_links": ".discord_notify",
+    "JobStore": ".job_store",
+    "MediaCatalog": ".media_catalog",
+}
+
+__all__ = ["setup_logger", "clear_empty_data", "VideoProcessor", "send_discord", "format_yt_links", "JobStore", "MediaCatalog"]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
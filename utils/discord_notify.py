@@ -1,10 +1,198 @@
+import atexit
+import threading
+import time
+from collections import deque
+
 import requests
 
+from utils import setup_logger
+from utils.tracing import span
+
+logger = setup_logger("log")
+
 WEBHOOK_URL = "https://discord.com/api/webhooks/1516286271452872715/RIEvn5KR898gha9TMtjE0EIxYuE3D8xKXxmC7GFAm-51BcPurlOBt_i8OwnH89toXRus"
+# Discord 單則訊息的字數上限
+MAX_MESSAGE_LENGTH = 2000
 
 
-def send_discord(message: str) -> None:
+class DiscordNotifier:
+    def __init__(
+        self,
+        webhook_url=WEBHOOK_URL,
+        max_queue=100,
+        coalesce_window=2.0,
+        timeout=10,
+        max_retries=5,
+        session=None,
+    ):
+        """
+        在背景執行緒發送 Discord 通知，呼叫端不會被 webhook 回應時間拖慢
+
+        :param webhook_url: webhook 網址，測試時可指向本機的假伺服器
+        :param max_queue: 佇列上限，滿了時丟棄最舊的訊息
+        :param coalesce_window: 收到訊息後再等這麼久，把同一批訊息合併成一則
+        :param max_retries: 連線錯誤或 5xx 的重試次數（429 依 retry_after 等待，不計入）
+        :param session: requests.Session，預設建立一個共用連線的 session
+        """
+        self.webhook_url = webhook_url
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = session or requests.Session()
+        self.dropped = 0
+        self._pending = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = None
+
+    def notify(self, message: str) -> None:
+        """排入一則訊息後立即返回"""
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+                logger.warning("Discord notification queue full, dropping the oldest message")
+            self._pending.append(message)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="discord-notifier", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        等待佇列中的訊息都送出
+
+        :return: 是否在 timeout 內送完
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self.session.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                self._busy = True
+
+            # 短時間內的連續訊息（例如每個片段的通知）合併成一則
+            if self.coalesce_window:
+                time.sleep(self.coalesce_window)
+            with self._cond:
+                batch = list(self._pending)
+                self._pending.clear()
+
+            try:
+                for content in _pack(batch):
+                    with span("notify", messages=len(batch), chars=len(content)):
+                        self._post(content)
+            except Exception as e:
+                # 執行緒結束的話 _thread 不會清掉，之後的通知都不會送出；記錄後丟棄這一批
+                logger.error(f"Discord 通知發送失敗: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _post(self, content):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.webhook_url, json={"content": content}, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                if response.status_code == 429:
+                    delay = _retry_after(response)
+                    logger.warning(f"Discord rate limited, retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                if response.status_code < 500:
+                    if response.status_code >= 400:
+                        logger.error(f"Discord 通知發送失敗: HTTP {response.status_code} {response.text[:200]}")
+                    return
+                error = f"HTTP {response.status_code}"
+
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.error(f"Discord 通知發送失敗: {error}")
+                return
+            time.sleep(min(30, 2 ** (attempt - 1)))
+
+
+def _retry_after(response):
+    """429 回應的等待秒數，Discord 放在 JSON 的 retry_after，其他情況看 Retry-After header"""
     try:
-        requests.post(WEBHOOK_URL, json={"content": message}, timeout=10)
-    except Exception as e:
-        print(f"Discord 通知發送失敗: {e}")
+        return float(response.json()["retry_after"])
+    except Exception:
+        pass
+    try:
+        return float(response.headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+def _pack(messages):
+    """把多則訊息合併成不超過字數上限的幾則"""
+    packed = []
+    current = ""
+    for message in messages:
+        while len(message) > MAX_MESSAGE_LENGTH:
+            if current:
+                packed.append(current)
+                current = ""
+            packed.append(message[:MAX_MESSAGE_LENGTH])
+            message = message[MAX_MESSAGE_LENGTH:]
+        candidate = f"{current}\n{message}" if current else message
+        if len(candidate) > MAX_MESSAGE_LENGTH:
+            packed.append(current)
+            candidate = message
+        current = candidate
+    if current:
+        packed.append(current)
+    return packed
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier() -> DiscordNotifier:
+    """整個 process 共用的 DiscordNotifier，結束前會把剩下的訊息送完"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = DiscordNotifier()
+            atexit.register(_notifier.close)
+        return _notifier
+
+
+def send_discord(message: str) -> None:
+    get_notifier().notify(message)
+
+
+def format_yt_links(yt_urls) -> str:
+    """將上傳後的 YouTube 連結整理成通知用的文字"""
+    if len(yt_urls) == 1:
+        return f"YouTube：{yt_urls[0]}"
+    if yt_urls:
+        return "\n".join(f"YouTube ({i+1})：{u}" for i, u in enumerate(yt_urls))
+    return "（無 YouTube 連結）"
@@ -0,0 +1,214 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from utils import setup_logger
+from utils.disk_usage import dir_size
+from utils.job_store import owner_alive, worker_name
+
+logger = setup_logger("log")
+
+LIVE = 0
+BACKLOG = 1
+# Twitch 1080p60 來源畫質約 6–8 Mbit/s，無法取得位元率時以此估計
+DEFAULT_BITRATE_BPS = 8_000_000
+# 直播或影片長度未知時以此估計
+DEFAULT_DURATION_HOURS = 12
+# 其他主機的預留超過這麼久沒有 heartbeat 視為已中斷
+RESERVATION_STALE_AFTER = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reservations (
+    key TEXT PRIMARY KEY,
+    nbytes INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    workspace TEXT,
+    worker TEXT NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+def estimate_footprint(duration, bitrate_bps=None, copies=1, margin=0.1):
+    """
+    估計一個 job 的最大磁碟用量
+
+    :param duration: 影片長度（秒）
+    :param bitrate_bps: 位元率（bit/s），None 時使用 DEFAULT_BITRATE_BPS
+    :param copies: 同時存在的份數，例如錄影的 .ts 加上轉檔後的 .mp4 為 2
+    :param margin: 額外保留的比例
+    :return: bytes
+    """
+    source_bytes = duration * (bitrate_bps or DEFAULT_BITRATE_BPS) / 8
+    return int(source_bytes * copies * (1 + margin))
+
+
+@dataclass
+class Reservation:
+    key: str
+    nbytes: int
+    priority: int
+    workspace: Optional[str] = None
+
+    def outstanding(self):
+        """尚未寫入磁碟的預留量；已寫入的部分會反映在剩餘空間上"""
+        if not self.workspace:
+            return self.nbytes
+        return max(0, self.nbytes - dir_size(self.workspace))
+
+
+class DiskAdmission:
+    def __init__(
+        self, path="downloader", min_free_gb=5, poll_interval=30, db_path="jobs.db", heartbeat_interval=60,
+    ):
+        """
+        下載與錄影的磁碟空間准入控制：寫入前先預留估計用量，空間不足的 backlog 下載延後
+
+        預留記錄在與 JobStore 共用的 SQLite 資料庫，同一台機器上的 monitor、supervisor 與
+        auto-upload 會看到彼此的預留；process 結束或停止 heartbeat 的預留會被清掉。
+
+        :param path: 要檢查的磁碟路徑
+        :param min_free_gb: 永遠保留的剩餘空間
+        :param poll_interval: 等待空間時重新檢查的間隔（秒）
+        :param db_path: 資料庫檔案
+        :param heartbeat_interval: 更新自己預留的 heartbeat 的間隔（秒）
+        """
+        self.path = path
+        self.min_free_bytes = int(min_free_gb * 1024 ** 3)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.worker = worker_name(thread=False)
+        self._lock = threading.RLock()
+        self._released = threading.Condition()
+        self._closed = threading.Event()
+        self._heartbeat_thread = None
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._conn.execute("DELETE FROM reservations WHERE worker = ?", (self.worker,))
+            self._conn.close()
+
+    def _live_reservations(self) -> List[Reservation]:
+        """清掉已中斷的 process 留下的預留，回傳其餘的預留；需在交易中呼叫"""
+        reservations = []
+        for row in self._conn.execute("SELECT * FROM reservations").fetchall():
+            if owner_alive(row["worker"], row["heartbeat"], RESERVATION_STALE_AFTER):
+                reservations.append(Reservation(row["key"], row["nbytes"], row["priority"], row["workspace"]))
+            else:
+                logger.warning(f"Dropping stale disk reservation {row['key']} held by {row['worker']}")
+                self._conn.execute("DELETE FROM reservations WHERE key = ?", (row["key"],))
+        return reservations
+
+    def _available(self, reservations):
+        os.makedirs(self.path, exist_ok=True)
+        free = shutil.disk_usage(self.path).free
+        reserved = sum(reservation.outstanding() for reservation in reservations)
+        return free - self.min_free_bytes - reserved
+
+    def available(self):
+        """扣除保留空間與其他 job 尚未寫入的預留量後可用的 bytes"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                reservations = self._live_reservations()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._available(reservations)
+
+    def acquire(self, key, nbytes, priority=BACKLOG, workspace=None, max_wait=None, stop=None):
+        """
+        預留磁碟空間
+
+        直播錄影不能延後，空間不足時仍會准入並發出警告，它的預留會擋下之後的 backlog 下載；
+        backlog 下載等到空間足夠才准入，沒有其他預留可以釋放時直接延後。
+
+        :param key: job 的識別字串，release 時使用
+        :param nbytes: 預估的最大用量
+        :param workspace: job 的工作目錄，用來扣除已寫入的部分
+        :param max_wait: backlog 最多等待秒數，None 表示一直等
+        :param stop: threading.Event，設定後放棄等待
+        :return: Reservation，延後時回傳 None
+        """
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        while True:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    reservations = [r for r in self._live_reservations() if r.key != key]
+                    available = self._available(reservations)
+                    admit = nbytes <= available or priority == LIVE
+                    if admit:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO reservations (key, nbytes, priority, workspace, worker, heartbeat) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, nbytes, priority, workspace, self.worker, time.time()),
+                        )
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+            if admit:
+                if nbytes > available:
+                    logger.warning(
+                        f"Admitting live recording {key} with only {available / 1024 ** 3:.1f} GB "
+                        f"available for an estimated {nbytes / 1024 ** 3:.1f} GB"
+                    )
+                logger.info(f"Reserved {nbytes / 1024 ** 3:.1f} GB of disk space for {key}")
+                self._start_heartbeat()
+                return Reservation(key, nbytes, priority, workspace)
+
+            # 沒有其他進行中的 job 時，等待也不會釋放空間
+            gave_up = (stop and stop.is_set()) or (deadline and time.monotonic() >= deadline)
+            if gave_up or not reservations:
+                logger.warning(
+                    f"Deferring {key}: needs {nbytes / 1024 ** 3:.1f} GB, "
+                    f"{available / 1024 ** 3:.1f} GB available"
+                )
+                return None
+            logger.info(
+                f"Waiting for disk space for {key}: needs {nbytes / 1024 ** 3:.1f} GB, "
+                f"{available / 1024 ** 3:.1f} GB available"
+            )
+            # 同一個 process 的 release 會提早喚醒，其他 process 的 release 等下一次輪詢
+            with self._released:
+                self._released.wait(self.poll_interval)
+
+    def release(self, key):
+        """job 完成（檔案已刪除）或放棄時釋放預留"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM reservations WHERE key = ?", (key,))
+        if cursor.rowcount:
+            logger.info(f"Released disk reservation for {key}")
+        with self._released:
+            self._released.notify_all()
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat, name="disk-admission-heartbeat", daemon=True,
+                )
+                self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        """定期更新自己的預留，其他主機以此判斷預留是否還有效"""
+        while not self._closed.wait(self.heartbeat_interval):
+            try:
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE reservations SET heartbeat = ? WHERE worker = ?", (time.time(), self.worker),
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to refresh disk reservations: {e}")
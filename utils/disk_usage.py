@@ -0,0 +1,21 @@
+import os
+
+
+def file_size(path):
+    """檔案大小（bytes），檔案不存在時為 None"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def dir_size(root):
+    """目錄中所有檔案的大小總和（bytes），掃描途中被刪除的檔案略過"""
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
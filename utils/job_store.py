@@ -0,0 +1,339 @@
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+DETECTED = "detected"
+DOWNLOADING = "downloading"
+DOWNLOADED = "downloaded"
+SPLIT = "split"
+UPLOADING = "uploading"
+UPLOADED = "uploaded"
+FAILED = "failed"
+
+JOB_STATES = (DETECTED, DOWNLOADING, DOWNLOADED, SPLIT, UPLOADING, UPLOADED, FAILED)
+# 中斷時停在這些狀態的 job，重啟後退回上一個可重做的狀態
+# kind：vod 是 Twitch 存檔影片，recording 是直播錄影，upload 是 videos 目錄中遺留、只需上傳的檔案
+RECOVERY = {
+    ("vod", DOWNLOADING): DETECTED,
+    ("recording", DOWNLOADING): DOWNLOADED,
+    ("vod", UPLOADING): SPLIT,
+    ("recording", UPLOADING): DOWNLOADED,
+    ("upload", UPLOADING): SPLIT,
+}
+# 其他主機的 worker 無法檢查 process，超過這麼久沒有更新的 job 視為中斷
+STALE_AFTER = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    source_url TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    channel TEXT,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    workspace TEXT NOT NULL DEFAULT '',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    duration REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_seq ON jobs(state, seq);
+CREATE INDEX IF NOT EXISTS idx_jobs_channel_seq ON jobs(kind, channel, seq);
+CREATE TABLE IF NOT EXISTS uploads (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    part TEXT NOT NULL,
+    yt_url TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (job_id, part)
+);
+"""
+
+
+def worker_name(thread=True):
+    """目前執行緒的 worker 識別字串 host:pid[:thread]，recover 依此判斷 job 的 process 是否還在"""
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{name}:{threading.current_thread().name}" if thread else name
+
+
+def owner_alive(worker, updated_at, stale_after=STALE_AFTER):
+    """
+    worker 所屬的 process 是否還在執行
+
+    :param worker: worker_name() 的字串
+    :param updated_at: job 最後更新的時間，其他主機的 worker 以此判斷
+    """
+    if not worker:
+        return False
+    host, _, rest = worker.partition(":")
+    pid = rest.split(":", 1)[0]
+    if host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # process 存在但屬於其他使用者
+            return True
+        return True
+    return time.time() - updated_at < stale_after
+
+
+@dataclass
+class Job:
+    """一支 VOD 或一場直播錄影的處理工作"""
+
+    id: int
+    kind: str
+    source_url: str
+    title: str
+    channel: Optional[str]
+    seq: int
+    state: str
+    workspace: str
+    worker: Optional[str]
+    attempts: int
+    error: Optional[str]
+    duration: Optional[float]
+    created_at: float
+    updated_at: float
+
+
+class JobStore:
+    def __init__(self, db_path="jobs.db", workspace_root="downloader/jobs", max_attempts=3):
+        """
+        SQLite 工作佇列，取代掃描 videos 目錄與 latest.json
+
+        :param db_path: 資料庫檔案
+        :param workspace_root: 每個 job 的工作目錄會建立在這裡
+        :param max_attempts: 同一個 job 失敗幾次後標記為 failed
+        """
+        self.db_path = db_path
+        self.workspace_root = workspace_root
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        # isolation_level=None：自行控制交易，狀態轉移都是單一 UPDATE
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _row_to_job(self, row):
+        return Job(**dict(row)) if row else None
+
+    def add_job(self, kind, source_url, title, channel=None, seq=None, duration=None) -> Job:
+        """
+        新增 job，同一個 source_url 只會有一筆
+
+        :param seq: 排序用的序號（VOD 用 Twitch 影片 ID），預設為目前時間
+        :return: 新增或既有的 Job
+        """
+        now = time.time()
+        if seq is None:
+            seq = time.time_ns()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, source_url, title, channel, seq, state, duration, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, source_url, title, channel, seq, DETECTED, duration, now, now),
+            )
+            if cursor.rowcount:
+                job_id = cursor.lastrowid
+                workspace = os.path.join(self.workspace_root, f"{job_id:06d}")
+                self._conn.execute("UPDATE jobs SET workspace = ? WHERE id = ?", (workspace, job_id))
+            row = self._conn.execute("SELECT * FROM jobs WHERE source_url = ?", (source_url,)).fetchone()
+        job = self._row_to_job(row)
+        os.makedirs(job.workspace, exist_ok=True)
+        return job
+
+    def get(self, job_id) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def transition(self, job_id, from_states, to_state, worker=None, error=None) -> bool:
+        """
+        原子性的狀態轉移，只有目前狀態在 from_states 中才會成功
+
+        :return: 是否成功轉移
+        """
+        if isinstance(from_states, str):
+            from_states = (from_states,)
+        placeholders = ", ".join("?" for _ in from_states)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET state = ?, worker = ?, error = ?, updated_at = ? "
+                f"WHERE id = ? AND state IN ({placeholders})",
+                (to_state, worker, error, time.time(), job_id, *from_states),
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, from_state, to_state, worker, kind=None) -> Optional[Job]:
+        """取出最舊（seq 最小）的一筆 from_state job 並轉為 to_state，多個 worker 同時呼叫也不會重複"""
+        query = "SELECT id FROM jobs WHERE state = ? AND attempts < ?"
+        params = [from_state, self.max_attempts]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY seq LIMIT 1"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(query, params).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, worker = ?, updated_at = ? WHERE id = ?",
+                    (to_state, worker, time.time(), row["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def fail(self, job_id, state, error):
+        """
+        記錄失敗並退回 state 以便重試；超過 max_attempts 次則標記為 failed
+
+        :return: 更新後的 Job
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET attempts = attempts + 1, error = ?, worker = NULL, updated_at = ?, "
+                "state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE id = ?",
+                (str(error), time.time(), self.max_attempts, FAILED, state, job_id),
+            )
+        return self.get(job_id)
+
+    def list_jobs(self, states: Optional[Iterable[str]] = None, kind=None, channel=None) -> List[Job]:
+        query = "SELECT * FROM jobs WHERE 1 = 1"
+        params = []
+        if states:
+            states = list(states)
+            query += f" AND state IN ({', '.join('?' for _ in states)})"
+            params.extend(states)
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if channel:
+            query += " AND channel = ?"
+            params.append(channel)
+        query += " ORDER BY seq"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def pending_jobs(self, kind=None, channel=None) -> List[Job]:
+        """尚未完成、也還沒超過重試次數的 job，由舊到新"""
+        return [
+            job
+            for job in self.list_jobs(
+                [DETECTED, DOWNLOADING, DOWNLOADED, SPLIT, UPLOADING], kind=kind, channel=channel
+            )
+            if job.attempts < self.max_attempts
+        ]
+
+    def latest_source(self, kind, channel=None) -> Optional[str]:
+        """最新（seq 最大）的 job 來源網址，作為偵測新影片的停止點"""
+        query = "SELECT source_url FROM jobs WHERE kind = ?"
+        params = [kind]
+        if channel:
+            query += " AND channel = ?"
+            params.append(channel)
+        query += " ORDER BY seq DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+        return row["source_url"] if row else None
+
+    def record_upload(self, job_id, part, yt_url):
+        """記錄單一檔案已上傳，重做時可以跳過"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (job_id, part, yt_url, uploaded_at) VALUES (?, ?, ?, ?)",
+                (job_id, part, yt_url, time.time()),
+            )
+
+    def uploaded_parts(self, job_id) -> Dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT part, yt_url FROM uploads WHERE job_id = ? ORDER BY part", (job_id,)
+            ).fetchall()
+        return {row["part"]: row["yt_url"] for row in rows}
+
+    def recover(self, kind) -> int:
+        """
+        將上次中斷在進行中狀態的 job 退回可重做的狀態
+        只處理 worker 已不存在（process 已結束，或其他主機的 job 太久沒有更新）的 job，
+        其他 process 正在進行的 job 不受影響
+
+        :return: 被退回的 job 數量
+        """
+        targets = {state: target for (job_kind, state), target in RECOVERY.items() if job_kind == kind}
+        if not targets:
+            return 0
+        placeholders = ", ".join("?" for _ in targets)
+        recovered = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT id, state, worker, updated_at FROM jobs WHERE kind = ? AND state IN ({placeholders})",
+                    (kind, *targets),
+                ).fetchall()
+                for row in rows:
+                    if owner_alive(row["worker"], row["updated_at"]):
+                        continue
+                    cursor = self._conn.execute(
+                        "UPDATE jobs SET state = ?, worker = NULL, updated_at = ? WHERE id = ? AND state = ?",
+                        (targets[row["state"]], time.time(), row["id"], row["state"]),
+                    )
+                    recovered += cursor.rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return recovered
+
+
+def start_recording_job(store, channel_name, channel_url):
+    """每場直播錄影是一個 recording job，錄在 job 的工作目錄，狀態為 downloading"""
+    timestamp = int(time.time())
+    job = store.add_job(
+        "recording", f"{channel_url}#{timestamp}", f"{channel_name}_{timestamp}",
+        channel=channel_name, seq=timestamp,
+    )
+    store.transition(job.id, DETECTED, DOWNLOADING, worker=worker_name())
+    return store.get(job.id)
+
+
+def workspace_files(workspace):
+    """job 工作目錄中的檔案名稱，不含隱藏檔"""
+    return [name for name in os.listdir(workspace) if not name.startswith(".")] if os.path.isdir(workspace) else []
+
+
+def finish_segmented_job(store, job, recorded, upload_success):
+    """
+    邊錄邊傳的 job 在上傳佇列結束後的狀態：全部傳完為 uploaded；
+    工作目錄還有片段（轉檔或上傳失敗）時退回 downloaded，重啟後由錄影後處理接續；否則為 failed
+    """
+    if recorded and upload_success and not workspace_files(job.workspace):
+        store.transition(job.id, DOWNLOADING, UPLOADED)
+        shutil.rmtree(job.workspace, ignore_errors=True)
+    elif workspace_files(job.workspace):
+        store.transition(job.id, DOWNLOADING, DOWNLOADED, error="upload failed" if recorded else "recording failed")
+    else:
+        store.transition(job.id, DOWNLOADING, FAILED, error="recording failed")
@@ -1,63 +1,232 @@
 # logger.py
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import threading
+import time
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_DIR = "logs"
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_BYTES = 10 * 1024 * 1024  # 10MB
+BACKUP_COUNT = 5
+# 子行程進度事件的最短間隔（秒），每秒最多幾筆
+PROGRESS_INTERVAL = 0.5
+
+# LogRecord 內建的欄位，其餘是以 extra 傳入的結構化欄位
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_lock = threading.Lock()
+# 所有 logger 共用一個佇列與一個背景執行緒，console 也只有一個 handler
+_queue = queue.SimpleQueue()
+_listener = None
+_output_handlers = []
+_json_output = os.getenv("LOG_FORMAT", "").lower() == "json"
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆 log 輸出成一行 JSON，extra 傳入的欄位（例如進度事件）一併輸出"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DailyFileHandler(RotatingFileHandler):
+    def __init__(self, directory, prefix, **kwargs):
+        """
+        寫到 {prefix}_{日期}.log，跨日後自動改寫新一天的檔案；單檔超過大小上限時照舊輪替備份
+
+        :param directory: log 目錄
+        :param prefix: 檔名前綴
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.day = datetime.now().strftime("%Y-%m-%d")
+        super().__init__(self._path(self.day), **kwargs)
+
+    def _path(self, day):
+        return os.path.join(self.directory, f"{self.prefix}_{day}.log")
+
+    def emit(self, record):
+        day = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d")
+        if day != self.day:
+            self.day = day
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            # 下一次寫入時才開啟新的檔案
+            self.baseFilename = os.path.abspath(self._path(day))
+        super().emit(record)
+
+
+class _FileRouter(logging.Handler):
+    """依 record.name 把紀錄交給對應 logger 的檔案 handler（子 logger 沿用上層的檔案）"""
+
+    def __init__(self):
+        super().__init__()
+        self.handlers = {}
+
+    def emit(self, record):
+        name = record.name
+        while name:
+            handler = self.handlers.get(name)
+            if handler is not None:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                return
+            name = name.rpartition(".")[0]
+
+
+_file_router = _FileRouter()
+_console_handler = logging.StreamHandler()
+
+
+def _formatter():
+    if _json_output:
+        return JsonFormatter()
+    return logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+
+
+def set_json_output(enabled=True):
+    """切換所有 logger 的檔案與 console 輸出為 JSON 或文字格式（也可用環境變數 LOG_FORMAT=json）"""
+    global _json_output
+    with _lock:
+        _json_output = enabled
+        for handler in _output_handlers:
+            handler.setFormatter(_formatter())
 
 
 def setup_logger(name, log_file=None, level=logging.INFO):
     """設定 logger
 
+    logger 本身只把紀錄放進共用的佇列，由同一個背景執行緒寫入檔案與 console，寫 log 不會拖慢呼叫端
+
     Args:
         name (str): logger 名稱
-        log_file (str, optional): log 檔案名稱. 如果為 None，則使用日期作為檔名
+        log_file (str, optional): log 檔案名稱. 如果為 None，則使用 {name}_{日期}.log，每天換一個檔案
         level (int, optional): logging 等級. Defaults to logging.INFO.
 
     Returns:
         logging.Logger: 設定好的 logger
     """
     # 建立 logs 目錄（如果不存在）
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    # 如果沒有指定 log_file，使用日期作為檔名
-    if log_file is None:
-        today = datetime.now().strftime("%Y-%m-%d")
-        log_file = f"{name}_{today}.log"
-
-    log_path = os.path.join(log_dir, log_file)
+    os.makedirs(LOG_DIR, exist_ok=True)
 
     # 建立 logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    # 避免重複添加 handlers
-    if not logger.handlers:
-        # 建立 rotating file handler (最大 10MB，保留 5 個備份)
-        file_handler = RotatingFileHandler(
-            log_path,
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=5,
-            encoding="utf-8",
-        )
+    with _lock:
+        # 避免重複添加 handlers
+        if logger.handlers:
+            return logger
+
+        # 檔案在第一次寫入時才建立，避免留下空檔
+        if log_file is None:
+            file_handler = DailyFileHandler(
+                LOG_DIR, name, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8", delay=True
+            )
+        else:
+            file_handler = RotatingFileHandler(
+                os.path.join(LOG_DIR, log_file),
+                maxBytes=MAX_BYTES,
+                backupCount=BACKUP_COUNT,
+                encoding="utf-8",
+                delay=True,
+            )
         file_handler.setLevel(level)
+        file_handler.setFormatter(_formatter())
+        _output_handlers.append(file_handler)
+        _file_router.handlers[name] = file_handler
+
+        global _listener
+        if _listener is None:
+            _console_handler.setFormatter(_formatter())
+            if _console_handler not in _output_handlers:
+                _output_handlers.append(_console_handler)
+            _listener = QueueListener(_queue, _file_router, _console_handler)
+            _listener.start()
+        logger.addHandler(QueueHandler(_queue))
 
-        # 建立 console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(level)
+    return logger
 
-        # 設定 log 格式
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
 
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
+@atexit.register
+def flush_logs():
+    """把佇列中剩下的紀錄寫完；程式結束時自動呼叫"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
 
-        # 將 handlers 加入 logger
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
 
-    return logger
+class ProgressLogger:
+    def __init__(self, logger, stage, interval=PROGRESS_INTERVAL):
+        """
+        把子行程或下載迴圈的進度轉成結構化的 log 事件，並限制輸出頻率
+
+        :param logger: 輸出用的 logger
+        :param stage: 階段名稱，例如 "download"、"remux"
+        :param interval: 兩筆事件的最短間隔（秒）
+        """
+        self.logger = logger
+        self.stage = stage
+        self.interval = interval
+        self._last = 0.0
+
+    def update(self, name, done_bytes=None, total_bytes=None, seconds=None, speed=None, force=False, **fields):
+        """
+        :param name: 正在處理的檔案或項目
+        :param done_bytes: 已處理的 bytes
+        :param total_bytes: 總 bytes，未知時為 None
+        :param seconds: 已處理的媒體時間（秒）
+        :param speed: bytes/s，或 ffmpeg 的處理倍速（字串，例如 "35.2x"）
+        :param force: 不受頻率限制（例如完成時）
+        :return: 是否有輸出
+        """
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return False
+        self._last = now
+
+        parts = []
+        if done_bytes is not None:
+            if total_bytes:
+                parts.append(f"{done_bytes / total_bytes * 100:.1f}% of {total_bytes / 1e6:.0f} MB")
+            else:
+                parts.append(f"{done_bytes / 1e6:.0f} MB")
+        if seconds is not None:
+            parts.append(f"{seconds / 3600:.2f} h")
+        if isinstance(speed, (int, float)):
+            parts.append(f"{speed * 8 / 1e6:.1f} Mbit/s")
+        elif speed:
+            parts.append(str(speed))
+        parts.extend(f"{key} {value}" for key, value in fields.items() if value is not None)
+
+        event = {
+            "event": "progress",
+            "stage": self.stage,
+            "item": name,
+            "done_bytes": done_bytes,
+            "total_bytes": total_bytes,
+            "media_seconds": seconds,
+            "speed": speed,
+            **fields,
+        }
+        self.logger.info(f"{self.stage} {name}: {', '.join(parts)}", extra=event)
+        return True
@@ -0,0 +1,266 @@
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from utils import setup_logger
+from utils.tracing import span
+
+logger = setup_logger("log")
+
+# 常駐的程序每隔多久清掉一次已不存在的檔案紀錄（秒）
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    duration REAL,
+    start_time REAL,
+    bit_rate INTEGER,
+    format_name TEXT,
+    streams TEXT NOT NULL DEFAULT '[]',
+    keyframes TEXT,
+    probed_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class MediaInfo:
+    """單一媒體檔的 ffprobe 結果"""
+
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    duration: Optional[float] = None
+    # 容器的起始時間戳（秒），.ts 錄影通常不是 0；ffmpeg 的 -ss 以此為起點
+    start_time: Optional[float] = None
+    bit_rate: Optional[int] = None
+    format_name: Optional[str] = None
+    streams: List[dict] = field(default_factory=list)
+    keyframes: Optional[List[Tuple[float, int]]] = None
+
+    @property
+    def key(self):
+        return (self.path, self.size, self.mtime_ns, self.inode)
+
+    def codec(self, codec_type):
+        """第一個指定類型（video / audio）串流的編碼名稱"""
+        for stream in self.streams:
+            if stream.get("codec_type") == codec_type:
+                return stream.get("codec_name")
+        return None
+
+
+def media_key(file_path):
+    """用路徑、大小、修改時間與 inode 判斷是否為同一個檔案"""
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class MediaCatalog:
+    def __init__(self, db_path="media_catalog.db", cache_size=256, ffprobe_path=None):
+        """
+        ffprobe 結果的持久化快取，同一個檔案只需要 probe 一次
+
+        :param db_path: SQLite 檔案
+        :param cache_size: 記憶體 LRU 的筆數
+        :param ffprobe_path: ffprobe 路徑，預設從 PATH 尋找
+        """
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.ffprobe_path = ffprobe_path or shutil.which("ffprobe")
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(media)")}
+        if "start_time" not in columns:
+            # 舊版的快取沒有 start_time，清空後重新 probe
+            self._conn.execute("DROP TABLE media")
+            self._conn.executescript(SCHEMA)
+        self._pruned_at = 0.0
+        self.prune()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def prune(self):
+        """
+        刪除檔案已不存在的紀錄（上傳後被刪掉的錄影、切割片段等）
+
+        :return: 刪除的筆數
+        """
+        with self._lock:
+            paths = [row["path"] for row in self._conn.execute("SELECT path FROM media")]
+            missing = [(path,) for path in paths if not os.path.exists(path)]
+            if missing:
+                self._conn.executemany("DELETE FROM media WHERE path = ?", missing)
+                gone = {path for (path,) in missing}
+                for key in [key for key in self._cache if key[0] in gone]:
+                    del self._cache[key]
+            self._pruned_at = time.time()
+        if missing:
+            logger.info(f"Pruned {len(missing)} media catalog entries for removed files")
+        return len(missing)
+
+    def info(self, file_path) -> Optional[MediaInfo]:
+        """
+        取得檔案的媒體資訊；檔案有變動或沒有紀錄時才執行 ffprobe
+
+        :return: MediaInfo，檔案不存在或 probe 失敗時回傳 None
+        """
+        try:
+            key = media_key(file_path)
+        except OSError:
+            return None
+
+        info = self._lookup(key)
+        if info is not None:
+            return info
+
+        info = self._probe(file_path, key)
+        if info is not None:
+            self._store(info)
+        return info
+
+    def keyframes(self, file_path, build) -> List[Tuple[float, int]]:
+        """
+        取得關鍵影格索引，沒有快取時呼叫 build(file_path) 建立並保存
+
+        :param build: 建立索引的函式，回傳 [(時間, 檔案位置)]
+        """
+        info = self.info(file_path)
+        if info is None:
+            return build(file_path)
+        if info.keyframes is not None:
+            return info.keyframes
+
+        keyframes = build(file_path)
+        if keyframes:
+            info.keyframes = keyframes
+            self._store(info)
+        return keyframes
+
+    def _lookup(self, key):
+        with self._lock:
+            info = self._cache.get(key)
+            if info is not None:
+                self._cache.move_to_end(key)
+                return info
+
+            row = self._conn.execute("SELECT * FROM media WHERE path = ?", (key[0],)).fetchone()
+        if row is None or (row["path"], row["size"], row["mtime_ns"], row["inode"]) != key:
+            return None
+
+        keyframes = json.loads(row["keyframes"]) if row["keyframes"] else None
+        info = MediaInfo(
+            path=row["path"],
+            size=row["size"],
+            mtime_ns=row["mtime_ns"],
+            inode=row["inode"],
+            duration=row["duration"],
+            start_time=row["start_time"],
+            bit_rate=row["bit_rate"],
+            format_name=row["format_name"],
+            streams=json.loads(row["streams"]),
+            keyframes=[tuple(frame) for frame in keyframes] if keyframes is not None else None,
+        )
+        self._remember(info)
+        return info
+
+    def _remember(self, info):
+        with self._lock:
+            self._cache[info.key] = info
+            self._cache.move_to_end(info.key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _store(self, info):
+        keyframes = json.dumps(info.keyframes) if info.keyframes is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media "
+                "(path, size, mtime_ns, inode, duration, start_time, bit_rate, format_name, streams, keyframes, "
+                "probed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    info.path, info.size, info.mtime_ns, info.inode, info.duration, info.start_time, info.bit_rate,
+                    info.format_name, json.dumps(info.streams), keyframes, time.time(),
+                ),
+            )
+        self._remember(info)
+        if time.time() - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def _probe(self, file_path, key):
+        if not self.ffprobe_path:
+            logger.warning("FFprobe not found in system PATH. Please install FFmpeg.")
+            return None
+
+        cmd = [
+            self.ffprobe_path,
+            "-v", "quiet",
+            "-print_format", "json",
+            "-show_format",
+            "-show_streams",
+            file_path,
+        ]
+        try:
+            with span("ffprobe", bytes=key[1]) as s:
+                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+                s.set_attribute("exit_code", result.returncode)
+        except Exception as e:
+            logger.error(f"Error probing {file_path}: {str(e)}")
+            return None
+        if result.returncode != 0:
+            logger.error(f"FFprobe error: {result.stderr}")
+            return None
+
+        data = json.loads(result.stdout or "{}")
+        fmt = data.get("format", {})
+        streams = [
+            {
+                name: stream[name]
+                for name in ("index", "codec_type", "codec_name", "width", "height", "r_frame_rate",
+                             "sample_rate", "channels", "bit_rate")
+                if name in stream
+            }
+            for stream in data.get("streams", [])
+        ]
+        return MediaInfo(
+            path=key[0],
+            size=key[1],
+            mtime_ns=key[2],
+            inode=key[3],
+            duration=float(fmt["duration"]) if fmt.get("duration") else None,
+            start_time=float(fmt["start_time"]) if fmt.get("start_time") else None,
+            bit_rate=int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+            format_name=fmt.get("format_name"),
+            streams=streams,
+        )
+
+
+_default_catalog = None
+_default_lock = threading.Lock()
+
+
+def get_default_catalog():
+    """整個 process 共用的 MediaCatalog"""
+    global _default_catalog
+    with _default_lock:
+        if _default_catalog is None:
+            _default_catalog = MediaCatalog()
+        return _default_catalog
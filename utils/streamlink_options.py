@@ -0,0 +1,17 @@
+# Shared by the streamlink CLI the recorder spawns and the in-process session StreamMonitor resolves streams with
+STREAMLINK_OPTIONS = [
+    "--hls-live-restart",
+    "--stream-segment-threads", "5",
+    "--stream-segment-attempts", "5",
+    "--stream-segment-timeout", "20",
+    "--retry-streams", "30",
+    "--retry-max", "5",
+]
+
+# Same segment settings as STREAMLINK_OPTIONS, for the in-process Streamlink session
+STREAMLINK_SESSION_OPTIONS = {
+    "hls-live-restart": True,
+    "stream-segment-threads": 5,
+    "stream-segment-attempts": 5,
+    "stream-segment-timeout": 20,
+}
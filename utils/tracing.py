@@ -0,0 +1,176 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+SERVICE_NAME = "twitch-monitor"
+# OTLP 的 span kind 與 status code
+SPAN_KIND_INTERNAL = 1
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _attribute_value(value):
+    """轉成 OTLP JSON 的 AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(values):
+    return [{"key": key, "value": _attribute_value(value)} for key, value in values.items() if value is not None]
+
+
+class Span:
+    """一個計時的階段，結束時交給 exporter"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status_code = STATUS_UNSET
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_error(self, error):
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error)
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)})
+
+    @property
+    def duration(self):
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "events": [
+                {"timeUnixNano": str(ts), "name": name, "attributes": _attributes(attrs)}
+                for ts, name, attrs in self.events
+            ],
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class JsonlSpanExporter:
+    def __init__(self, path, service_name=SERVICE_NAME):
+        """
+        每個 span 寫成一行 OTLP JSON（與 OpenTelemetry Collector 的 file exporter 相同格式），
+        可直接用 otlpjsonfile receiver 匯入 Jaeger / Tempo 等工具
+
+        :param path: 輸出的 JSONL 檔
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.resource = {"attributes": _attributes({"service.name": service_name, "process.pid": os.getpid()})}
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def export(self, span: Span):
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": self.resource,
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [span.to_otlp()]}],
+            }]
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_exporter: Optional[JsonlSpanExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def configure_tracing(path=None):
+    """
+    開始把 span 寫到 path；沒有指定時讀取環境變數 TRACE_FILE，兩者都沒有時 span 只計時不輸出
+
+    :return: 是否啟用輸出
+    """
+    global _exporter
+    path = path or os.getenv("TRACE_FILE")
+    with _exporter_lock:
+        if _exporter is not None:
+            _exporter.close()
+            _exporter = None
+        if path:
+            _exporter = JsonlSpanExporter(path)
+    return _exporter is not None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    以 with 包住一個階段；巢狀的 span 會自動成為子 span，例外會記錄在 status 後繼續拋出
+
+        with span("download", url=url) as s:
+            ...
+            s.set_attribute("bytes", size)
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        exporter = _exporter
+        if exporter is not None:
+            try:
+                exporter.export(current)
+            except (OSError, ValueError):
+                pass
+
+
+def current_span():
+    """目前的 span；不在任何 span 內時回傳不會輸出的空 span，可直接 set_attribute"""
+    return _current_span.get() or Span("unused")
+
+
+def current_context():
+    """目前的 span context，交給其他執行緒時以 ctx.run(fn) 執行，子 span 才會接在同一個 trace 下"""
+    return contextvars.copy_context()
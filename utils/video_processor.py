@@ -1,16 +1,152 @@
 import subprocess
+import csv
 import os
-import json
+import math
 import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from utils import setup_logger
+from utils.media_catalog import get_default_catalog
+from utils.tracing import span, current_context
 
 logger = setup_logger("log")
 
 
+def read_segment_list(segment_list, output_dir):
+    """
+    讀取 ffmpeg -segment_list (csv) 中已完成的片段
+
+    :return: 已完成片段的路徑列表
+    """
+    if not os.path.exists(segment_list):
+        return []
+    with open(segment_list, "r", encoding="utf-8", newline="") as file:
+        text = file.read()
+    lines = text.splitlines()
+    if not text.endswith("\n"):
+        lines = lines[:-1]  # 最後一行還沒寫完
+    return [os.path.join(output_dir, row[0]) for row in csv.reader(lines) if row]
+
+
+def watch_segment_list(segment_list, output_dir, on_segment, stop, poll_interval=2):
+    """
+    監看 segment list，每完成一個片段就呼叫 on_segment(path)，直到 stop 被設定
+
+    :return: 所有完成的片段路徑
+    """
+    segments = []
+    while True:
+        finished = stop.is_set()
+        completed = read_segment_list(segment_list, output_dir)
+        for path in completed[len(segments):]:
+            segments.append(path)
+            try:
+                on_segment(path)
+            except Exception as e:
+                logger.error(f"Error handling finished segment {path}: {e}")
+        if finished:
+            break
+        stop.wait(poll_interval)
+    if os.path.exists(segment_list):
+        os.remove(segment_list)
+    return segments
+
+
+def truncate_incomplete_fragments(path):
+    """
+    修復中斷的 fragmented MP4 錄影：截掉結尾寫到一半的 box，以及沒有對應 mdat 的 moof
+
+    :return: 修復後的檔案大小，不是 MP4 時回傳 None
+    """
+    size = os.path.getsize(path)
+    good_end = 0
+    offset = 0
+    with open(path, "rb") as file:
+        while offset + 8 <= size:
+            file.seek(offset)
+            header = file.read(16)
+            box_size, box_type = struct.unpack(">I4s", header[:8])
+            header_size = 8
+            if box_size == 1:
+                if len(header) < 16:
+                    break
+                box_size = struct.unpack(">Q", header[8:16])[0]
+                header_size = 16
+            # size 為 0 代表長度未寫入，只會出現在沒寫完的 box
+            if box_size < header_size or offset + box_size > size:
+                break
+            if offset == 0 and box_type != b"ftyp":
+                return None
+            offset += box_size
+            # 片段要等 mdat 寫完才算完整
+            if box_type != b"moof":
+                good_end = offset
+
+    if good_end < size:
+        logger.warning(f"Truncating {size - good_end} bytes of incomplete fragments from {path}")
+        with open(path, "r+b") as file:
+            file.truncate(good_end)
+    return good_end
+
+
+# YouTube 單支影片上限為 256 GB 或 12 小時，保留餘裕
+DEFAULT_MAX_PART_BYTES = 128 * 1024 ** 3
+
+
+def plan_cut_points(keyframes, duration, max_seconds, max_bytes=None, file_size=None):
+    """
+    依關鍵影格規劃切點，讓每段同時不超過時長與大小上限
+
+    :param keyframes: [(時間, 檔案位置)]，依時間排序；時間以檔案開頭為 0（已扣除容器的 start_time）
+    :param duration: 影片總長（秒）
+    :param max_seconds: 每段最長秒數
+    :param max_bytes: 每段最大 bytes，None 表示不限制
+    :param file_size: 檔案大小，用來估計最後一段的大小
+    :return: [(開始時間, 結束時間)]，結束時間為 None 代表到檔尾
+    """
+    if not keyframes:
+        return [(0.0, None)]
+
+    def fits(time_, pos):
+        return time_ - start_time <= max_seconds and (max_bytes is None or pos - start_pos <= max_bytes)
+
+    ranges = []
+    start_time, start_pos = 0.0, 0
+    last_fit = None
+    index = 1
+    while index < len(keyframes):
+        time_, pos = keyframes[index]
+        if fits(time_, pos):
+            last_fit = (time_, pos)
+            index += 1
+            continue
+        if last_fit is None:
+            # 單一 GOP 就超過上限，只能在這個關鍵影格切開
+            last_fit = (time_, pos)
+            index += 1
+        # 在最後一個仍符合上限的關鍵影格切開
+        ranges.append((start_time, last_fit[0]))
+        start_time, start_pos = last_fit
+        last_fit = None
+
+    # 最後一段若超過上限，在最後一個候選點再切一次
+    tail_fits = duration - start_time <= max_seconds and (
+        max_bytes is None or file_size is None or file_size - start_pos <= max_bytes
+    )
+    if not tail_fits and last_fit:
+        ranges.append((start_time, last_fit[0]))
+        start_time = last_fit[0]
+    ranges.append((start_time, None))
+    return ranges
+
+
 class VideoProcessor:
-    def __init__(self):
+    def __init__(self, catalog=None):
         self.ffmpeg_path = self._find_ffmpeg()
         self.ffprobe_path = self._find_ffprobe()
+        # ffprobe 結果的快取，預設整個 process 共用一份
+        self.catalog = catalog or get_default_catalog()
 
     def _find_ffmpeg(self):
         """查找系統中的FFmpeg"""
@@ -30,7 +166,7 @@ class VideoProcessor:
 
     def get_video_duration(self, video_path):
         """
-        獲取影片的時長（以秒為單位）
+        獲取影片的時長（以秒為單位），結果會存在 media catalog，同一個檔案不會重複 probe
         
         :param video_path: 影片檔案路徑
         :return: 影片時長（秒），如果失敗返回None
@@ -38,43 +174,21 @@ class VideoProcessor:
         if not self.ffprobe_path or not os.path.exists(video_path):
             return None
 
-        try:
-            cmd = [
-                self.ffprobe_path,
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_format",
-                video_path
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                duration = float(data['format']['duration'])
-                logger.info(f"Video duration: {duration:.2f} seconds ({duration/3600:.2f} hours)")
-                return duration
-            else:
-                logger.error(f"FFprobe error: {result.stderr}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error getting video duration: {str(e)}")
+        info = self.catalog.info(video_path)
+        if info is None or info.duration is None:
             return None
+        duration = info.duration
+        logger.info(f"Video duration: {duration:.2f} seconds ({duration/3600:.2f} hours)")
+        return duration
 
-    def split_video_by_time(self, input_path, output_dir, segment_duration_hours=6):
+    def split_video_by_time(self, input_path, output_dir, segment_duration_hours=6, on_segment=None):
         """
         按時間切割影片
         
         :param input_path: 輸入影片路徑
         :param output_dir: 輸出目錄
         :param segment_duration_hours: 每段的時長（小時）
+        :param on_segment: 每個片段寫完時呼叫 on_segment(path)，可在切割途中開始上傳
         :return: 成功切割的片段列表
         """
         if not self.ffmpeg_path or not os.path.exists(input_path):
@@ -88,6 +202,8 @@ class VideoProcessor:
         
         # 計算每段的秒數
         segment_duration_seconds = segment_duration_hours * 3600
+        # ffmpeg 每關閉一個片段就會寫一行到這個清單
+        segment_list = os.path.join(output_dir, f".{base_name}_segments.csv")
         
         try:
             # 使用FFmpeg的segment參數來切割
@@ -95,55 +211,301 @@ class VideoProcessor:
             
             cmd = [
                 self.ffmpeg_path,
+                "-y",
                 "-i", input_path,
                 "-c", "copy",  # 使用複製模式，不重新編碼，速度更快
                 "-map", "0",
                 "-segment_time", str(segment_duration_seconds),
                 "-f", "segment",
+                "-segment_list", segment_list,
+                "-segment_list_type", "csv",
                 "-reset_timestamps", "1",
                 output_pattern
             ]
             
             logger.info(f"Starting video split: {input_path}")
-            logger.info(f"Command: {' '.join(cmd)}")
-            
-            result = subprocess.run(
+            return self._run_segmenter(cmd, segment_list, output_dir, base_name, on_segment)
+
+        except Exception as e:
+            logger.error(f"Error splitting video: {str(e)}")
+            return []
+
+    def remux_to_parts(self, input_path, output_dir, max_part_hours=10, on_segment=None):
+        """
+        一次 ffmpeg 完成轉檔與切割：.ts 直接輸出成可上傳的 MP4 片段
+        切點依來源長度平均分配，避免最後一段太短
+
+        fragmented MP4 錄影不超過長度上限時直接改名，不需要再寫一次
+
+        :param input_path: 錄影的 .ts 或 fragmented MP4 (.fmp4) 檔
+        :param output_dir: 輸出目錄
+        :param max_part_hours: 每段的最長時長（小時）
+        :param on_segment: 每個片段寫完時呼叫 on_segment(path)
+        :return: 輸出的 MP4 路徑列表，失敗時回傳空列表
+        """
+        if not self.ffmpeg_path or not os.path.exists(input_path):
+            return []
+
+        os.makedirs(output_dir, exist_ok=True)
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        if input_path.endswith(".fmp4"):
+            # 錄影中斷時結尾可能有寫到一半的片段
+            truncate_incomplete_fragments(input_path)
+        max_seconds = max_part_hours * 3600
+        duration = self.get_video_duration(input_path)
+        parts = max(1, math.ceil(duration / max_seconds)) if duration else 1
+        # MP4 需要 ASC 格式的 AAC，ts 內是 ADTS
+        copy_args = ["-c", "copy", "-map", "0", "-bsf:a", "aac_adtstoasc"]
+
+        try:
+            if parts == 1 and input_path.endswith(".fmp4"):
+                output_path = os.path.join(output_dir, f"{base_name}.mp4")
+                os.replace(input_path, output_path)
+                logger.info(f"Fragmented MP4 recording is ready for upload: {output_path}")
+                if on_segment:
+                    on_segment(output_path)
+                return [output_path]
+
+            if parts == 1:
+                output_path = os.path.join(output_dir, f"{base_name}.mp4")
+                cmd = [self.ffmpeg_path, "-y", "-i", input_path, *copy_args, output_path]
+                logger.info(f"Remuxing {input_path} to {output_path}")
+                with span("ffmpeg.remux", input_bytes=os.path.getsize(input_path)) as s:
+                    process = subprocess.run(
+                        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=7200
+                    )
+                    s.set_attribute("exit_code", process.returncode)
+                if process.returncode != 0:
+                    logger.error(f"FFmpeg error: {process.stderr}")
+                    return []
+                if on_segment:
+                    on_segment(output_path)
+                return [output_path]
+
+            segment_seconds = math.ceil(duration / parts)
+            segment_list = os.path.join(output_dir, f".{base_name}_segments.csv")
+            cmd = [
+                self.ffmpeg_path,
+                "-y",
+                "-i", input_path,
+                *copy_args,
+                "-f", "segment",
+                "-segment_format", "mp4",
+                "-segment_time", str(segment_seconds),
+                "-segment_list", segment_list,
+                "-segment_list_type", "csv",
+                "-reset_timestamps", "1",
+                os.path.join(output_dir, f"{base_name}_part%03d.mp4"),
+            ]
+            logger.info(
+                f"Remuxing {input_path} into {parts} parts of ~{segment_seconds / 3600:.2f} hours"
+            )
+            return self._run_segmenter(cmd, segment_list, output_dir, base_name, on_segment)
+
+        except subprocess.TimeoutExpired:
+            logger.error("Remuxing timed out")
+            return []
+        except Exception as e:
+            logger.error(f"Error remuxing video: {str(e)}")
+            return []
+
+    def _run_segmenter(self, cmd, segment_list, output_dir, base_name, on_segment=None):
+        """
+        執行 ffmpeg segment 指令，切割途中每完成一段就呼叫 on_segment
+
+        :return: 完成的片段列表，失敗時回傳空列表
+        """
+        logger.info(f"Command: {' '.join(cmd)}")
+
+        with span("ffmpeg.segment", base_name=base_name) as s:
+            process = subprocess.Popen(
                 cmd,
-                stdout=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
                 stderr=subprocess.PIPE,
                 text=True,
-                timeout=7200  # 2小時超時
             )
-            
-            if result.returncode == 0:
-                # 找到所有生成的片段檔案
-                segments = []
-                part_num = 0
-                while True:
-                    segment_path = os.path.join(output_dir, f"{base_name}_part{part_num:03d}.mp4")
-                    if os.path.exists(segment_path):
-                        segments.append(segment_path)
-                        part_num += 1
-                    else:
-                        break
-                
-                logger.info(f"Successfully split video into {len(segments)} segments")
-                
-                # 刪除原始檔案（可選）
-                # os.remove(input_path)
-                # logger.info(f"Removed original file: {input_path}")
-                
-                return segments
-            else:
-                logger.error(f"FFmpeg error: {result.stderr}")
+            stop = threading.Event()
+            result = {}
+            # 片段的回呼（例如排入上傳）沿用目前的 trace
+            watcher = threading.Thread(
+                target=current_context().run,
+                args=(lambda: result.update(
+                    segments=watch_segment_list(segment_list, output_dir, on_segment or (lambda path: None), stop)
+                ),),
+                name=f"split-{base_name}",
+                daemon=True,
+            )
+            watcher.start()
+            try:
+                _, stderr = process.communicate(timeout=7200)  # 2小時超時
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                logger.error("Video splitting timed out")
+                s.set_attribute("timed_out", True)
                 return []
-                
-        except subprocess.TimeoutExpired:
-            logger.error("Video splitting timed out")
+            finally:
+                stop.set()
+                watcher.join()
+            s.set_attributes(exit_code=process.returncode, parts=len(result.get("segments", [])))
+
+        if process.returncode == 0:
+            # 片段可能已在切割途中被上傳並刪除，以 segment list 為準
+            segments = result.get("segments", [])
+            logger.info(f"Successfully split video into {len(segments)} segments")
+            return segments
+        else:
+            logger.error(f"FFmpeg error: {stderr}")
             return []
+
+    def build_keyframe_index(self, video_path):
+        """
+        從 ffprobe 的 packet 資料建立影片軌的關鍵影格索引，結果存在 media catalog
+
+        :return: [(時間, 檔案位置)]，失敗時回傳空列表
+        """
+        if not self.ffprobe_path or not os.path.exists(video_path):
+            return []
+        return self.catalog.keyframes(video_path, self._scan_keyframes)
+
+    def _scan_keyframes(self, video_path):
+        cmd = [
+            self.ffprobe_path,
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,pos,flags",
+            "-of", "csv=p=0",
+            video_path,
+        ]
+        keyframes = []
+        process = None
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            # 長影片的 packet 數量很多，逐行解析不把整份輸出讀進記憶體
+            for line in process.stdout:
+                fields = line.strip().split(",")
+                if len(fields) < 3 or "K" not in fields[2]:
+                    continue
+                try:
+                    keyframes.append((float(fields[0]), int(fields[1])))
+                except ValueError:
+                    continue  # pts 或 pos 為 N/A
+            process.wait(timeout=60)
         except Exception as e:
-            logger.error(f"Error splitting video: {str(e)}")
+            logger.error(f"Error building keyframe index: {str(e)}")
+            return []
+        finally:
+            # 解析途中出錯或逾時時不留下還在輸出的 ffprobe
+            if process:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+
+        if process.returncode != 0:
+            logger.error(f"FFprobe exited with code {process.returncode} while indexing {video_path}")
+            return []
+        keyframes.sort()
+        logger.info(f"Indexed {len(keyframes)} keyframes in {video_path}")
+        return keyframes
+
+    def split_video_parallel(
+        self,
+        input_path,
+        output_dir,
+        max_part_hours=10,
+        max_part_bytes=DEFAULT_MAX_PART_BYTES,
+        workers=None,
+        on_segment=None,
+    ):
+        """
+        依關鍵影格索引規劃切點，並以多個 ffmpeg 平行擷取各段
+
+        :param input_path: 輸入影片路徑
+        :param output_dir: 輸出目錄
+        :param max_part_hours: 每段最長時長（小時）
+        :param max_part_bytes: 每段最大 bytes，None 表示只依時長切割
+        :param workers: 同時執行的 ffmpeg 數，預設依 CPU 數量
+        :param on_segment: 每段擷取完成時依片段順序呼叫 on_segment(path)，可在切割途中開始上傳；
+            有片段失敗時之後的片段不再回呼，已回呼的片段交由呼叫端處理
+        :return: 依順序排列的片段列表，失敗時回傳空列表
+        """
+        if not self.ffmpeg_path or not os.path.exists(input_path):
+            return []
+
+        duration = self.get_video_duration(input_path)
+        keyframes = self.build_keyframe_index(input_path)
+        if not duration or not keyframes:
+            logger.warning("Keyframe index unavailable, falling back to sequential split")
+            return self.split_video_by_time(input_path, output_dir, max_part_hours, on_segment)
+
+        # 關鍵影格的 pts 是絕對時間，-ss 則從容器的 start_time 起算（.ts 錄影通常不是 0）
+        info = self.catalog.info(input_path)
+        offset = info.start_time if info and info.start_time else 0.0
+        if offset:
+            keyframes = [(time_ - offset, pos) for time_, pos in keyframes]
+
+        ranges = plan_cut_points(
+            keyframes,
+            duration,
+            max_part_hours * 3600,
+            max_part_bytes,
+            os.path.getsize(input_path),
+        )
+        os.makedirs(output_dir, exist_ok=True)
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        outputs = [
+            os.path.join(output_dir, f"{base_name}_part{index:03d}.mp4") for index in range(len(ranges))
+        ]
+        workers = workers or min(len(ranges), max(1, (os.cpu_count() or 2) // 2))
+        logger.info(f"Splitting {input_path} into {len(ranges)} parts with {workers} workers")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"split-{base_name}") as pool:
+            futures = [
+                pool.submit(self._extract_range, input_path, start, end, output)
+                for (start, end), output in zip(ranges, outputs)
+            ]
+            # 依片段順序等待，讓上傳佇列的順序與片段順序一致，同時與後面片段的擷取重疊
+            handed_over = 0
+            for output, future in zip(outputs, futures):
+                if not future.result():
+                    break
+                if on_segment:
+                    try:
+                        on_segment(output)
+                    except Exception as e:
+                        logger.error(f"Error handling finished segment {output}: {e}")
+                handed_over += 1
+            for future in futures[handed_over:]:
+                future.cancel()
+
+        if handed_over < len(outputs):
+            logger.error(f"Failed to extract part {handed_over} of {input_path}")
+            # 已回呼的片段可能正在上傳，只刪除其餘的輸出
+            for output in outputs[handed_over:]:
+                if os.path.exists(output):
+                    os.remove(output)
             return []
+        logger.info(f"Successfully split video into {len(outputs)} segments")
+        return outputs
+
+    def _extract_range(self, input_path, start, end, output_path):
+        # -ss 放在 -i 前面直接 seek 到關鍵影格，不需要從頭讀取
+        cmd = [self.ffmpeg_path, "-y", "-ss", f"{start:.6f}", "-i", input_path]
+        if end is not None:
+            cmd += ["-t", f"{end - start:.6f}"]
+        cmd += ["-c", "copy", "-map", "0", "-avoid_negative_ts", "make_zero", output_path]
+        try:
+            process = subprocess.run(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=7200
+            )
+        except subprocess.TimeoutExpired:
+            logger.error(f"Extracting {output_path} timed out")
+            return False
+        if process.returncode != 0:
+            logger.error(f"FFmpeg error: {process.stderr}")
+            return False
+        return True
 
     def is_video_long(self, video_path, threshold_hours=12):
         """